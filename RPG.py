@@ -1,15 +1,19 @@
 import asyncio
 import inspect
+import logging
+import os
 import random
 import re
+import time
+from datetime import datetime
 from itertools import cycle
 from operator import itemgetter
-from typing import Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import discord
+from discord.ext.commands import CheckFailure
 from mongoengine import (
     Document,
-    connect,
     IntField,
     StringField,
     EmbeddedDocument,
@@ -18,20 +22,81 @@ from mongoengine import (
     ListField,
     FloatField,
     URLField,
+    BooleanField,
+    DateTimeField,
 )
 from redbot.core import checks
 from redbot.core.bot import Red
 from redbot.core.commands import commands, Context
+from redbot.core.data_manager import cog_data_path
 from redbot.core.utils.menus import menu, DEFAULT_CONTROLS, close_menu
 from redbot.core.utils.predicates import MessagePredicate
 
+from .regen_scheduler import RegenScheduler
+from .outbound import DISCORD_HTTP_LOGGER, OutboundStats, RateLimitHandler
 from .register_char_session import RegisterSession
+from .shop import ShopCatalog
+from .snapshot import export_characters, import_characters
+from .supervisor import TaskSupervisor, format_stats
+from .transactions import (
+    Change,
+    NotEnoughGold,
+    NotEnoughItems,
+    TransactionFailed,
+    apply_change,
+    execute,
+    update_character,
+)
+from .activity import ActivityAccumulator
+from .combat import Combatant, CombatRules, resolve_duel
 from .config import config
+from .coordination import (
+    EventBus,
+    LeaderElector,
+    Lease,
+    LeaseLock,
+    LeaseTimeout,
+    get_process_id,
+)
+from .effects import (
+    DISEASE,
+    EQUIPMENT,
+    POTION,
+    EffectScheduler,
+    get_effective_stats,
+    is_active,
+    make_effect,
+    resists_disease,
+)
+from .database import Database
+from .crafting import RecipeIndex, get_craft_change, get_temper
+from .experience import ExperienceEngine, Progress
+from .guild_scope import get_char_key, remove_guild_characters
+from .invalidation import ChangeWatcher, DocumentCache, ServerTimestamps
+from .item_index import ItemNameIndex
+from .leaderboard import Leaderboards
+from .loot import LootTableNotFound, LootTables, get_loot_changes
+from .market import BUY, SELL, Market
+from .migrations import migrator
+from .item_stack import ItemStack, ItemStackField
 
 Cog = getattr(commands, "Cog", object)
 
+log = logging.getLogger("red.rpg")
+
+# Character fields changed by equipping and using items, written with a
+# compare-and-swap on their old values.
+EQUIP_FIELDS = (
+    "inventory.items",
+    "equipment",
+    "attributes.armor_rating",
+    "attributes.effects",
+    "attributes.needs_regen",
+)
+USE_FIELDS = ("inventory.items", "attributes.effects", "attributes.needs_regen")
+
 
-class Item(Document):
+class Item(ServerTimestamps, Document):
     """Item class
 
     Attributes:
@@ -40,6 +105,11 @@ class Item(Document):
         desc (str): Item description.
         price (int): Item price.
         _rarity (str): Item rarity.
+        modifiers (dict): Values added to the attributes of the character
+            while the item is equipped.
+        effect (dict): Effect of using the item with `name`, `kind`,
+            `modifiers` and `duration` in seconds.
+        updated_at (datetime): Time of the last change by the server clock.
 
     """
 
@@ -54,6 +124,9 @@ class Item(Document):
     desc = StringField()
     price = IntField(min_value=0)
     rarity = StringField(choices=rarity_rates.keys())
+    modifiers = DictField(FloatField())
+    effect = DictField()
+    updated_at = DateTimeField()
 
     def __init__(
         self,
@@ -104,7 +177,7 @@ class Item(Document):
             item_id = 0
         return item_id
 
-    meta = {"allow_inheritance": True}
+    meta = {"allow_inheritance": True, "indexes": ["updated_at"]}
 
 
 class Armor(Item):
@@ -288,14 +361,14 @@ class Weapon(Item):
 class Inventory(EmbeddedDocument):
     """Inventory class
 
-    All items are dictionaries that contain information about the item ID,
-    maker of the item and its tempering. These dictionaries are stored in
-    lists, which are the values of the keys of the `items` dictionary. The keys
-    of this dictionary are categories of inventory items.
+    All items are stacks that contain information about the item ID,
+    maker of the item and its tempering. These stacks are stored in lists,
+    which are the values of the keys of the `items` dictionary. The keys of
+    this dictionary are categories of inventory items.
     """
 
     items = DictField(
-        ListField(DictField()), default={"Weapon": [], "Armor": [], "Item": []}
+        ListField(ItemStackField()), default={"Weapon": [], "Armor": [], "Item": []}
     )
 
     @staticmethod
@@ -313,9 +386,9 @@ class Inventory(EmbeddedDocument):
         """
         return re.sub(r"Item.", "", item["_cls"])
 
-    def get_item(self, item: Item, maker: str = None, temper: int = None) -> dict:
-        """Returns a dictionary of an item from the inventory, if it exists
-        in it, otherwise it raises the exception ItemNotFoundInInventory.
+    def get_item(self, item: Item, maker: str = None, temper: int = None) -> ItemStack:
+        """Returns a stack of an item from the inventory, if it exists in it,
+        otherwise it raises the exception ItemNotFoundInInventory.
 
         Args:
             item (Item): The item to get from inventory.
@@ -324,7 +397,7 @@ class Inventory(EmbeddedDocument):
             temper (:obj:`int`, optional): Item tempering. Defaults to None.
 
         Returns:
-            dict: Inventory item dictionary.
+            ItemStack: Inventory item stack.
 
         Raises:
             ItemNotFoundInInventory: If the item is not found in inventory.
@@ -335,13 +408,11 @@ class Inventory(EmbeddedDocument):
             (
                 _item
                 for _item in self.items[category]
-                if _item["item_id"] == item.item_id
-                and _item["maker"] == maker
-                and _item["temper"] == temper
+                if _item.matches(item.item_id, maker, temper)
             ),
-            False,
+            None,
         )
-        if not bool(found_item):
+        if found_item is None:
             raise ItemNotFoundInInventory
         return found_item
 
@@ -361,22 +432,18 @@ class Inventory(EmbeddedDocument):
             temper (:obj:`int`, optional): Item tempering. Defaults to None.
         """
         try:
-            _item = self.get_item(item)
-            _item["count"] += count
+            _item = self.get_item(item, maker, temper)
+            _item.count += count
+            self._mark_as_changed("items")
         except ItemNotFoundInInventory:
-            category = self.get_item_category(item)
-            new_item = {
-                "item_id": item.id,
-                "count": count,
-                "maker": maker,
-                "temper": temper,
-            }
-            self.items[category].append(new_item)
-            self.items[category][:] = [
-                item for item in self.items[category] if item.get("count") > 0
-            ]
+            items = self.items[self.get_item_category(item)]
+            if any(_item.count < 1 for _item in items):
+                items[:] = [_item for _item in items if _item.count > 0]
+            items.append(ItemStack(item.id, count, maker, temper))
 
-    def remove_item(self, item: Item, count: int):
+    def remove_item(
+        self, item: Item, count: int, maker: str = None, temper: int = None
+    ):
         """Removes item from inventory.
         
         The method reduces the number of items. If after this operation the
@@ -390,17 +457,21 @@ class Inventory(EmbeddedDocument):
         Args:
             item (Item): The item to remove from inventory.
             count (int): The number of items to remove.
+            maker (:obj:`str`, optional): Name of the maker of the item. Defaults
+                to None.
+            temper (:obj:`int`, optional): Item tempering. Defaults to None.
         """
-        _item = self.get_item(item)
+        _item = self.get_item(item, maker, temper)
         category = self.get_item_category(item)
         if _item:
-            _item["count"] -= count
-            if _item["count"] < 1:
+            _item.count -= count
+            self._mark_as_changed("items")
+            if _item.count < 1:
                 self.items[category][:] = [
-                    item for item in self.items[category] if item.get("count") > 0
+                    item for item in self.items[category] if item.count > 0
                 ]
                 if len(self.items[category]) < 1:
-                    blank_item = {"item_id": "", "count": 0}
+                    blank_item = ItemStack("", 0)
                     self.items[category].append(blank_item)
 
     def is_inventory_empty(self) -> bool:
@@ -413,13 +484,27 @@ class Inventory(EmbeddedDocument):
         inv = self.items
         for category, items in inv.items():
             try:
-                if items[0]["count"] > 0:
+                if items[0].count > 0:
                     return False
             except IndexError:
                 pass
         else:
             return True
 
+    def get_counts(self) -> Dict[int, int]:
+        """Returns the number of plain items, without a maker and tempering.
+
+        Returns:
+            Dict[int, int]: The number of items by item ID.
+
+        """
+        counts = {}
+        for items in self.items.values():
+            for item in items:
+                if item.count > 0 and item.maker is None and item.temper is None:
+                    counts[item.item_id] = counts.get(item.item_id, 0) + item.count
+        return counts
+
 
 class Attributes(EmbeddedDocument):
     """Character Attribute Class
@@ -433,9 +518,15 @@ class Attributes(EmbeddedDocument):
         skills (dict): The level of skills of the character.
         armor_rating (int): Total character armor.
         unarmed_damage (int): Unarmed character damage.
+        needs_regen (bool): True if any of Health, Stamina and Magicka is not
+            full, otherwise the field is not stored at all.
+        effects (list): Potions, buffs, debuffs, diseases and equipment
+            effects. See `effects.make_effect`.
 
     """
 
+    pools = ("health", "stamina", "magicka")
+
     health = FloatField(default=10)
     stamina = FloatField(default=10)
     magicka = FloatField(default=10)
@@ -444,6 +535,8 @@ class Attributes(EmbeddedDocument):
     skills = DictField(FloatField(min_value=0, max_value=100))
     armor_rating = IntField(default=0)
     unarmed_damage = IntField()
+    needs_regen = BooleanField()
+    effects = ListField(DictField())
 
     def __init__(
         self,
@@ -468,6 +561,32 @@ class Attributes(EmbeddedDocument):
         self.skills = skills
         self.unarmed_damage = unarmed_damage
 
+    def get_effective(self, now: float = None) -> Tuple[dict, dict, dict]:
+        """Returns the attributes with all active effects applied.
+
+        The result is cached until the set of effects changes or the first
+        active effect expires.
+
+        Args:
+            now (:obj:`float`, optional): Current UNIX time. Defaults to the
+                current time.
+
+        Returns:
+            Tuple[dict, dict, dict]: Effective main attributes, resists and
+            skills.
+
+        """
+        if now is None:
+            now = time.time()
+        key = tuple(effect["id"] for effect in self.effects)
+        cache = getattr(self, "_effective", None)
+        if cache is None or cache[0] != key or cache[1] <= now:
+            main, resists, skills, valid_until = get_effective_stats(
+                self.main, self.resists, self.skills, self.effects, now
+            )
+            cache = self._effective = (key, valid_until, (main, resists, skills))
+        return cache[2]
+
     def get_total_value(self, attribute: str) -> int:
         """Returns the maximum attribute value, including all bonuses.
 
@@ -478,7 +597,62 @@ class Attributes(EmbeddedDocument):
             int: Maximum attribute value.
 
         """
-        return self.main[f"{attribute}_max"] + self.main[f"{attribute}_buff"]
+        main = self.get_effective()[0]
+        return main[f"{attribute}_max"] + main[f"{attribute}_buff"]
+
+    def add_effect(self, effect: dict, rng: random.Random = random) -> bool:
+        """Adds the effect, replacing the effect with the same ID.
+
+        Expired effects are removed at the same time. Diseases are rolled
+        against the effective `disease_resist`.
+
+        Args:
+            effect (dict): The effect.
+            rng (:obj:`random.Random`, optional): Random number generator.
+
+        Returns:
+            bool: False if the disease is resisted, otherwise True.
+
+        """
+        if effect.get("kind") == DISEASE and resists_disease(
+            self.get_effective()[1], rng
+        ):
+            return False
+        now = time.time()
+        self.effects = [
+            _effect
+            for _effect in self.effects
+            if _effect["id"] != effect["id"] and is_active(_effect, now)
+        ] + [effect]
+        self._effective = None
+        self.update_needs_regen()
+        return True
+
+    def remove_effects(self, effect_id: str = None, kind: str = None) -> int:
+        """Removes effects by ID or by kind.
+
+        Args:
+            effect_id (:obj:`str`, optional): Effect ID.
+            kind (:obj:`str`, optional): Effect kind.
+
+        Returns:
+            int: The number of removed effects.
+
+        """
+        effects = [
+            effect
+            for effect in self.effects
+            if not (
+                (effect_id is not None and effect["id"] == effect_id)
+                or (kind is not None and effect.get("kind") == kind)
+            )
+        ]
+        removed = len(self.effects) - len(effects)
+        if removed:
+            self.effects = effects
+            self._effective = None
+            self.update_needs_regen()
+        return removed
 
     def mod_value(self, attribute: str, damage: int):
         """Modifies the attribute value.
@@ -493,6 +667,13 @@ class Attributes(EmbeddedDocument):
         Raises:
             AttributeNotFound: If the attribute is not found.
         """
+        self._mod_value(attribute, damage)
+        if attribute in self.pools:
+            self.update_needs_regen()
+
+    def _mod_value(self, attribute: str, damage: int):
+        if attribute not in self.pools:
+            self._effective = None
         if hasattr(self, attribute):
             attr = getattr(self, attribute)
             try:
@@ -526,35 +707,65 @@ class Attributes(EmbeddedDocument):
         else:
             raise AttributeNotFound
 
+    def regen(self, timer: float):
+        """Regenerates Health, Stamina and Magicka.
+
+        Args:
+            timer (float): The number of seconds since the last regeneration.
+        """
+        main = self.get_effective()[0]
+        for attribute in self.pools:
+            self.mod_value(
+                attribute,
+                main[f"{attribute}_max"] * main[f"{attribute}_regen"] * timer / 100,
+            )
+
     def restore_values(self):
         """ Restores Health, Stamina and Magicka """
         self.health = self.main["health_max"]
         self.stamina = self.main["stamina_max"]
         self.magicka = self.main["magicka_max"]
+        self.update_needs_regen()
+
+    def update_needs_regen(self):
+        """Updates the regeneration flag.
+
+        The flag is set only while any of the pools is below its maximum, so
+        the sparse index on it contains injured characters only.
+        """
+        try:
+            injured = any(
+                getattr(self, pool) < self.get_total_value(pool) for pool in self.pools
+            )
+        except KeyError:
+            injured = False
+        self.needs_regen = True if injured else None
 
 
 class Equipment(EmbeddedDocument):
     """Equipment Class
 
     Attributes:
-        right_hand (dict): The right hand of the character. It can take any
+        right_hand (ItemStack): The right hand of the character. It can take any
             type of weapon. If the weapon uses two hands, it will occupy the
             right hand.
-        left_hand (dict): The left hand of the character. A second one-handed
-            weapon or shield can be taken in the left hand.
-        helmet (dict): Head slot character. For hats.
-        cuirass (dict): Body slot character.
-        gauntlets (dict): Hands slot character.
-        boots (dict): Foot slot character.
+        left_hand (ItemStack): The left hand of the character. A second
+            one-handed weapon or shield can be taken in the left hand.
+        helmet (ItemStack): Head slot character. For hats.
+        cuirass (ItemStack): Body slot character.
+        gauntlets (ItemStack): Hands slot character.
+        boots (ItemStack): Foot slot character.
 
     """
 
-    right_hand = DictField()
-    left_hand = DictField()
-    helmet = DictField()
-    cuirass = DictField()
-    gauntlets = DictField()
-    boots = DictField()
+    slots = ("right_hand", "left_hand", "helmet", "cuirass", "gauntlets", "boots")
+
+    right_hand = ItemStackField(store_count=False)
+    left_hand = ItemStackField(store_count=False)
+    helmet = ItemStackField(store_count=False)
+    cuirass = ItemStackField(store_count=False)
+    gauntlets = ItemStackField(store_count=False)
+    boots = ItemStackField(store_count=False)
 
     def __init__(
         self,
@@ -570,15 +781,15 @@ class Equipment(EmbeddedDocument):
         """Equipment constructor
 
         Args:
-            right_hand (dict): The right hand of the character. It can take any
-            type of weapon. If the weapon uses two hands, it will occupy the
+            right_hand (ItemStack): The right hand of the character. It can take
+            any type of weapon. If the weapon uses two hands, it will occupy the
             right hand.
-            left_hand (dict): The left hand of the character. A second one-handed
-                weapon or shield can be taken in the left hand.
-            helmet (dict): Head slot character. For hats.
-            cuirass (dict): Body slot character.
-            gauntlets (dict): Hands slot character.
-            boots (dict): Foot slot character.
+            left_hand (ItemStack): The left hand of the character. A second
+                one-handed weapon or shield can be taken in the left hand.
+            helmet (ItemStack): Head slot character. For hats.
+            cuirass (ItemStack): Body slot character.
+            gauntlets (ItemStack): Hands slot character.
+            boots (ItemStack): Foot slot character.
         """
         super().__init__(*args, **kwargs)
         self.right_hand = right_hand
@@ -589,7 +800,7 @@ class Equipment(EmbeddedDocument):
         self.boots = boots
 
 
-class Character(Document):
+class Character(ServerTimestamps, Document):
     """Character class
 
     Attributes:
@@ -605,9 +816,16 @@ class Character(Document):
         xp_factor (float): Multiplier experience for the character. Defaults
             to 1.0.
         avatar (str): Link to character avatar. Defaults to None.
+        gold (int): The amount of gold of the character. Defaults to 0.
+            Minimum value is 0.
         inventory (Inventory): Character inventory.
         attributes (Attributes): Character attributes.
         equipment (Equipment): Character equipment.
+        schema_version (int): Version of the document layout. Outdated
+            documents are migrated when loaded.
+        guild_id (str): Guild ID of a guild character. None for a global
+            character.
+        updated_at (datetime): Time of the last change by the server clock.
     """
 
     member_id = StringField(primary_key=True)
@@ -619,9 +837,13 @@ class Character(Document):
     xp = IntField(default=0, min_value=0)
     xp_factor = FloatField(default=1.0)
     avatar = URLField(default=None)
+    gold = IntField(default=0, min_value=0)
     inventory = EmbeddedDocumentField(Inventory)
     attributes = EmbeddedDocumentField(Attributes)
     equipment = EmbeddedDocumentField(Equipment)
+    schema_version = IntField(default=migrator.latest, min_value=0)
+    guild_id = StringField(default=None)
+    updated_at = DateTimeField()
 
     def __init__(
         self,
@@ -657,6 +879,19 @@ class Character(Document):
         self.attributes = attributes
         self.equipment = equipment
 
+    @classmethod
+    def _from_son(cls, son, *args, **kwargs):
+        """Creates a character from a raw document, migrating it first.
+
+        Migrated fields are marked as changed, so the next save stores the
+        new layout.
+        """
+        fields = migrator.migrate(son)
+        char = super()._from_son(son, *args, **kwargs)
+        for field in fields:
+            char._mark_as_changed(field)
+        return char
+
     @classmethod
     def is_member_registered(cls, member_id: str) -> bool:
         """Returns whether the member has a character.
@@ -673,6 +908,54 @@ class Character(Document):
         else:
             return False
 
+    meta = {
+        "indexes": [
+            {"fields": ["attributes.needs_regen"], "sparse": True},
+            {"fields": ["-lvl", "-xp"]},
+            {"fields": ["-xp"]},
+            {"fields": ["-gold"]},
+            {"fields": ["schema_version"]},
+            {
+                "fields": ["guild_id", "member_id"],
+                "partialFilterExpression": {"guild_id": {"$exists": True}},
+            },
+            {"fields": ["updated_at"]},
+        ]
+    }
+
+
+class MarketEvent(Document):
+    """Event of the marketplace order log.
+
+    The log is append-only. Order books are rebuilt by replaying it.
+
+    Attributes:
+        seq (int): Sequence number of the event.
+        kind (str): `place`, `fill` or `cancel`.
+        order_id (int): ID of the order. For `place` events it equals `seq`.
+            For `fill` events it is the incoming order.
+        member_id (str): Member ID of the owner of the order.
+        item_id (int): Item ID.
+        side (str): `buy` or `sell`.
+        price (int): Price of one item. For `fill` events it is the price of
+            the fill.
+        count (int): The number of items. For `fill` events it is the number
+            of filled items.
+        other_order_id (int): ID of the resting order of a `fill` event.
+        time (datetime): Time of the event.
+    """
+
+    seq = IntField(primary_key=True)
+    kind = StringField(choices=("place", "fill", "cancel"))
+    order_id = IntField()
+    member_id = StringField()
+    item_id = IntField()
+    side = StringField(choices=(BUY, SELL))
+    price = IntField(min_value=0)
+    count = IntField(min_value=1)
+    other_order_id = IntField(default=None)
+    time = DateTimeField(default=datetime.utcnow)
+
 
 class RPG(Cog):
     """RPG Cog"""
@@ -681,80 +964,407 @@ class RPG(Cog):
         self.Red = bot
         self.ItemClass = Item
         self.CharacterClass = Character
+        self.InventoryClass = Inventory
         self.AttributesClass = Attributes
         self.EquipmentClass = Equipment
         self.register_sessions = []
-        self.Red.loop.create_task(self.setup())
-        self.Red.loop.create_task(self.change_status())
+        self.outbound_stats = OutboundStats()
+        self.rate_limit_handler = RateLimitHandler(self.outbound_stats)
+        logging.getLogger(DISCORD_HTTP_LOGGER).addHandler(self.rate_limit_handler)
+        self.item_index = ItemNameIndex()
+        self.shop_catalog = ShopCatalog()
+        self._item_rebuild: Optional[asyncio.Future] = None
+        self._item_rebuild_pending = False
+        self.guild_characters = config.game.guild_characters.enabled
+        self.leaderboards = Leaderboards(
+            self.CharacterClass, scoped=self.guild_characters
+        )
+        self.experience = ExperienceEngine(
+            self.CharacterClass,
+            base_xp=config.game.leveling.base_xp,
+            exponent=config.game.leveling.exponent,
+            max_lvl=config.game.leveling.max_lvl,
+            batch_size=config.game.leveling.batch_size,
+        )
+        self.combat_rules = CombatRules(**config.game.combat)
+        self.recipes = RecipeIndex()
+        self.recipes.build(config.game.crafting.recipes)
+        self.loot_tables = LootTables(config.game.loot)
+        cluster = config.bot.cluster
+        self.process_id = get_process_id()
+        self.event_bus = EventBus(
+            self.Red, self.process_id, cluster.events_size, cluster.enabled
+        )
+        self.leader = LeaderElector(
+            self.Red,
+            Lease("leader", self.process_id, cluster.lease_ttl),
+            self.start_leader_jobs,
+            self.stop_leader_jobs,
+        )
+        market_lease = (
+            Lease("market", self.process_id, cluster.lease_ttl)
+            if cluster.enabled
+            else None
+        )
+        self.market = Market(
+            MarketEvent,
+            self.CharacterClass,
+            self.InventoryClass,
+            self.get_item_by_id,
+            lambda gold: self.Red.loop.call_soon_threadsafe(self.on_gold_changed, gold),
+            LeaseLock(market_lease, cluster.lock_timeout),
+        )
+        self.activity = ActivityAccumulator(
+            self.Red,
+            self.experience,
+            self.on_xp_granted,
+            xp_per_message=config.game.activity.xp_per_message,
+            cooldown=config.game.activity.cooldown,
+            window=config.game.activity.window,
+            max_per_window=config.game.activity.max_per_window,
+            flush_interval=config.game.activity.flush_interval,
+        )
+        self.effect_scheduler = EffectScheduler(self.Red, self.CharacterClass)
+        self.regen_scheduler = RegenScheduler(
+            self.Red,
+            self.CharacterClass,
+            interval=config.game.regen.interval,
+            buckets=config.game.regen.buckets,
+            batch_size=config.game.regen.batch_size,
+            min_batch_size=config.game.regen.min_batch_size,
+            max_batch_size=config.game.regen.max_batch_size,
+            max_batch_time=config.game.regen.max_batch_time,
+        )
+        statuses = config.bot.statuses[:]
+        random.shuffle(statuses)
+        self._statuses = cycle(statuses)
+        self.supervisor = TaskSupervisor(
+            self.Red,
+            base_delay=config.bot.supervisor.base_delay,
+            max_delay=config.bot.supervisor.max_delay,
+            jitter=config.bot.supervisor.jitter,
+        )
+        self.database = Database(self.Red, config.database)
+        _config = config.database.cache
+        self.item_cache = DocumentCache(_config.items)
+        self.char_cache = DocumentCache(_config.chars)
+        self.item_watcher = ChangeWatcher(
+            self.Red,
+            "item",
+            self.ItemClass._get_collection_name(),
+            self.on_items_changed,
+            self.on_items_reset,
+            max_delay=_config.max_delay,
+            poll_interval=_config.poll_interval,
+            poll_overlap=_config.poll_overlap,
+        )
+        self.char_watcher = ChangeWatcher(
+            self.Red,
+            "character",
+            self.CharacterClass._get_collection_name(),
+            lambda member_ids: self.char_cache.evict(*member_ids),
+            self.char_cache.clear,
+            max_delay=_config.max_delay,
+            poll_interval=_config.poll_interval,
+            poll_overlap=_config.poll_overlap,
+        )
+        self.ready = asyncio.Event()
+        self.subscribe_events()
+        self.supervisor.add("setup", self.setup)
+
+    def cog_unload(self):
+        """Stops the background jobs of the cog."""
+        self.supervisor.cancel_all()
+        self.event_bus.stop()
+        logging.getLogger(DISCORD_HTTP_LOGGER).removeHandler(self.rate_limit_handler)
+        self.item_watcher.stop()
+        self.char_watcher.stop()
+        if self.database.ready.is_set():
+            self.database.close_after(self.shutdown)
+
+    async def shutdown(self):
+        """Writes the buffered experience and resigns the leadership.
+
+        Run on unload before the connection is closed.
+        """
+        try:
+            await self.activity.flush()
+        finally:
+            await self.leader.resign()
+
+    async def cog_before_invoke(self, ctx: Context):
+        """Waits until the database connection is open and caches are warm."""
+        try:
+            await asyncio.wait_for(self.ready.wait(), config.database.ready_timeout)
+        except asyncio.TimeoutError:
+            await ctx.send(
+                f"{ctx.author.mention}, база данных недоступна. Попробуйте позже."
+            )
+            raise CheckFailure("Database is not ready")
+
+    __unload = cog_unload
 
     async def setup(self):
+        """Connects to the database and warms the caches in the background.
+
+        The connection does not depend on Discord, so only the status
+        rotation waits until the bot is ready.
+        """
+        await self.database.start()
+        await self.Red.loop.run_in_executor(None, self.warm_caches)
+        self.ready.set()
+        self.start_jobs()
+
         await self.Red.wait_until_ready()
+        _config = config.bot
+        self.supervisor.add_periodic(
+            "status",
+            self.change_status,
+            lambda: random.randint(
+                _config.status_change_min, _config.status_change_max
+            ),
+        )
+
+    def warm_caches(self):
+        """Builds the in-memory indexes."""
+        self.build_item_indexes()
+        self.leaderboards.build()
+        self.market.rebuild()
+        self.regen_scheduler.flag_injured()
+
+    def build_item_indexes(self):
+        """Builds the item indexes from the item catalog.
+
+        The catalog is read once for all of them.
+        """
+        items = list(self.ItemClass.objects.only("item_id", "name", "price", "rarity"))
+        self.item_index.build(items)
+        self.shop_catalog.build(items)
+        self.loot_tables.build(items)
+
+    def on_items_changed(self, item_ids: list):
+        """Drops the changed items from the cache and rebuilds the indexes.
 
-        connect(
-            db=config.database.db,
-            host=config.database.host,
-            port=config.database.port,
-            username=config.database.user,
-            password=config.database.password,
+        Args:
+            item_ids (list): IDs of the changed items.
+        """
+        self.item_cache.evict(*item_ids)
+        self.rebuild_item_indexes()
+
+    def on_items_reset(self):
+        """Drops all items from the cache and rebuilds the indexes."""
+        self.item_cache.clear()
+        self.rebuild_item_indexes()
+
+    def rebuild_item_indexes(self):
+        """Rebuilds the item indexes in a worker thread without waiting.
+
+        One rebuild runs at a time. A rebuild requested meanwhile runs once
+        more after it, since the running one may have read the catalog before
+        the change and swaps its tables in over any items added since.
+        """
+        if self.is_rebuilding_item_indexes():
+            self._item_rebuild_pending = True
+            return
+        self._item_rebuild_pending = False
+        self._item_rebuild = self.Red.loop.run_in_executor(
+            None, self.build_item_indexes
         )
+        self._item_rebuild.add_done_callback(self._on_item_rebuild_done)
 
-    async def change_status(self):
-        """Changes the bot status through random time.
+    def is_rebuilding_item_indexes(self) -> bool:
+        """Returns whether the item indexes are being rebuilt.
 
-        The time can be changed in the config in the `bot` section.
-        status_change_min in minimum time. status_change_max - maximum.
+        Returns:
+            bool: A rebuild is running.
 
         """
-        await self.Red.wait_until_ready()
-        _config = config.bot
-        status = _config.statuses[:]
-        random.shuffle(status)
-        statuses = cycle(status)
-
-        while not self.Red.is_closed():
-            status = (
-                self.Red.guilds[0].me.status
-                if len(self.Red.guilds) > 0
-                else discord.Status.online
-            )
-            activity = discord.Activity(
-                name=next(statuses), type=discord.ActivityType.watching
-            )
-            await self.Red.change_presence(status=status, activity=activity)
-            await asyncio.sleep(
-                random.randint(_config.status_change_min, _config.status_change_max)
+        return self._item_rebuild is not None and not self._item_rebuild.done()
+
+    def _on_item_rebuild_done(self, future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            log.error("Failed to rebuild item indexes", exc_info=future.exception())
+        if self._item_rebuild_pending:
+            self.rebuild_item_indexes()
+
+    def start_jobs(self):
+        """Starts the database jobs under the task supervisor.
+
+        Jobs that change shared data are singletons. In a cluster they are
+        run only by the elected leader process.
+        """
+        self.supervisor.add_periodic(
+            "db_pool", self.database.check_pool, config.database.monitor_interval
+        )
+        self.supervisor.add_periodic(
+            "activity", self.activity.flush, self.activity.flush_interval
+        )
+        self.supervisor.add("item_watch", self.item_watcher.run)
+        self.supervisor.add("char_watch", self.char_watcher.run)
+        cluster = config.bot.cluster
+        if cluster.enabled:
+            self.supervisor.add("events", self.event_bus.run)
+            self.supervisor.add_periodic(
+                "leader", self.leader.tick, cluster.lease_ttl / 3
             )
+        else:
+            self.leader.is_leader = True
+            self.start_leader_jobs()
 
-    async def update_chars(self):
-        await self.Red.wait_until_ready()
-        timer = 5
-        while not self.Red.is_closed():
-            # Attributes regeneration
-            chars = self.CharacterClass.objects
-            for char in chars:
-                char.attributes.mod_value(
-                    "health",
-                    char.attributes.main["health_max"]
-                    * char.attributes.main["health_regen"]
-                    * timer
-                    / 100,
-                )
-                char.attributes.mod_value(
-                    "stamina",
-                    char.attributes.main["stamina_max"]
-                    * char.attributes.main["stamina_regen"]
-                    * timer
-                    / 100,
-                )
-                char.attributes.mod_value(
-                    "magicka",
-                    char.attributes.main["magicka_max"]
-                    * char.attributes.main["magicka_regen"]
-                    * timer
-                    / 100,
-                )
-                char.save()
-            await asyncio.sleep(timer)
+    def start_leader_jobs(self):
+        """Starts the singleton jobs."""
+        self.supervisor.add_periodic(
+            "regen", self.regen_scheduler.tick, self.regen_scheduler.slot
+        )
+        self.supervisor.add("effects", self.effect_scheduler.run)
+        self.supervisor.add(
+            "migrations",
+            lambda: migrator.run(self.Red, self.CharacterClass._get_collection()),
+        )
+
+    def stop_leader_jobs(self):
+        """Stops the singleton jobs."""
+        for name in ("regen", "effects", "migrations"):
+            self.supervisor.cancel(name)
+
+    def subscribe_events(self):
+        """Subscribes to the events of other bot processes.
+
+        Every process keeps its own leaderboards and order books, so changes
+        made by the others are applied to them.
+        """
+        bus = self.event_bus
+        bus.subscribe("scores", self._on_scores)
+        bus.subscribe("chars_removed", self._on_chars_removed)
+        bus.subscribe(
+            "leaderboards",
+            lambda data: self.Red.loop.run_in_executor(None, self.leaderboards.build),
+        )
+        bus.subscribe(
+            "market", lambda data: self.Red.loop.run_in_executor(None, self.market.sync)
+        )
+        bus.subscribe("effect", self._on_effect)
+
+    def _on_scores(self, data: dict):
+        for member_id, values in data["values"].items():
+            self.leaderboards.update(member_id, **values)
+
+    def _on_chars_removed(self, data: dict):
+        for member_id in data["member_ids"]:
+            self.leaderboards.remove(member_id)
+        self.char_cache.evict(*data["member_ids"])
+
+    def _on_effect(self, data: dict):
+        if self.leader.is_leader:
+            self.effect_scheduler.push(data["member_id"], data["effect"])
+
+    def schedule_effect(self, member_id: str, effect: dict):
+        """Schedules the removal of a timed effect by the leader process.
+
+        Args:
+            member_id (str): Member ID of the character.
+            effect (dict): The effect.
+        """
+        if self.leader.is_leader:
+            self.effect_scheduler.push(member_id, effect)
+        else:
+            self.event_bus.post("effect", member_id=member_id, effect=effect)
+
+    async def change_status(self):
+        """Changes the bot status to the next one.
+
+        The time between changes is random and can be changed in the config
+        in the `bot` section. status_change_min in minimum time.
+        status_change_max - maximum.
+
+        """
+        status = (
+            self.Red.guilds[0].me.status
+            if len(self.Red.guilds) > 0
+            else discord.Status.online
+        )
+        activity = discord.Activity(
+            name=next(self._statuses), type=discord.ActivityType.watching
+        )
+        await self.Red.change_presence(status=status, activity=activity)
+
+    @checks.is_owner()
+    @commands.command()
+    async def jobs(self, ctx):
+        """Метрики фоновых задач"""
+
+        await ctx.send(f"```\n{format_stats(self.supervisor.get_stats())}\n```")
+
+    @checks.is_owner()
+    @commands.command()
+    async def dbstats(self, ctx):
+        """Состояние пула соединений с базой данных"""
+
+        caches = "\n".join(
+            f"{name} cache: {len(cache)}/{cache.max_size}, "
+            f"hits: {cache.hits}, misses: {cache.misses}"
+            for name, cache in (("item", self.item_cache), ("char", self.char_cache))
+        )
+        await ctx.send(f"```\n{self.database.format_stats()}\n{caches}\n```")
+
+    @checks.is_owner()
+    @commands.command()
+    async def apistats(self, ctx):
+        """Метрики запросов к Discord"""
+
+        await ctx.send(f"```\n{self.outbound_stats.format()}\n```")
+
+    @checks.is_owner()
+    @commands.group()
+    async def snapshot(self, ctx):
+        """Выгрузка и загрузка персонажей"""
+
+        pass
+
+    @snapshot.command(name="export")
+    async def snapshot_export(self, ctx, filename: str = "characters.jsonl.gz"):
+        """Выгрузить всех персонажей в файл (.jsonl или .bson, можно с .gz)"""
+
+        path = str(cog_data_path(self) / os.path.basename(filename))
+        count = await self.Red.loop.run_in_executor(
+            None,
+            export_characters,
+            self.CharacterClass._get_collection(),
+            path,
+            config.database.snapshot_batch_size,
+        )
+        await ctx.send(f"Выгружено персонажей: {count}. Файл: `{path}`")
+
+    @snapshot.command(name="import")
+    async def snapshot_import(
+        self, ctx, filename: str = "characters.jsonl.gz", upsert: bool = True
+    ):
+        """Загрузить персонажей из файла
+
+        Если upsert выключен, существующие персонажи не изменяются.
+        """
+
+        path = str(cog_data_path(self) / os.path.basename(filename))
+        if not os.path.exists(path):
+            return await ctx.send(f"Файл `{path}` не найден")
+        result = await self.Red.loop.run_in_executor(
+            None,
+            lambda: import_characters(
+                self.CharacterClass._get_collection(),
+                path,
+                self.CharacterClass,
+                config.database.snapshot_batch_size,
+                upsert,
+            ),
+        )
+        self.char_cache.clear()
+        await self.Red.loop.run_in_executor(None, self.leaderboards.build)
+        self.event_bus.post("leaderboards")
+        message = f"Загружено: {result.imported}. С ошибками: {result.invalid}"
+        if result.errors:
+            errors = "\n".join(result.errors)
+            message += f"\n```\n{errors}\n```"
+        await ctx.send(message)
 
     @commands.group(invoke_without_command=True)
     async def char(self, ctx, member: Union[discord.Member, discord.User] = None):
@@ -763,9 +1373,15 @@ class RPG(Cog):
         author = ctx.author
         if member is None:
             member = author
-        member_id = str(member.id)
+        member_id = self.get_char_key(member, ctx.guild)
         try:
-            char = self.get_char_by_id(member_id)
+            char = self.get_char_by_id(
+                member_id,
+                self.database.reads.get(
+                    self.get_char_key(author, ctx.guild), member_id
+                ),
+                cached=True,
+            )
         except CharacterNotFound:
             await ctx.send(f"{author.mention}, персонаж не найден.")
             await ctx.send_help()
@@ -780,13 +1396,16 @@ class RPG(Cog):
         if char.avatar:
             embed.set_thumbnail(url=char.avatar)
         embed.set_footer(text="Информация о персонаже")
+        next_xp = self.experience.get_next_threshold(char.lvl)
 
         embed.add_field(
             name="Характеристики",
             value=f"**Раса:**           {config.humanize.races[char.race]}\n"
             f"**Пол:**            {config.humanize.genders[char.sex]}\n"
             f"**Уровень:**        {char.lvl}\n"
-            f"**Опыт:**           {char.xp}",
+            f"**Опыт:**           {char.xp}"
+            + (f"/{next_xp}" if next_xp is not None else "")
+            + f"\n**Золото:**         {char.gold}",
         )
 
         await ctx.send(embed=embed)
@@ -796,8 +1415,9 @@ class RPG(Cog):
         """Создать персонажа"""
 
         author = ctx.author
+        member_id = self.get_char_key(author, ctx.guild)
 
-        if self.CharacterClass.is_member_registered(str(author.id)):
+        if self.CharacterClass.is_member_registered(member_id):
             await ctx.send(
                 f"{author.mention}, у вас уже есть персонаж. "
                 f"Введите `{ctx.prefix}char delete`, чтобы удалить его."
@@ -806,7 +1426,12 @@ class RPG(Cog):
         session = self._get_register_session(ctx.author)
         if session is not None:
             return
-        session = RegisterSession.start(ctx)
+        if config.bot.cluster.enabled:
+            lease = self._get_register_lease(member_id)
+            if not await self.Red.loop.run_in_executor(None, lease.acquire):
+                await ctx.send(f"{author.mention}, персонаж уже создаётся.")
+                return
+        session = RegisterSession.start(ctx, self.outbound_stats)
         self.register_sessions.append(session)
 
     @char.command(name="cancel")
@@ -825,7 +1450,7 @@ class RPG(Cog):
         """Удалить персонажа"""
 
         author = ctx.author
-        member_id = str(author.id)
+        member_id = self.get_char_key(author, ctx.guild)
 
         if not self.CharacterClass.is_member_registered(member_id):
             await ctx.send(
@@ -850,6 +1475,19 @@ class RPG(Cog):
             return
         if msg.content.lower() in ["да", "д", "yes", "y"]:
             self.CharacterClass.objects(member_id=member_id).delete()
+            self.leaderboards.remove(member_id)
+            self.char_cache.evict(member_id)
+            self.event_bus.post("chars_removed", member_ids=[member_id])
+            # The escrow of the orders is lost together with the character.
+            try:
+                orders = await self.Red.loop.run_in_executor(
+                    None, lambda: self.market.cancel_all(member_id, refund=False)
+                )
+            except (TransactionFailed, LeaseTimeout):
+                log.exception(f"Failed to cancel the orders of {member_id}")
+            else:
+                if orders:
+                    self.event_bus.post("market")
             await ctx.send(
                 f"{author.mention}, ваш персонаж удален. "
                 f"Введите `{ctx.prefix}char new`, чтобы создать нового."
@@ -857,75 +1495,955 @@ class RPG(Cog):
         else:
             await ctx.send(f"{author.mention}, удаление персонажа отменено.")
 
-    @commands.command()
-    async def equip(self, ctx: Context, item_name: str):
-        """Экипировать предмет"""
+    @commands.group(invoke_without_command=True)
+    async def top(self, ctx, metric: str = "lvl"):
+        """Лучшие персонажи сервера
 
-        author = ctx.author
-        try:
-            char = self.get_char_by_id(str(author.id))
-        except CharacterNotFound:
-            await ctx.send(f"{author.mention}, персонаж не найден.")
-            return
+        *- metric:* Рейтинг. Возможные значения: lvl/xp/gold
+        """
+        await self._send_top(ctx, metric, ctx.guild)
 
-        try:
-            _item = self.get_item_by_name(item_name)
-        except ItemNotFound:
-            await ctx.send(f"{author.mention}, предмет не найден.")
-            return
+    @top.command(name="global")
+    async def top_global(self, ctx, metric: str = "lvl"):
+        """Лучшие персонажи всех серверов
 
-        try:
-            item = char.inventory.get_item(_item)
-            self.equip_item(char, item)
-            char.save()
-            await ctx.send(f"{author.mention}, предмет экипирован.")
-        except ItemNotFoundInInventory:
-            await ctx.send(f"{author.mention}, предмет не найден в инвентаре.")
-        except ItemIsNotEquippable:
-            await ctx.send(f"{author.mention}, предмет не может быть экипирован.")
+        *- metric:* Рейтинг. Возможные значения: lvl/xp/gold
+        """
+        await self._send_top(ctx, metric)
 
-    @commands.command(name="inventory", aliases=["inv"])
-    async def inventory(self, ctx, member: Union[discord.Member, discord.User] = None):
-        """Инвентарь персонажа"""
+    @top.command(name="rank")
+    async def top_rank(
+        self,
+        ctx,
+        metric: str = "lvl",
+        member: Union[discord.Member, discord.User] = None,
+    ):
+        """Место персонажа в рейтинге
+
+        *- metric:* Рейтинг. Возможные значения: lvl/xp/gold
+        """
 
         author = ctx.author
         if member is None:
             member = author
-
-        try:
-            char = self.get_char_by_id(str(member.id))
-        except CharacterNotFound:
+        if metric not in self.leaderboards.metrics:
+            await ctx.send(f"{author.mention}, рейтинг не найден.")
+            return
+        member_id = self.get_char_key(member, ctx.guild)
+        rank = self.leaderboards.get(metric).get_rank(member_id)
+        if rank is None:
             await ctx.send(f"{author.mention}, персонаж не найден.")
             return
+        text = f"{author.mention}, место в общем рейтинге: **{rank}**"
+        if ctx.guild is not None:
+            guild_rank = self.leaderboards.get(metric, ctx.guild).get_rank(member_id)
+            text += f", на сервере: **{guild_rank}**"
+        await ctx.send(text + ".")
 
-        if char.inventory.is_inventory_empty():
-            _embed = discord.Embed(
-                title=f"Инвентарь персонажа {char.name}",
-                colour=discord.Colour(0x8B572A),
-                description=f"Инвентарь пуст.",
-            )
-            await ctx.send(embed=_embed)
+    async def _send_top(self, ctx: Context, metric: str, guild: discord.Guild = None):
+        """Sends the best characters of the leaderboard.
+
+        Args:
+            ctx (Context): Command context.
+            metric (str): Metric name.
+            guild (:obj:`discord.Guild`, optional): Guild of the leaderboard.
+                Defaults to None, which means the global leaderboard.
+        """
+        author = ctx.author
+        if metric not in self.leaderboards.metrics:
+            await ctx.send(f"{author.mention}, рейтинг не найден.")
             return
+        top = self.leaderboards.get(metric, guild).get_top(10)
+        names = {
+            char.member_id: char.name
+            for char in self.CharacterClass.objects(
+                member_id__in=[member_id for member_id, _ in top]
+            ).only("member_id", "name")
+        }
+        lines = [
+            f"**{place}.** {names.get(member_id, member_id)} — {score[0]}"
+            for place, (member_id, score) in enumerate(top, 1)
+        ]
+        embed = discord.Embed(
+            title=f"Рейтинг: {config.humanize.leaderboard[metric]}",
+            colour=discord.Colour(0xF5A623),
+            description="\n".join(lines) or "Рейтинг пуст.",
+        )
+        embed.set_author(name=config.bot.name, icon_url=config.bot.icon_url)
+        embed.set_footer(text=guild.name if guild is not None else "Все серверы")
+        await ctx.send(embed=embed)
 
-        pages = []
-        for category, name in config.humanize.inventory.inv_categories.items():
-            items = char.inventory.items[category]
-            if not items:
-                continue
-            item_stats = []
-            for item in items:
-                count = item["count"]
-                if item and count > 0:
-                    try:
-                        _item = self.get_item_by_id(item["item_id"])
-                        stats = {**{"count": count}, **dict(_item.to_mongo())}
-                        item_stats.append(stats)
-                    except ItemNotFound:
-                        print(
-                            f"Item ID: {item['item_id']} not found. Member ID: {member.id}"
-                        )
-                else:
-                    break
+    async def on_message(self, message: discord.Message):
+        """Rewards chat activity with experience."""
+        if message.guild is None or message.author.bot:
+            return
+        self.activity.record(self.get_char_key(message.author, message.guild))
+
+    async def on_member_join(self, member: discord.Member):
+        self.leaderboards.invalidate_guild(member.guild)
+
+    async def on_member_remove(self, member: discord.Member):
+        self.leaderboards.invalidate_guild(member.guild)
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        """Archives or drops the guild characters, depending on the config."""
+        self.leaderboards.invalidate_guild(guild)
+        action = config.game.guild_characters.on_guild_remove
+        if not self.guild_characters or action == "keep":
+            return
+        member_ids = await self.Red.loop.run_in_executor(
+            None,
+            remove_guild_characters,
+            self.CharacterClass._get_collection(),
+            guild.id,
+            action == "archive",
+        )
+        if not member_ids:
+            return
+        self._on_chars_removed({"member_ids": member_ids})
+        self.event_bus.post("chars_removed", member_ids=member_ids)
+        # The escrow of the orders is lost together with the characters, the
+        # archive does not keep it either.
+        cancelled = False
+        for member_id in member_ids:
+            try:
+                orders = await self.Red.loop.run_in_executor(
+                    None, lambda: self.market.cancel_all(member_id, refund=False)
+                )
+            except (TransactionFailed, LeaseTimeout):
+                log.exception(f"Failed to cancel the orders of {member_id}")
+            else:
+                cancelled = cancelled or bool(orders)
+        if cancelled:
+            self.event_bus.post("market")
+
+    @checks.admin_or_permissions()
+    @commands.group(invoke_without_command=True)
+    async def xp(self, ctx, member: Union[discord.Member, discord.User], amount: int):
+        """Выдать опыт персонажу"""
+        await self._grant_xp(ctx, {self.get_char_key(member, ctx.guild): amount})
+
+    @checks.admin_or_permissions()
+    @xp.command(name="role")
+    async def xp_role(self, ctx, role: discord.Role, amount: int):
+        """Выдать опыт всем персонажам с ролью"""
+        await self._grant_xp(
+            ctx,
+            {self.get_char_key(member, ctx.guild): amount for member in role.members},
+        )
+
+    async def _grant_xp(self, ctx: Context, grants: dict):
+        """Grants experience and reports the result.
+
+        Args:
+            ctx (Context): Command context.
+            grants (dict): Experience amounts by member ID.
+        """
+        progress = await self.Red.loop.run_in_executor(
+            None, self.experience.grant, grants
+        )
+        self.on_xp_granted(progress)
+        level_ups = sum(1 for char in progress if char.lvl > char.old_lvl)
+        await ctx.send(
+            f"{ctx.author.mention}, опыт выдан персонажам: {len(progress)}. "
+            f"Новый уровень получили: {level_ups}."
+        )
+
+    def on_xp_granted(self, progress: List[Progress]):
+        """Updates leaderboards after an experience grant.
+
+        Args:
+            progress (List[Progress]): Result of the grant.
+        """
+        for char in progress:
+            self.leaderboards.update(char.member_id, lvl=char.lvl, xp=char.xp)
+        self.event_bus.post(
+            "scores",
+            values={
+                char.member_id: {"lvl": char.lvl, "xp": char.xp} for char in progress
+            },
+        )
+
+    @checks.admin_or_permissions()
+    @commands.group(invoke_without_command=True)
+    async def loot(
+        self,
+        ctx,
+        table: str,
+        member: Union[discord.Member, discord.User],
+        seed: int = None,
+    ):
+        """Выдать добычу персонажу
+
+        *- table:* Таблица добычи
+        *- seed:* Зерно генератора случайных чисел
+        """
+        await self._give_loot(ctx, table, [self.get_char_key(member, ctx.guild)], seed)
+
+    @checks.admin_or_permissions()
+    @loot.command(name="role")
+    async def loot_role(self, ctx, table: str, role: discord.Role, seed: int = None):
+        """Выдать добычу всем персонажам с ролью"""
+        await self._give_loot(
+            ctx,
+            table,
+            sorted(self.get_char_key(member, ctx.guild) for member in role.members),
+            seed,
+        )
+
+    async def _give_loot(
+        self, ctx: Context, table: str, member_ids: List[str], seed: int = None
+    ):
+        """Rolls the loot table for the characters and gives them the drops.
+
+        Args:
+            ctx (Context): Command context.
+            table (str): Loot table name.
+            member_ids (List[str]): Member IDs.
+            seed (:obj:`int`, optional): Seed of the random number generator.
+        """
+        author = ctx.author
+        registered = set(
+            self.CharacterClass.objects(member_id__in=member_ids).scalar("member_id")
+        )
+        member_ids = [member_id for member_id in member_ids if member_id in registered]
+        if not member_ids:
+            await ctx.send(f"{author.mention}, персонажи не найдены.")
+            return
+        if seed is None:
+            seed = random.getrandbits(32)
+        try:
+            drops = self.loot_tables.roll_many(table, member_ids, seed)
+        except LootTableNotFound:
+            await ctx.send(f"{author.mention}, таблица добычи не найдена.")
+            return
+        item_ids = list({item_id for drop in drops.values() for item_id in drop})
+        items = {
+            item.item_id: item for item in self.ItemClass.objects(item_id__in=item_ids)
+        }
+        changes = get_loot_changes(drops, items)
+        if await self._execute_changes(ctx, changes):
+            await ctx.send(
+                f"{author.mention}, добыча выдана персонажам: {len(changes)}. "
+                f"Зерно: {seed}."
+            )
+
+    @commands.command()
+    async def duel(self, ctx, member: discord.Member, seed: int = None):
+        """Вызвать персонажа на дуэль
+
+        *- member:* Противник
+        *- seed:* Зерно случайных чисел для повтора дуэли
+        """
+
+        author = ctx.author
+        if member == author:
+            await ctx.send(f"{author.mention}, нельзя вызвать на дуэль самого себя.")
+            return
+        duelists = await self._get_duelists(ctx, member)
+        if duelists is None:
+            return
+        chars = duelists[0]
+
+        await ctx.send(
+            f"{member.mention}, {chars[0].name} вызывает вас на дуэль. Вы согласны?"
+        )
+        try:
+            msg = await self.Red.wait_for(
+                "message",
+                timeout=30.0,
+                check=MessagePredicate.same_context(channel=ctx.channel, user=member),
+            )
+        except asyncio.TimeoutError:
+            await ctx.send(f"{author.mention}, дуэль отменена.")
+            return
+        if msg.content.lower() not in ["да", "д", "yes", "y"]:
+            await ctx.send(f"{author.mention}, дуэль отменена.")
+            return
+
+        # The characters may have changed during the wait, e.g. regenerated.
+        duelists = await self._get_duelists(ctx, member)
+        if duelists is None:
+            return
+        chars, fighters = duelists
+        if seed is None:
+            seed = random.getrandbits(32)
+        result = resolve_duel(*fighters, random.Random(seed), self.combat_rules)
+        for char, health, stamina in zip(chars, result.health, result.stamina):
+            self.apply_pool_changes(
+                char,
+                health=health - char.attributes.health,
+                stamina=stamina - char.attributes.stamina,
+            )
+
+        if result.winner is None:
+            text = "Дуэль закончилась ничьей."
+        else:
+            text = f"Победитель: **{chars[result.winner].name}**."
+        await ctx.send(
+            f"{text} Раундов: {result.rounds}. Зерно: `{seed}`.\n"
+            + "\n".join(
+                f"{char.name}: здоровье {health:.0f}, запас сил {stamina:.0f}"
+                for char, health, stamina in zip(chars, result.health, result.stamina)
+            )
+        )
+
+    async def _get_duelists(
+        self, ctx: Context, member: discord.Member
+    ) -> Optional[Tuple[List[Character], List[Combatant]]]:
+        """Loads the characters of a duel from the primary.
+
+        Args:
+            ctx (Context): Command context. The author is the challenger.
+            member (discord.Member): The challenged member.
+
+        Returns:
+            Optional[Tuple[List[Character], List[Combatant]]]: Characters and
+            their combat snapshots, or None if the duel is impossible. The
+            author is told why.
+
+        """
+        author = ctx.author
+        try:
+            chars = [
+                self.get_char_by_id(self.get_char_key(author, ctx.guild)),
+                self.get_char_by_id(self.get_char_key(member, ctx.guild)),
+            ]
+        except CharacterNotFound:
+            await ctx.send(f"{author.mention}, персонаж не найден.")
+            return None
+        fighters = [self.get_combatant(char) for char in chars]
+        if any(
+            fighter.health <= fighter.health_max * self.combat_rules.yield_health
+            for fighter in fighters
+        ):
+            await ctx.send(f"{author.mention}, персонаж слишком слаб для дуэли.")
+            return None
+        return chars, fighters
+
+    def apply_pool_changes(self, char: Character, **changes: float):
+        """Changes the pools of the character atomically.
+
+        The changes are added to the stored values on the server, so
+        regeneration and other changes made since the character was read are
+        kept. Pools do not drop below zero.
+
+        Args:
+            char (Character): Character object.
+            **changes (float): Changes by pool name, e.g. `health=-10`.
+        """
+        pools = {
+            f"attributes.{pool}": {
+                "$max": [0, {"$add": [f"$attributes.{pool}", change]}]
+            }
+            for pool, change in changes.items()
+            if change
+        }
+        if not pools:
+            return
+        if any(change < 0 for change in changes.values()):
+            pools["attributes.needs_regen"] = True
+        self.CharacterClass._get_collection().update_one(
+            {"_id": char.member_id}, [{"$set": {**pools, "updated_at": "$$NOW"}}]
+        )
+        self.database.reads.mark_write(char.member_id)
+
+    @commands.command()
+    async def shop(self, ctx, rarity: str = None, max_price: int = None):
+        """Товары магазина
+
+        *- rarity:* Редкость. Возможные значения: common/rare/epic/legendary
+        *- max_price:* Максимальная цена
+        """
+
+        author = ctx.author
+        if rarity is not None and rarity not in self.shop_catalog.rarities:
+            await ctx.send(f"{author.mention}, редкость не найдена.")
+            return
+        page_size = config.game.shop.page_size
+        pages = []
+        while True:
+            listings = self.shop_catalog.get_listings(
+                rarity, max_price, len(pages) * page_size, page_size
+            )
+            if not listings:
+                break
+            lines = []
+            for listing in listings:
+                rarity_name = self.shop_catalog.rarities[listing.rarity_rank]
+                lines.append(
+                    f"**{listing.name}** — {listing.price} "
+                    f"({self.ItemClass.rarity_rates[rarity_name]})"
+                )
+            embed = discord.Embed(
+                title="Магазин",
+                colour=discord.Colour(0x8B572A),
+                description="\n".join(lines),
+            )
+            embed.set_author(name=config.bot.name, icon_url=config.bot.icon_url)
+            embed.set_footer(text=f"Страница {len(pages) + 1}")
+            pages.append(embed)
+        if not pages:
+            await ctx.send(f"{author.mention}, товары не найдены.")
+        elif len(pages) > 1:
+            await menu(ctx, pages, DEFAULT_CONTROLS)
+        else:
+            await menu(ctx, pages, {"❌": close_menu})
+
+    @commands.command()
+    async def buy(self, ctx, item_name: str, count: int = 1):
+        """Купить предмет в магазине"""
+
+        author = ctx.author
+        try:
+            _item = self.get_item_by_name(item_name)
+        except ItemNotFound as e:
+            await ctx.send(self._get_item_not_found_text(author, e))
+            return
+        if count < 1 or _item.price is None:
+            await ctx.send(f"{author.mention}, предмет нельзя купить.")
+            return
+        change = Change(
+            self.get_char_key(author, ctx.guild),
+            -_item.price * count,
+            ((_item, count, None, None),),
+        )
+        if await self._execute_changes(ctx, [change]):
+            await ctx.send(f"{author.mention}, предмет(ы) куплен(ы).")
+
+    @commands.command()
+    async def sell(self, ctx, item_name: str, count: int = 1):
+        """Продать предмет в магазин"""
+
+        author = ctx.author
+        try:
+            _item = self.get_item_by_name(item_name)
+        except ItemNotFound as e:
+            await ctx.send(self._get_item_not_found_text(author, e))
+            return
+        if count < 1 or _item.price is None:
+            await ctx.send(f"{author.mention}, предмет нельзя продать.")
+            return
+        price = int(_item.price * config.game.shop.sell_factor) * count
+        change = Change(
+            self.get_char_key(author, ctx.guild), price, ((_item, -count, None, None),)
+        )
+        if await self._execute_changes(ctx, [change]):
+            await ctx.send(f"{author.mention}, предмет(ы) продан(ы) за {price}.")
+
+    @commands.command()
+    async def trade(
+        self, ctx, member: discord.Member, count: int, item_name: str, price: int
+    ):
+        """Продать предмет другому персонажу
+
+        *- member:* Покупатель
+        *- count:* Количество предметов
+        *- item_name:* Название предмета
+        *- price:* Общая цена
+        """
+
+        author = ctx.author
+        if member == author or count < 1 or price < 0:
+            await ctx.send(f"{author.mention}, недопустимая сделка.")
+            return
+        for _member in (author, member):
+            if not self.CharacterClass.is_member_registered(
+                self.get_char_key(_member, ctx.guild)
+            ):
+                await ctx.send(f"{author.mention}, персонаж не найден.")
+                return
+        try:
+            _item = self.get_item_by_name(item_name)
+        except ItemNotFound as e:
+            await ctx.send(self._get_item_not_found_text(author, e))
+            return
+
+        await ctx.send(
+            f"{member.mention}, {author.display_name} предлагает вам {_item.name} "
+            f"({count}) за {price}. Вы согласны?"
+        )
+        try:
+            msg = await self.Red.wait_for(
+                "message",
+                timeout=30.0,
+                check=MessagePredicate.same_context(channel=ctx.channel, user=member),
+            )
+        except asyncio.TimeoutError:
+            await ctx.send(f"{author.mention}, сделка отменена.")
+            return
+        if msg.content.lower() not in ["да", "д", "yes", "y"]:
+            await ctx.send(f"{author.mention}, сделка отменена.")
+            return
+
+        # The buyer's gold is the likelier failure, so it goes first.
+        changes = [
+            Change(
+                self.get_char_key(member, ctx.guild),
+                -price,
+                ((_item, count, None, None),),
+            ),
+            Change(
+                self.get_char_key(author, ctx.guild),
+                price,
+                ((_item, -count, None, None),),
+            ),
+        ]
+        if await self._execute_changes(ctx, changes):
+            await ctx.send(f"{author.mention}, {member.mention}, сделка совершена.")
+
+    async def _execute_changes(self, ctx: Context, changes: List[Change]) -> bool:
+        """Applies the changes as one transaction and reports errors.
+
+        Args:
+            ctx (Context): Command context.
+            changes (List[Change]): The changes.
+
+        Returns:
+            bool: Whether the changes are applied.
+
+        """
+        author = ctx.author
+        try:
+            gold = await self.Red.loop.run_in_executor(
+                None, execute, self.CharacterClass, self.InventoryClass, changes
+            )
+        except NotEnoughGold:
+            await ctx.send(f"{author.mention}, недостаточно золота.")
+            return False
+        except (ItemNotFoundInInventory, NotEnoughItems):
+            await ctx.send(f"{author.mention}, недостаточно предметов в инвентаре.")
+            return False
+        except TransactionFailed:
+            await ctx.send(f"{author.mention}, не удалось совершить сделку.")
+            return False
+        self.on_gold_changed(gold)
+        return True
+
+    def on_gold_changed(self, gold: dict):
+        """Updates the gold leaderboards after a transfer.
+
+        The members are also recorded as writers, so they read their own
+        changes from the primary.
+
+        Args:
+            gold (dict): New gold by member ID.
+        """
+        for member_id, value in gold.items():
+            self.leaderboards.update(member_id, gold=value)
+        self.database.reads.mark_write(*gold)
+        self.event_bus.post(
+            "scores",
+            values={member_id: {"gold": value} for member_id, value in gold.items()},
+        )
+
+    @commands.group(invoke_without_command=True)
+    async def market(self, ctx, item_name: str):
+        """Заявки торговой площадки на предмет"""
+
+        author = ctx.author
+        try:
+            _item = self.get_item_by_name(item_name)
+        except ItemNotFound as e:
+            await ctx.send(self._get_item_not_found_text(author, e))
+            return
+        embed = discord.Embed(
+            title=f"Торговая площадка: {_item.name}", colour=discord.Colour(0x8B572A)
+        )
+        embed.set_author(name=config.bot.name, icon_url=config.bot.icon_url)
+        for side, name in ((SELL, "Продажа"), (BUY, "Покупка")):
+            depth = self.market.get_depth(_item.item_id, side, config.game.market.depth)
+            embed.add_field(
+                name=name,
+                value="\n".join(f"{price} — {count} шт." for price, count in depth)
+                or "Нет заявок",
+            )
+        await ctx.send(embed=embed)
+
+    @market.command(name="buy")
+    async def market_buy(self, ctx, item_name: str, count: int, price: int):
+        """Выставить заявку на покупку
+
+        *- item_name:* Название предмета
+        *- count:* Количество предметов
+        *- price:* Цена одного предмета
+        """
+
+        await self._place_order(ctx, BUY, item_name, count, price)
+
+    @market.command(name="sell")
+    async def market_sell(self, ctx, item_name: str, count: int, price: int):
+        """Выставить заявку на продажу
+
+        *- item_name:* Название предмета
+        *- count:* Количество предметов
+        *- price:* Цена одного предмета
+        """
+
+        await self._place_order(ctx, SELL, item_name, count, price)
+
+    @market.command(name="cancel")
+    async def market_cancel(self, ctx, order_id: int):
+        """Отменить заявку"""
+
+        author = ctx.author
+        try:
+            order = await self.Red.loop.run_in_executor(
+                None, self.market.cancel, self.get_char_key(author, ctx.guild), order_id
+            )
+        except (TransactionFailed, LeaseTimeout):
+            await ctx.send(f"{author.mention}, не удалось отменить заявку.")
+            return
+        if order is None:
+            await ctx.send(f"{author.mention}, заявка не найдена.")
+        else:
+            self.event_bus.post("market")
+            await ctx.send(f"{author.mention}, заявка #{order_id} отменена.")
+
+    @market.command(name="orders")
+    async def market_orders(self, ctx):
+        """Ваши заявки"""
+
+        author = ctx.author
+        member_id = self.get_char_key(author, ctx.guild)
+        orders = self.market.get_orders(member_id)
+        if not orders:
+            await ctx.send(f"{author.mention}, у вас нет заявок.")
+            return
+        names = {
+            item.item_id: item.name
+            for item in self.ItemClass.objects(
+                item_id__in=list({order.item_id for order in orders})
+            ).only("item_id", "name")
+        }
+        lines = []
+        for order in orders:
+            name = names.get(order.item_id, order.item_id)
+            side = "Покупка" if order.side == BUY else "Продажа"
+            lines.append(
+                f"#{order.order_id} {side}: **{name}** — {order.count} шт. "
+                f"по {order.price}"
+            )
+        await ctx.send(f"{author.mention}, ваши заявки:\n" + "\n".join(lines))
+
+    async def _place_order(
+        self, ctx: Context, side: str, item_name: str, count: int, price: int
+    ):
+        """Places an order on the marketplace and reports the fills.
+
+        Args:
+            ctx (Context): Command context.
+            side (str): `buy` or `sell`.
+            item_name (str): Item name.
+            count (int): The number of items.
+            price (int): Price of one item.
+        """
+        author = ctx.author
+        if count < 1 or price < 1:
+            await ctx.send(f"{author.mention}, недопустимая заявка.")
+            return
+        if not self.CharacterClass.is_member_registered(
+            self.get_char_key(author, ctx.guild)
+        ):
+            await ctx.send(f"{author.mention}, персонаж не найден.")
+            return
+        try:
+            _item = self.get_item_by_name(item_name)
+        except ItemNotFound as e:
+            await ctx.send(self._get_item_not_found_text(author, e))
+            return
+        try:
+            order, fills = await self.Red.loop.run_in_executor(
+                None,
+                self.market.place,
+                self.get_char_key(author, ctx.guild),
+                _item,
+                side,
+                count,
+                price,
+            )
+        except NotEnoughGold:
+            await ctx.send(f"{author.mention}, недостаточно золота.")
+            return
+        except (ItemNotFoundInInventory, NotEnoughItems):
+            await ctx.send(f"{author.mention}, недостаточно предметов в инвентаре.")
+            return
+        except (TransactionFailed, LeaseTimeout):
+            await ctx.send(f"{author.mention}, не удалось выставить заявку.")
+            return
+        self.event_bus.post("market")
+        filled = sum(fill.count for fill in fills)
+        text = f"{author.mention}, заявка #{order.order_id} выставлена."
+        if filled:
+            text += f" Исполнено: {filled} из {count}."
+        if order.count and self.market.find_order(order.order_id) is None:
+            text += " Остаток заявки отменен."
+        await ctx.send(text)
+
+    @commands.command()
+    async def equip(self, ctx: Context, item_name: str):
+        """Экипировать предмет"""
+
+        author = ctx.author
+        try:
+            char = self.get_char_by_id(self.get_char_key(author, ctx.guild))
+        except CharacterNotFound:
+            await ctx.send(f"{author.mention}, персонаж не найден.")
+            return
+
+        try:
+            _item = self.get_item_by_name(item_name)
+        except ItemNotFound as e:
+            await ctx.send(self._get_item_not_found_text(author, e))
+            return
+
+        def equip(_char: Character):
+            self.equip_item(_char, _char.inventory.get_item(_item))
+
+        try:
+            await self.Red.loop.run_in_executor(
+                None,
+                update_character,
+                self.CharacterClass,
+                char.member_id,
+                EQUIP_FIELDS,
+                equip,
+            )
+        except ItemNotFoundInInventory:
+            await ctx.send(f"{author.mention}, предмет не найден в инвентаре.")
+            return
+        except ItemIsNotEquippable:
+            await ctx.send(f"{author.mention}, предмет не может быть экипирован.")
+            return
+        except TransactionFailed:
+            await ctx.send(f"{author.mention}, не удалось экипировать предмет.")
+            return
+        self.database.reads.mark_write(char.member_id)
+        await ctx.send(f"{author.mention}, предмет экипирован.")
+
+    @commands.group(invoke_without_command=True)
+    async def craft(self, ctx, item_name: str, times: int = 1):
+        """Создать предмет
+
+        *- item_name:* Название предмета
+        *- times:* Сколько раз использовать рецепт
+        """
+
+        author = ctx.author
+        try:
+            char = self.get_char_by_id(self.get_char_key(author, ctx.guild))
+        except CharacterNotFound:
+            await ctx.send(f"{author.mention}, персонаж не найден.")
+            return
+        try:
+            _item = self.get_item_by_name(item_name)
+        except ItemNotFound as e:
+            await ctx.send(self._get_item_not_found_text(author, e))
+            return
+        recipes = self.recipes.get_recipes(_item.item_id)
+        if not recipes or times < 1:
+            await ctx.send(f"{author.mention}, предмет нельзя создать.")
+            return
+
+        skill = char.attributes.skills.get("smithing", 0)
+        counts = char.inventory.get_counts()
+        recipe = next(
+            (
+                recipe
+                for recipe, _times in self.recipes.get_craftable(counts, skill)
+                if recipe.output == _item.item_id and _times >= times
+            ),
+            None,
+        )
+        if recipe is None:
+            await ctx.send(
+                f"{author.mention}, недостаточно навыка или предметов в инвентаре."
+            )
+            return
+        item_ids = [item_id for item_id, _ in recipe.ingredients]
+        items = {
+            item.item_id: item for item in self.ItemClass.objects(item_id__in=item_ids)
+        }
+        items[_item.item_id] = _item
+        _config = config.game.crafting
+        change = get_craft_change(
+            char.member_id,
+            recipe,
+            items,
+            times,
+            char.name,
+            get_temper(skill, _config.temper_step, _config.max_temper),
+        )
+        try:
+            await self.Red.loop.run_in_executor(
+                None, apply_change, self.CharacterClass, self.InventoryClass, change
+            )
+        except (ItemNotFoundInInventory, NotEnoughItems):
+            await ctx.send(f"{author.mention}, недостаточно предметов в инвентаре.")
+            return
+        except TransactionFailed:
+            await ctx.send(f"{author.mention}, не удалось создать предмет.")
+            return
+        self.database.reads.mark_write(char.member_id)
+        await ctx.send(
+            f"{author.mention}, создано: {_item.name} ({recipe.count * times})."
+        )
+
+    @craft.command(name="list")
+    async def craft_list(self, ctx):
+        """Предметы, которые можно создать"""
+
+        author = ctx.author
+        try:
+            char = self.get_char_by_id(self.get_char_key(author, ctx.guild))
+        except CharacterNotFound:
+            await ctx.send(f"{author.mention}, персонаж не найден.")
+            return
+        craftable = self.recipes.get_craftable(
+            char.inventory.get_counts(), char.attributes.skills.get("smithing", 0)
+        )
+        if not craftable:
+            await ctx.send(f"{author.mention}, нечего создать.")
+            return
+        names = {
+            item.item_id: item.name
+            for item in self.ItemClass.objects(
+                item_id__in=list({recipe.output for recipe, _ in craftable})
+            ).only("item_id", "name")
+        }
+        lines = [
+            f"**{names.get(recipe.output, recipe.output)}** ({recipe.count}) "
+            f"— до {times} раз"
+            for recipe, times in craftable
+        ]
+        await ctx.send(f"{author.mention}, можно создать:\n" + "\n".join(lines))
+
+    @commands.command()
+    async def use(self, ctx, item_name: str):
+        """Использовать предмет"""
+
+        author = ctx.author
+        try:
+            char = self.get_char_by_id(self.get_char_key(author, ctx.guild))
+        except CharacterNotFound:
+            await ctx.send(f"{author.mention}, персонаж не найден.")
+            return
+        try:
+            _item = self.get_item_by_name(item_name)
+        except ItemNotFound as e:
+            await ctx.send(self._get_item_not_found_text(author, e))
+            return
+        if not _item.effect:
+            await ctx.send(f"{author.mention}, предмет нельзя использовать.")
+            return
+        effect = make_effect(
+            f"item.{_item.item_id}",
+            _item.effect.get("name", _item.name),
+            _item.effect.get("modifiers", {}),
+            _item.effect.get("kind", POTION),
+            _item.effect.get("duration"),
+        )
+
+        def use(_char: Character) -> bool:
+            _char.inventory.remove_item(_item, 1)
+            return _char.attributes.add_effect(effect)
+
+        try:
+            applied = await self.Red.loop.run_in_executor(
+                None,
+                update_character,
+                self.CharacterClass,
+                char.member_id,
+                USE_FIELDS,
+                use,
+            )
+        except ItemNotFoundInInventory:
+            await ctx.send(f"{author.mention}, предмет не найден в инвентаре.")
+            return
+        except TransactionFailed:
+            await ctx.send(f"{author.mention}, не удалось использовать предмет.")
+            return
+        self.database.reads.mark_write(char.member_id)
+        if applied:
+            self.schedule_effect(char.member_id, effect)
+            await ctx.send(f"{author.mention}, эффект «{effect['name']}» применён.")
+        else:
+            await ctx.send(f"{author.mention}, вы устояли перед болезнью.")
+
+    @commands.command()
+    async def effects(self, ctx, member: Union[discord.Member, discord.User] = None):
+        """Активные эффекты персонажа"""
+
+        author = ctx.author
+        if member is None:
+            member = author
+        try:
+            char = self.get_char_by_id(
+                self.get_char_key(member, ctx.guild), cached=True
+            )
+        except CharacterNotFound:
+            await ctx.send(f"{author.mention}, персонаж не найден.")
+            return
+        now = time.time()
+        lines = []
+        for effect in char.attributes.effects:
+            if not is_active(effect, now):
+                continue
+            line = f"**{effect['name']}**"
+            if effect.get("expires_at"):
+                line += f" — {int(effect['expires_at'] - now)} сек."
+            lines.append(line)
+        if not lines:
+            await ctx.send(f"{author.mention}, активных эффектов нет.")
+            return
+        await ctx.send(f"{author.mention}, активные эффекты:\n" + "\n".join(lines))
+
+    @commands.command(name="inventory", aliases=["inv"])
+    async def inventory(self, ctx, member: Union[discord.Member, discord.User] = None):
+        """Инвентарь персонажа"""
+
+        author = ctx.author
+        if member is None:
+            member = author
+        member_id = self.get_char_key(member, ctx.guild)
+        read_preference = self.database.reads.get(
+            self.get_char_key(author, ctx.guild), member_id
+        )
+
+        try:
+            char = self.get_char_by_id(member_id, read_preference, cached=True)
+        except CharacterNotFound:
+            await ctx.send(f"{author.mention}, персонаж не найден.")
+            return
+
+        if char.inventory.is_inventory_empty():
+            _embed = discord.Embed(
+                title=f"Инвентарь персонажа {char.name}",
+                colour=discord.Colour(0x8B572A),
+                description=f"Инвентарь пуст.",
+            )
+            await ctx.send(embed=_embed)
+            return
+
+        pages = []
+        for category, name in config.humanize.inventory.inv_categories.items():
+            items = char.inventory.items[category]
+            if not items:
+                continue
+            item_stats = []
+            for item in items:
+                count = item.count
+                if item and count > 0:
+                    try:
+                        _item = self.get_item_by_id(item.item_id, read_preference)
+                        stats = {**{"count": count}, **dict(_item.to_mongo())}
+                        item_stats.append(stats)
+                    except ItemNotFound:
+                        print(
+                            f"Item ID: {item.item_id} not found. Member ID: {member.id}"
+                        )
+                else:
+                    break
             else:
                 item_stats[:] = sorted(item_stats, key=itemgetter("name"))
                 embed = discord.Embed(
@@ -958,9 +2476,11 @@ class RPG(Cog):
 
         author = ctx.author
         try:
-            _item = self.get_item_by_name(item_name)
-        except ItemNotFound:
-            await ctx.send(f"{author.mention}, предмет не найден.")
+            _item = self.get_item_by_name(
+                item_name, self.database.reads.get(self.get_char_key(author, ctx.guild))
+            )
+        except ItemNotFound as e:
+            await ctx.send(self._get_item_not_found_text(author, e))
             return
 
         color = discord.Colour(
@@ -1022,6 +2542,13 @@ class RPG(Cog):
                 setattr(new_item, arg, value)
 
         new_item.save()
+        self.database.reads.mark_write(self.get_char_key(ctx.author, ctx.guild))
+        self.item_index.add(new_item.item_id, new_item.name)
+        self.shop_catalog.add(new_item)
+        self.loot_tables.add(new_item)
+        if self.is_rebuilding_item_indexes():
+            # The rebuild would drop the item when its tables are swapped in.
+            self.rebuild_item_indexes()
         await ctx.send(f"{ctx.author.mention}, предмет создан!")
 
     @checks.admin_or_permissions()
@@ -1038,23 +2565,24 @@ class RPG(Cog):
         """Выдать предмет персонажу"""
 
         author = ctx.author
-        member_id = str(member.id)
-        try:
-            char = self.get_char_by_id(member_id)
-        except CharacterNotFound:
-            await ctx.send(f"{author.mention}, персонаж не найден.")
-            return
-
+        member_id = self.get_char_key(member, ctx.guild)
         try:
             _item = self.get_item_by_name(item_name)
-        except ItemNotFound:
-            await ctx.send(f"{author.mention}, предмет не найден.")
+        except ItemNotFound as e:
+            await ctx.send(self._get_item_not_found_text(author, e))
             return
 
         if temper:
             temper = int(temper)
-        char.inventory.add_item(_item, int(count), maker, temper)
-        char.save()
+        change = Change(member_id, items=((_item, int(count), maker, temper),))
+        try:
+            await self.Red.loop.run_in_executor(
+                None, apply_change, self.CharacterClass, self.InventoryClass, change
+            )
+        except TransactionFailed:
+            await ctx.send(f"{author.mention}, персонаж не найден.")
+            return
+        self.database.reads.mark_write(member_id)
         await ctx.send(f"{author.mention}, предмет(ы) добавлен(ы).")
 
     @checks.admin_or_permissions()
@@ -1067,25 +2595,26 @@ class RPG(Cog):
         author = ctx.author
         if member is None:
             member = author
-        member_id = str(member.id)
-        try:
-            char = self.get_char_by_id(member_id)
-        except CharacterNotFound:
-            await ctx.send(f"{author.mention}, персонаж не найден.")
-            return
-
+        member_id = self.get_char_key(member, ctx.guild)
         try:
             _item = self.get_item_by_name(item_name)
-        except ItemNotFound:
-            await ctx.send(f"{author.mention}, предмет не найден.")
+        except ItemNotFound as e:
+            await ctx.send(self._get_item_not_found_text(author, e))
             return
 
+        change = Change(member_id, items=((_item, -int(count), None, None),))
         try:
-            char.inventory.remove_item(_item, count)
-            char.save()
-            await ctx.send(f"{author.mention}, предмет(ы) удален(ы).")
-        except ItemNotFoundInInventory:
+            await self.Red.loop.run_in_executor(
+                None, apply_change, self.CharacterClass, self.InventoryClass, change
+            )
+        except (ItemNotFoundInInventory, NotEnoughItems):
             await ctx.send(f"{author.mention}, предмет не найден в инвентаре.")
+            return
+        except TransactionFailed:
+            await ctx.send(f"{author.mention}, персонаж не найден.")
+            return
+        self.database.reads.mark_write(member_id)
+        await ctx.send(f"{author.mention}, предмет(ы) удален(ы).")
 
     async def on_register_end(self, session: RegisterSession):
         """Event for a registration session ending.
@@ -1099,6 +2628,10 @@ class RPG(Cog):
         """
         if session in self.register_sessions:
             self.register_sessions.remove(session)
+        ctx = session.ctx
+        if config.bot.cluster.enabled:
+            lease = self._get_register_lease(self.get_char_key(ctx.author, ctx.guild))
+            await self.Red.loop.run_in_executor(None, lease.release)
         if session.complete:
             inventory = self.InventoryClass({"Weapon": [], "Armor": [], "Item": []})
             race_attrs = config.game.races[session.char["race"]]
@@ -1111,7 +2644,7 @@ class RPG(Cog):
             attributes.restore_values()
             equipment = self.EquipmentClass()
             char = self.CharacterClass(
-                member_id=session.char["member_id"],
+                member_id=self.get_char_key(ctx.author, ctx.guild),
                 name=session.char["name"],
                 race=session.char["race"],
                 sex=session.char["sex"],
@@ -1120,7 +2653,31 @@ class RPG(Cog):
                 attributes=attributes,
                 equipment=equipment,
             )
-            char.save()
+            if self.guild_characters and ctx.guild is not None:
+                char.guild_id = str(ctx.guild.id)
+            self.save_char(char)
+            values = {"lvl": char.lvl, "xp": char.xp, "gold": char.gold}
+            self.leaderboards.update(char.member_id, **values)
+            self.event_bus.post("scores", values={char.member_id: values})
+
+    def _get_register_lease(self, member_id: str) -> Lease:
+        """Returns the lease that allows one registration of the character.
+
+        In a cluster the member may start registration through several
+        processes at once, so the registration is guarded by a lease.
+
+        Args:
+            member_id (str): Character key.
+
+        Returns:
+            Lease: Registration lease.
+
+        """
+        return Lease(
+            f"register:{member_id}",
+            self.process_id,
+            config.bot.cluster.registration_ttl,
+        )
 
     def _get_register_session(
         self, author: Union[discord.Member, discord.User]
@@ -1143,29 +2700,58 @@ class RPG(Cog):
             None,
         )
 
-    def get_item_by_name(self, name: str) -> Item:
+    @staticmethod
+    def _get_item_not_found_text(
+        author: Union[discord.Member, discord.User], error: "ItemNotFound"
+    ) -> str:
+        """Returns the reply for an item that is not found.
+
+        Args:
+            author (Union[discord.Member, discord.User]): Member object
+            error (ItemNotFound): The raised exception.
+
+        Returns:
+            str: Reply text with suggestions, if any.
+
+        """
+        text = f"{author.mention}, предмет не найден."
+        if error.suggestions:
+            text += f" Возможно, вы имели в виду: {', '.join(error.suggestions)}?"
+        return text
+
+    def get_item_by_name(self, name: str, read_preference=None) -> Item:
         """Returns the item by the given name.
 
+        The name is looked up in the item name index ignoring case. A unique
+        prefix of the name is also accepted.
+
         Args:
             name (str): Item name.
+            read_preference (:obj:`ServerMode`, optional): Read preference of
+                the query. Defaults to None, which means that of the
+                connection.
 
         Returns:
             Document: Item object.
 
         Raises:
-            ItemNotFound: If the item is not found.
+            ItemNotFound: If the item is not found. The exception contains
+                names of similar items.
 
         """
-        items = self.ItemClass.objects(name=name)
-        if not items:
-            raise ItemNotFound
-        return items.first()
+        item_id = self.item_index.find(name)
+        if item_id is None:
+            raise ItemNotFound(self.item_index.suggest(name))
+        return self.get_item_by_id(item_id, read_preference)
 
-    def get_item_by_id(self, item_id: int) -> Item:
+    def get_item_by_id(self, item_id: int, read_preference=None) -> Item:
         """Returns the item by the given id.
 
         Args:
             item_id (int): Item ID.
+            read_preference (:obj:`ServerMode`, optional): Read preference of
+                the query. Defaults to None, which means that of the
+                connection.
 
         Returns:
             Document: Item object.
@@ -1174,16 +2760,68 @@ class RPG(Cog):
             ItemNotFound: If the item is not found.
 
         """
+        item = self.item_cache.get(item_id)
+        if item is not None:
+            return item
         items = self.ItemClass.objects(item_id=item_id)
-        if not items:
+        if read_preference is not None:
+            items = items.read_preference(read_preference)
+        item = items.first()
+        if item is None:
             raise ItemNotFound
-        return items.first()
+        self.item_cache.put(item_id, item)
+        return item
+
+    def save_char(self, char: Character):
+        """Saves the character and records its owner as a writer.
+
+        The owner then reads from the primary for a while, so read-only
+        commands routed to secondaries still show them their own changes.
+
+        Args:
+            char (Character): Character object.
+        """
+        char.save()
+        self.database.reads.mark_write(char.member_id)
+
+    def get_char_key(
+        self,
+        member: Union[discord.Member, discord.User],
+        guild: discord.Guild = None,
+    ) -> str:
+        """Returns the key of the member's character.
+
+        With guild characters enabled, a member has a separate character in
+        every guild, and a global character in direct messages.
+
+        Args:
+            member (Union[discord.Member, discord.User]): Member object.
+            guild (:obj:`discord.Guild`, optional): Guild of the command.
+
+        Returns:
+            str: Character key, used as the member ID of the character.
+
+        """
+        if self.guild_characters and guild is not None:
+            return get_char_key(member.id, guild.id)
+        return get_char_key(member.id)
 
-    def get_char_by_id(self, member_id: str) -> Character:
+    def get_char_by_id(
+        self, member_id: str, read_preference=None, cached: bool = False
+    ) -> Character:
         """Returns character object.
 
         Args:
             member_id: Member ID to get.
+            read_preference (:obj:`ServerMode`, optional): Read preference of
+                the query. Defaults to None, which means that of the
+                connection.
+            cached (:obj:`bool`, optional): The character is only displayed,
+                so it may be taken from the cache, unless its owner has just
+                changed it. The cache is kept up to date by `char_watcher`.
+                A cache miss is read from the primary, as a secondary may
+                return a document older than the evicted one. Defaults to
+                False.
 
         Returns:
             Document: Character object.
@@ -1192,10 +2830,55 @@ class RPG(Cog):
             CharacterNotFound: If the member is not registered.
 
         """
+        cached = cached and not self.database.reads.has_written(member_id)
+        if cached:
+            char = self.char_cache.get(member_id)
+            if char is not None:
+                return char
+            generation = self.char_cache.get_generation()
+            read_preference = self.database.reads.primary
         chars = self.CharacterClass.objects(member_id=member_id)
-        if not chars:
+        if read_preference is not None:
+            chars = chars.read_preference(read_preference)
+        char = chars.first()
+        if char is None:
             raise CharacterNotFound
-        return chars.first()
+        if cached:
+            self.char_cache.put(member_id, char, generation)
+        return char
+
+    def get_combatant(self, char: Character) -> Combatant:
+        """Returns the combat snapshot of the character.
+
+        The equipped weapon is resolved here, so the fight itself does not
+        need any database queries.
+
+        Args:
+            char (Character): Character object.
+
+        Returns:
+            Combatant: Stat snapshot.
+
+        """
+        weapon = None
+        right_hand = char.equipment.right_hand
+        if right_hand:
+            try:
+                weapon = dict(self.get_item_by_id(right_hand.item_id).to_mongo())
+            except ItemNotFound:
+                pass
+        attributes = char.attributes
+        main, _, skills = attributes.get_effective()
+        return Combatant.from_stats(
+            char.name,
+            main,
+            skills,
+            attributes.unarmed_damage,
+            attributes.armor_rating,
+            weapon=weapon,
+            health=attributes.health,
+            stamina=attributes.stamina,
+        )
 
     def unequip_item(self, char: Character, slot: str):
         """Unequips the item.
@@ -1213,17 +2896,17 @@ class RPG(Cog):
         _item = getattr(equipment, slot)
         if _item:
             setattr(equipment, slot, None)
-            item = self.get_item_by_id(_item["item_id"])
-            inventory.add_item(item, 1, _item["maker"], _item["temper"])
+            item = self.get_item_by_id(_item.item_id)
+            inventory.add_item(item, 1, _item.maker, _item.temper)
             if hasattr(inventory.items, "armor"):
                 attributes.armor_rating -= item["armor"]
 
-    def equip_item(self, char: Character, item: dict):
+    def equip_item(self, char: Character, item: ItemStack):
         """Equips the item.
 
         Args:
             char (Character): Character on which the item is equipped.
-            item (dict): Sample item from inventory.
+            item (ItemStack): Sample item from inventory.
 
         Raises:
             ItemNotFoundInInventory: If the item is not found in the inventory.
@@ -1233,15 +2916,14 @@ class RPG(Cog):
         equipment = char.equipment
         inventory = char.inventory
         attributes = char.attributes
-        item_instance = item.copy()
-        item_instance.pop("count")
-        _item = self.get_item_by_id(item_instance["item_id"])
+        item_instance = item.copy(count=1)
+        _item = self.get_item_by_id(item_instance.item_id)
         category = inventory.get_item_category(_item)
         if item in inventory.items[category]:
             if category == "Weapon":
                 right_hand = equipment.right_hand
                 if right_hand:
-                    weapon_right = self.get_item_by_id(right_hand["item_id"])
+                    weapon_right = self.get_item_by_id(right_hand.item_id)
                     left_hand = equipment.left_hand
                     if left_hand:
                         self.unequip_item(char, "left_hand")
@@ -1262,14 +2944,50 @@ class RPG(Cog):
             else:
                 raise ItemIsNotEquippable
             inventory.remove_item(_item, 1)
+            self.update_equipment_effects(char)
         else:
             raise ItemNotFoundInInventory
 
+    def update_equipment_effects(self, char: Character):
+        """Replaces the equipment effects with those of the equipped items.
+
+        Args:
+            char (Character): Character object.
+        """
+        equipment = char.equipment
+        stacks = {
+            slot: getattr(equipment, slot)
+            for slot in self.EquipmentClass.slots
+            if getattr(equipment, slot)
+        }
+        items = {
+            item.item_id: item
+            for item in self.ItemClass.objects(
+                item_id__in=[stack.item_id for stack in stacks.values()]
+            ).only("item_id", "name", "modifiers")
+        }
+        char.attributes.remove_effects(kind=EQUIPMENT)
+        for slot, stack in stacks.items():
+            item = items.get(stack.item_id)
+            if item is not None and item.modifiers:
+                char.attributes.add_effect(
+                    make_effect(
+                        f"equipment.{slot}", item.name, item.modifiers, EQUIPMENT
+                    )
+                )
+
 
 class ItemNotFound(Exception):
-    """Raises if the file is not found in the database."""
+    """Raises if the file is not found in the database.
 
-    pass
+    Attributes:
+        suggestions (list): Names of similar items.
+
+    """
+
+    def __init__(self, suggestions: list = None):
+        super().__init__()
+        self.suggestions = suggestions or []
 
 
 class ItemNotFoundInInventory(Exception):
@@ -0,0 +1,145 @@
+import asyncio
+import time
+from typing import Callable, Dict, List
+
+from redbot.core.bot import Red
+
+from .experience import ExperienceEngine, Progress
+
+
+class ActivityAccumulator:
+    """Class to reward chat activity with experience.
+
+    Messages only update in-memory counters. The accumulated experience is
+    flushed to the database in bulk every `flush_interval` seconds by the task
+    supervisor, and once more when the cog is unloaded. Experience that could
+    not be written stays in the buffer until the next flush.
+
+    Attributes:
+        bot (Red): Bot object.
+        experience (ExperienceEngine): Engine used to grant the experience.
+        on_flush (Callable[[List[Progress]], None]): Called with the result of
+            every flush.
+        xp_per_message (float): Experience for one rewarded message.
+        cooldown (float): Minimum number of seconds between two rewarded
+            messages of the same member.
+        window (float): Length of the rate limit window in seconds.
+        max_per_window (int): Maximum number of rewarded messages of the same
+            member per window.
+        flush_interval (float): The number of seconds between two flushes.
+
+    """
+
+    def __init__(
+        self,
+        bot: Red,
+        experience: ExperienceEngine,
+        on_flush: Callable[[List[Progress]], None],
+        xp_per_message: float = 5,
+        cooldown: float = 60,
+        window: float = 3600,
+        max_per_window: int = 30,
+        flush_interval: float = 30,
+    ):
+        self.bot = bot
+        self.experience = experience
+        self.on_flush = on_flush
+        self.xp_per_message = xp_per_message
+        self.cooldown = cooldown
+        self.window = window
+        self.max_per_window = max_per_window
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, float] = {}
+        self._next_reward: Dict[str, float] = {}
+        self._windows: Dict[str, list] = {}
+
+    def record(self, member_id: str, now: float = None) -> bool:
+        """Records a message of the member.
+
+        Args:
+            member_id (str): Member ID.
+            now (:obj:`float`, optional): Monotonic time of the message.
+                Defaults to the current time.
+
+        Returns:
+            bool: Whether the message is rewarded.
+
+        """
+        if now is None:
+            now = time.monotonic()
+        if self._next_reward.get(member_id, 0) > now:
+            return False
+        window = self._windows.get(member_id)
+        if window is None or window[0] <= now:
+            window = self._windows[member_id] = [now + self.window, 0]
+        if window[1] >= self.max_per_window:
+            return False
+        window[1] += 1
+        self._next_reward[member_id] = now + self.cooldown
+        self._pending[member_id] = self._pending.get(member_id, 0) + self.xp_per_message
+        return True
+
+    async def flush(self):
+        """Writes the accumulated experience to the database.
+
+        The experience is granted in batches of `ExperienceEngine.batch_size`
+        members. If a batch fails, the experience of that batch and of the
+        following ones is returned to the buffer before the error is raised.
+        If the flush is cancelled, the batch in flight is still granted by the
+        executor, so only the following batches are returned.
+        """
+        pending = self._take()
+        member_ids = list(pending)
+        batch_size = self.experience.batch_size
+        progress = []
+        granted = 0
+        try:
+            while granted < len(member_ids):
+                batch = {
+                    member_id: pending[member_id]
+                    for member_id in member_ids[granted : granted + batch_size]
+                }
+                # Shielded, so a batch that has not started yet is not
+                # cancelled together with the flush.
+                progress += await asyncio.shield(
+                    self.bot.loop.run_in_executor(None, self.experience.grant, batch)
+                )
+                granted += len(batch)
+        except asyncio.CancelledError:
+            self._restore(
+                {
+                    member_id: pending[member_id]
+                    for member_id in member_ids[granted + batch_size :]
+                }
+            )
+            raise
+        except BaseException:
+            self._restore(
+                {member_id: pending[member_id] for member_id in member_ids[granted:]}
+            )
+            raise
+        finally:
+            if progress:
+                self.on_flush(progress)
+        self._prune()
+
+    def _take(self) -> Dict[str, float]:
+        """Returns the accumulated experience and resets it."""
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def _restore(self, pending: Dict[str, float]):
+        """Returns experience that was not granted to the buffer."""
+        for member_id, amount in pending.items():
+            self._pending[member_id] = self._pending.get(member_id, 0) + amount
+
+    def _prune(self):
+        """Forgets members whose cooldown and window have expired."""
+        now = time.monotonic()
+        for member_id in [
+            member_id
+            for member_id, window in self._windows.items()
+            if window[0] <= now and self._next_reward.get(member_id, 0) <= now
+        ]:
+            del self._windows[member_id]
+            self._next_reward.pop(member_id, None)
@@ -0,0 +1,208 @@
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from typing import Dict, List, Optional, Tuple
+
+from .combat import Combatant, CombatRules, simulate
+
+
+def load_catalog(path: str) -> Tuple[List[dict], Dict[str, dict]]:
+    """Loads weapons and armor sets from an exported item catalog.
+
+    The catalog is a JSON array or JSON Lines file of item documents, as
+    exported from the `item` collection. Armor is grouped into sets by
+    material, taking the best piece of every slot.
+
+    Args:
+        path (str): Path to the catalog.
+
+    Returns:
+        Tuple[List[dict], Dict[str, dict]]: Weapons and the total armor of
+        every armor set by material.
+
+    """
+    with open(path, encoding="utf-8") as file:
+        content = file.read().strip()
+    if content.startswith("["):
+        items = json.loads(content)
+    else:
+        items = [json.loads(line) for line in content.splitlines() if line.strip()]
+    weapons = []
+    pieces = {}
+    for item in items:
+        category = item.get("_cls", "")
+        if category.endswith("Weapon"):
+            weapons.append(item)
+        elif category.endswith("Armor"):
+            slots = pieces.setdefault(item.get("material"), {})
+            slot = item.get("slot")
+            slots[slot] = max(slots.get(slot, 0), item.get("armor") or 0)
+    armor_sets = {
+        material: {"armor": sum(slots.values())} for material, slots in pieces.items()
+    }
+    return weapons, armor_sets
+
+
+def get_fighters(
+    races: dict, weapons: List[dict], armor_sets: Dict[str, dict]
+) -> List[Combatant]:
+    """Returns fighters of every race and equipment combination.
+
+    Args:
+        races (dict): Same as the `game.races` section of the config.
+        weapons (List[dict]): Weapons. Unarmed fighters are always included.
+        armor_sets (Dict[str, dict]): Armor sets by material. Fighters without
+            armor are always included.
+
+    Returns:
+        List[Combatant]: Fighters named `race/weapon/armor`.
+
+    """
+    fighters = []
+    for (race_name, race), weapon, (material, armor) in product(
+        races.items(),
+        [None, *weapons],
+        [(None, {"armor": 0}), *armor_sets.items()],
+    ):
+        name = "/".join(
+            [race_name, weapon["name"] if weapon else "unarmed", material or "none"]
+        )
+        fighters.append(
+            Combatant.from_stats(
+                name,
+                race["main"],
+                race["skills"],
+                race["unarmed_damage"],
+                armor_rating=armor["armor"],
+                weapon=weapon,
+            )
+        )
+    return fighters
+
+
+def simulate_row(
+    fighters: List[Combatant], row: int, fights: int, seed: int, rules: CombatRules
+) -> List[float]:
+    """Returns win rates of one fighter against every fighter.
+
+    The seed of every pair depends only on the base seed and the pair, so the
+    results do not depend on how rows are distributed among processes.
+
+    Args:
+        fighters (List[Combatant]): All fighters.
+        row (int): Index of the fighter.
+        fights (int): The number of duels for every pair.
+        seed (int): Base seed.
+        rules (CombatRules): Combat settings.
+
+    Returns:
+        List[float]: Win rates by opponent index.
+
+    """
+    rates = []
+    for column, opponent in enumerate(fighters):
+        pair_seed = seed * len(fighters) ** 2 + row * len(fighters) + column
+        wins, _, _ = simulate(fighters[row], opponent, fights, pair_seed, rules)
+        rates.append(wins / fights)
+    return rates
+
+
+def run(
+    fighters: List[Combatant],
+    fights: int,
+    seed: int,
+    rules: CombatRules,
+    workers: Optional[int] = None,
+) -> List[List[float]]:
+    """Computes the win rate matrix using all cores.
+
+    Args:
+        fighters (List[Combatant]): All fighters.
+        fights (int): The number of duels for every pair.
+        seed (int): Base seed.
+        rules (CombatRules): Combat settings.
+        workers (:obj:`int`, optional): The number of processes. Defaults to
+            the number of cores.
+
+    Returns:
+        List[List[float]]: Win rate of the row fighter against the column one.
+
+    """
+    size = len(fighters)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(
+            executor.map(
+                simulate_row,
+                [fighters] * size,
+                range(size),
+                [fights] * size,
+                [seed] * size,
+                [rules] * size,
+                chunksize=max(1, size // ((workers or os.cpu_count() or 1) * 4)),
+            )
+        )
+
+
+def write_matrix(path: str, fighters: List[Combatant], matrix: List[List[float]]):
+    """Writes the win rate matrix as CSV.
+
+    Args:
+        path (str): Output path.
+        fighters (List[Combatant]): All fighters.
+        matrix (List[List[float]]): Win rate matrix.
+    """
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["fighter", *(fighter.name for fighter in fighters)])
+        for fighter, rates in zip(fighters, matrix):
+            writer.writerow([fighter.name, *(f"{rate:.4f}" for rate in rates)])
+
+
+def main(argv: List[str] = None):
+    """Runs Monte Carlo matchups of all race and equipment combinations.
+
+    Run it as a module of the cog package, like `snapshot`.
+
+    Example:
+        python -m rpg.balance --items items.json --fights 2000 --out matrix.csv
+    """
+    parser = argparse.ArgumentParser(
+        description="Simulate duels of all race and equipment combinations."
+    )
+    parser.add_argument(
+        "--config",
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json"),
+        help="path to config.json",
+    )
+    parser.add_argument(
+        "--encoding", default="cp1251", help="encoding of config.json (cp1251)"
+    )
+    parser.add_argument("--items", help="exported item catalog (JSON or JSON Lines)")
+    parser.add_argument("--fights", type=int, default=1000, help="duels per pair")
+    parser.add_argument("--seed", type=int, default=None, help="base seed")
+    parser.add_argument("--workers", type=int, default=None, help="processes")
+    parser.add_argument("--out", default="balance.csv", help="output CSV path")
+    args = parser.parse_args(argv)
+
+    with open(args.config, encoding=args.encoding) as config_file:
+        game = json.load(config_file)["game"]
+    rules = CombatRules(**game.get("combat", {}))
+    weapons, armor_sets = load_catalog(args.items) if args.items else ([], {})
+    fighters = get_fighters(game["races"], weapons, armor_sets)
+    seed = args.seed if args.seed is not None else random.getrandbits(32)
+    matrix = run(fighters, args.fights, seed, rules, args.workers)
+    write_matrix(args.out, fighters, matrix)
+    print(
+        f"{len(fighters)} fighters, {len(fighters) ** 2 * args.fights} duels, "
+        f"seed {seed}. Written to {args.out}.",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import time
+from typing import List
+
+import numpy as np
+from pymongo import UpdateOne
+
+from .effects import get_effective_stats
+
+
+class BulkAttributes:
+    """Class to modify Health, Stamina and Magicka of many characters at once.
+
+    The pools of a batch of characters are loaded into NumPy arrays with one
+    row per character and one column per pool, in the order of `pools`. The
+    arithmetic is then done in one vectorized step per operation instead of a
+    chain of `Attributes.mod_value` calls per character, and only the rows
+    that were actually changed are written back. Maximums and regeneration
+    rates include the active effects of every character.
+
+    Every row is written only if its pools still hold the loaded values, like
+    `transactions.apply_change` does for the inventory, so damage committed
+    concurrently is never overwritten. Such rows keep `needs_regen` set by
+    the writer and are regenerated again on the next tick.
+
+    Attributes:
+        member_ids (list): Member IDs of the rows.
+        values (np.ndarray): Current pool values.
+        maxes (np.ndarray): `*_max` values. NaN if the key is missing.
+        buffs (np.ndarray): `*_buff` values. NaN if the key is missing.
+        regens (np.ndarray): `*_regen` values. NaN if the key is missing.
+
+    """
+
+    pools = ("health", "stamina", "magicka")
+    projection = {
+        **{f"attributes.{pool}": True for pool in pools},
+        "attributes.main": True,
+        "attributes.effects": True,
+        "attributes.needs_regen": True,
+    }
+
+    def __init__(
+        self,
+        member_ids: list,
+        values: np.ndarray,
+        maxes: np.ndarray,
+        buffs: np.ndarray,
+        regens: np.ndarray,
+        flags: np.ndarray,
+        present: np.ndarray = None,
+    ):
+        self.member_ids = member_ids
+        self.values = values
+        self.maxes = maxes
+        self.buffs = buffs
+        self.regens = regens
+        self._initial_values = values.copy()
+        self._initial_flags = flags
+        # Pools stored in the documents. The missing ones default to 10.
+        self._present = (
+            present if present is not None else np.ones(values.shape, dtype=bool)
+        )
+
+    def __len__(self):
+        return len(self.member_ids)
+
+    @classmethod
+    def from_documents(cls, docs: List[dict], now: float = None) -> "BulkAttributes":
+        """Creates a batch from raw character documents.
+
+        Args:
+            docs (List[dict]): Character documents containing at least the
+                fields of `BulkAttributes.projection`.
+            now (:obj:`float`, optional): Current UNIX time used to pick the
+                active effects. Defaults to the current time.
+
+        Returns:
+            BulkAttributes: The batch.
+
+        """
+        shape = (len(docs), len(cls.pools))
+        values = np.zeros(shape)
+        maxes = np.full(shape, np.nan)
+        buffs = np.full(shape, np.nan)
+        regens = np.full(shape, np.nan)
+        flags = np.zeros(len(docs), dtype=bool)
+        present = np.zeros(shape, dtype=bool)
+        if now is None:
+            now = time.time()
+        for row, doc in enumerate(docs):
+            attributes = doc.get("attributes", {})
+            main, _, _, _ = get_effective_stats(
+                attributes.get("main", {}), {}, {}, attributes.get("effects", ()), now
+            )
+            flags[row] = bool(attributes.get("needs_regen"))
+            for col, pool in enumerate(cls.pools):
+                values[row, col] = attributes.get(pool, 10)
+                present[row, col] = pool in attributes
+                maxes[row, col] = main.get(f"{pool}_max", np.nan)
+                buffs[row, col] = main.get(f"{pool}_buff", np.nan)
+                regens[row, col] = main.get(f"{pool}_regen", np.nan)
+        return cls(
+            [doc["_id"] for doc in docs], values, maxes, buffs, regens, flags, present
+        )
+
+    @classmethod
+    def load(cls, character_class: type, member_ids: List[str]) -> "BulkAttributes":
+        """Loads a batch of characters with a single query.
+
+        Args:
+            character_class (type): Character document class.
+            member_ids (List[str]): Member IDs to load.
+
+        Returns:
+            BulkAttributes: The batch.
+
+        """
+        docs = character_class._get_collection().find(
+            {"_id": {"$in": member_ids}}, cls.projection
+        )
+        return cls.from_documents(list(docs))
+
+    @property
+    def totals(self) -> np.ndarray:
+        """np.ndarray: Maximum pool values, including all bonuses."""
+        return self.maxes + self.buffs
+
+    def mod_values(self, damage: np.ndarray):
+        """Modifies the pool values.
+
+        The semantics are the same as those of `Attributes.mod_value`: a value
+        that would exceed the total is set to the total, a value below 1 is set
+        to 0, and a pool without a maximum is changed without clamping.
+
+        Args:
+            damage (np.ndarray): The amounts by which the pools will be
+                modified. Anything broadcastable to `values` is accepted.
+        """
+        totals = self.totals
+        values = self.values + np.nan_to_num(damage)
+        clamped = np.where(values <= totals, np.where(values < 1, 0.0, values), totals)
+        self.values = np.where(np.isnan(totals), values, clamped)
+
+    def regen(self, timer: float):
+        """Regenerates the pools, same as `Attributes.regen`.
+
+        Args:
+            timer (float): The number of seconds since the last regeneration.
+        """
+        self.mod_values(self.maxes * self.regens * timer / 100)
+
+    @property
+    def needs_regen(self) -> np.ndarray:
+        """np.ndarray: Same as `Attributes.needs_regen` for every row."""
+        with np.errstate(invalid="ignore"):
+            return (self.values < self.totals).any(axis=1)
+
+    def get_updates(self) -> List[UpdateOne]:
+        """Returns update operations for the changed rows.
+
+        Returns:
+            List[UpdateOne]: Operations for `Collection.bulk_write`.
+
+        """
+        flags = self.needs_regen
+        changed = (self.values != self._initial_values).any(axis=1)
+        changed |= flags != self._initial_flags
+        updates = []
+        for row in np.flatnonzero(changed):
+            update = {
+                "$set": {
+                    f"attributes.{pool}": float(self.values[row, col])
+                    for col, pool in enumerate(self.pools)
+                },
+                "$currentDate": {"updated_at": True},
+            }
+            if flags[row]:
+                update["$set"]["attributes.needs_regen"] = True
+            else:
+                update["$unset"] = {"attributes.needs_regen": ""}
+            query = {"_id": self.member_ids[row]}
+            for col, pool in enumerate(self.pools):
+                query[f"attributes.{pool}"] = (
+                    float(self._initial_values[row, col])
+                    if self._present[row, col]
+                    else {"$exists": False}
+                )
+            updates.append(UpdateOne(query, update))
+        return updates
+
+    def save(self, character_class: type) -> int:
+        """Writes the changed rows back with a single bulk write.
+
+        Args:
+            character_class (type): Character document class.
+
+        Returns:
+            int: The number of written rows. Rows changed concurrently since
+            they were loaded are not written.
+
+        """
+        updates = self.get_updates()
+        if not updates:
+            return 0
+        result = character_class._get_collection().bulk_write(updates, ordered=False)
+        self._initial_values = self.values.copy()
+        self._initial_flags = self.needs_regen
+        self._present[:] = True
+        return result.matched_count
@@ -0,0 +1,292 @@
+import random
+from typing import Dict, NamedTuple, Optional, Tuple
+
+
+class CombatRules(NamedTuple):
+    """Combat settings. See the `game.combat` section of the config."""
+
+    max_rounds: int = 100
+    yield_health: float = 0.1
+    hit_chance: float = 0.75
+    min_hit_chance: float = 0.05
+    max_hit_chance: float = 0.95
+    skill_hit_factor: float = 0.003
+    skill_damage_factor: float = 0.005
+    crit_chance: float = 0.05
+    crit_multiplier: float = 1.5
+    armor_factor: float = 0.0012
+    max_armor_reduction: float = 0.8
+    stamina_cost: float = 10
+    exhausted_damage: float = 0.5
+
+
+class Combatant:
+    """Stat snapshot of a fighter.
+
+    A snapshot contains everything needed to resolve a fight, so fights are
+    resolved entirely in memory without any database queries.
+
+    Attributes:
+        name (str): Fighter name.
+        health (float): Health at the start of the fight.
+        stamina (float): Stamina at the start of the fight.
+        health_max (float): Maximum health, including all bonuses.
+        damage (float): Damage of the weapon or unarmed damage.
+        hands (int): The number of hands used by the weapon. 1 if unarmed.
+        skill (float): Level of the skill of the weapon.
+        block (float): Level of the block skill.
+        armor_rating (float): Total armor.
+
+    """
+
+    __slots__ = (
+        "name",
+        "health",
+        "stamina",
+        "health_max",
+        "damage",
+        "hands",
+        "skill",
+        "block",
+        "armor_rating",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        health: float,
+        stamina: float,
+        health_max: float,
+        damage: float,
+        hands: int = 1,
+        skill: float = 0,
+        block: float = 0,
+        armor_rating: float = 0,
+    ):
+        self.name = name
+        self.health = health
+        self.stamina = stamina
+        self.health_max = health_max
+        self.damage = damage
+        self.hands = hands
+        self.skill = skill
+        self.block = block
+        self.armor_rating = armor_rating
+
+    @staticmethod
+    def get_weapon_skill(weapon: Optional[dict]) -> Optional[str]:
+        """Returns the name of the skill used by the weapon.
+
+        Args:
+            weapon (Optional[dict]): Weapon with `attack_type` and `hands`.
+
+        Returns:
+            Optional[str]: Skill name or None for unarmed combat.
+
+        """
+        if not weapon:
+            return None
+        if weapon.get("attack_type") == "range":
+            return "archery"
+        return "two_handed" if weapon.get("hands") == 2 else "one_handed"
+
+    @classmethod
+    def from_stats(
+        cls,
+        name: str,
+        main: dict,
+        skills: dict,
+        unarmed_damage: float,
+        armor_rating: float = 0,
+        weapon: dict = None,
+        health: float = None,
+        stamina: float = None,
+    ) -> "Combatant":
+        """Creates a snapshot from character attributes.
+
+        Args:
+            name (str): Fighter name.
+            main (dict): Same as `Attributes.main`.
+            skills (dict): Same as `Attributes.skills`.
+            unarmed_damage (float): Same as `Attributes.unarmed_damage`.
+            armor_rating (:obj:`float`, optional): Total armor. Defaults to 0.
+            weapon (:obj:`dict`, optional): Weapon with `damage`, `hands` and
+                `attack_type`. Defaults to None, which means unarmed.
+            health (:obj:`float`, optional): Current health. Defaults to the
+                maximum.
+            stamina (:obj:`float`, optional): Current stamina. Defaults to the
+                maximum.
+
+        Returns:
+            Combatant: The snapshot.
+
+        """
+        health_max = main["health_max"] + main.get("health_buff", 0)
+        stamina_max = main["stamina_max"] + main.get("stamina_buff", 0)
+        skill = cls.get_weapon_skill(weapon)
+        return cls(
+            name=name,
+            health=health_max if health is None else health,
+            stamina=stamina_max if stamina is None else stamina,
+            health_max=health_max,
+            damage=weapon["damage"] if weapon else unarmed_damage,
+            hands=(weapon.get("hands") or 1) if weapon else 1,
+            skill=skills.get(skill, 0) if skill else 0,
+            block=skills.get("block", 0),
+            armor_rating=armor_rating,
+        )
+
+
+class DuelResult(NamedTuple):
+    """Result of a duel.
+
+    `winner` is 0 or 1, the index of the winning fighter, or None for a draw.
+    `health` and `stamina` are the final values of both fighters.
+    """
+
+    winner: Optional[int]
+    rounds: int
+    health: Tuple[float, float]
+    stamina: Tuple[float, float]
+
+
+def resolve_duel(
+    first: Combatant,
+    second: Combatant,
+    rng: random.Random,
+    rules: CombatRules = CombatRules(),
+) -> DuelResult:
+    """Resolves a duel.
+
+    Fighters take turns, the one with more stamina goes first. Every attack
+    costs stamina, an exhausted fighter hits weaker. A hit can miss depending
+    on the weapon skill of the attacker and the block skill of the defender,
+    and its damage is reduced by the armor of the defender. The duel ends
+    when a fighter drops to `yield_health` of their maximum health or after
+    `max_rounds` rounds, in which case it is a draw.
+
+    The snapshots are not modified, so the same snapshots can be reused for
+    many duels. The result depends only on the snapshots, the rules and the
+    state of `rng`.
+
+    Args:
+        first (Combatant): First fighter.
+        second (Combatant): Second fighter.
+        rng (random.Random): Random number generator.
+        rules (:obj:`CombatRules`, optional): Combat settings.
+
+    Returns:
+        DuelResult: Result of the duel.
+
+    """
+    fighters = (first, second)
+    health = [first.health, second.health]
+    stamina = [first.stamina, second.stamina]
+    yields = [fighter.health_max * rules.yield_health for fighter in fighters]
+    hit_chances = []
+    damages = []
+    costs = []
+    for attacker, defender in ((first, second), (second, first)):
+        chance = rules.hit_chance + (
+            (attacker.skill - defender.block) * rules.skill_hit_factor
+        )
+        hit_chances.append(min(rules.max_hit_chance, max(rules.min_hit_chance, chance)))
+        reduction = min(
+            rules.max_armor_reduction, defender.armor_rating * rules.armor_factor
+        )
+        damages.append(
+            attacker.damage
+            * (1 + attacker.skill * rules.skill_damage_factor)
+            * (1 - reduction)
+        )
+        costs.append(rules.stamina_cost * attacker.hands)
+
+    if stamina[0] == stamina[1]:
+        attacker = rng.randrange(2)
+    else:
+        attacker = 0 if stamina[0] > stamina[1] else 1
+    winner = None
+    rounds = 0
+    while rounds < rules.max_rounds:
+        rounds += 1
+        for _ in range(2):
+            defender = 1 - attacker
+            if rng.random() < hit_chances[attacker]:
+                damage = damages[attacker]
+                if stamina[attacker] >= costs[attacker]:
+                    stamina[attacker] -= costs[attacker]
+                else:
+                    damage *= rules.exhausted_damage
+                if rng.random() < rules.crit_chance:
+                    damage *= rules.crit_multiplier
+                health[defender] = max(0.0, health[defender] - damage)
+                if health[defender] <= yields[defender]:
+                    winner = attacker
+                    break
+            elif stamina[attacker] >= costs[attacker]:
+                stamina[attacker] -= costs[attacker]
+            attacker = defender
+        if winner is not None:
+            break
+    return DuelResult(winner, rounds, tuple(health), tuple(stamina))
+
+
+def simulate(
+    first: Combatant,
+    second: Combatant,
+    fights: int,
+    seed: int = None,
+    rules: CombatRules = CombatRules(),
+) -> Tuple[int, int, int]:
+    """Resolves many duels between the same fighters.
+
+    Args:
+        first (Combatant): First fighter.
+        second (Combatant): Second fighter.
+        fights (int): The number of duels.
+        seed (:obj:`int`, optional): Seed of the random number generator.
+        rules (:obj:`CombatRules`, optional): Combat settings.
+
+    Returns:
+        Tuple[int, int, int]: Wins of the first fighter, wins of the second
+        one and draws.
+
+    """
+    rng = random.Random(seed)
+    results = [0, 0, 0]
+    for _ in range(fights):
+        winner = resolve_duel(first, second, rng, rules).winner
+        results[2 if winner is None else winner] += 1
+    return results[0], results[1], results[2]
+
+
+def simulate_races(
+    races: dict, fights: int, seed: int = None, rules: CombatRules = CombatRules()
+) -> Dict[Tuple[str, str], Tuple[int, int, int]]:
+    """Resolves duels between unarmed characters of every pair of races.
+
+    Args:
+        races (dict): Same as the `game.races` section of the config.
+        fights (int): The number of duels for every pair.
+        seed (:obj:`int`, optional): Seed of the random number generator.
+        rules (:obj:`CombatRules`, optional): Combat settings.
+
+    Returns:
+        Dict[Tuple[str, str], Tuple[int, int, int]]: Results of `simulate` by
+        pair of race names.
+
+    """
+    fighters = {
+        name: Combatant.from_stats(
+            name, race["main"], race["skills"], race["unarmed_damage"]
+        )
+        for name, race in races.items()
+    }
+    rng = random.Random(seed)
+    return {
+        (first, second): simulate(
+            fighters[first], fighters[second], fights, rng.getrandbits(64), rules
+        )
+        for first in fighters
+        for second in fighters
+    }
@@ -0,0 +1,363 @@
+import asyncio
+import functools
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from mongoengine.connection import get_db
+from pymongo import CursorType, ReturnDocument
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+from redbot.core.bot import Red
+
+log = logging.getLogger("red.rpg.coordination")
+
+
+def get_process_id() -> str:
+    """Returns a unique ID of this bot process.
+
+    Returns:
+        str: Host name, process ID and a random suffix, so a restarted
+        process never reuses the leases of its predecessor.
+
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class Lease:
+    """Exclusive lease on a named resource, stored as a Mongo document.
+
+    The lease belongs to one owner until it expires. The owner renews it by
+    acquiring it again before that. Expiry is checked against the clock of
+    the server, so clock skew between bot hosts does not matter.
+
+    Attributes:
+        name (str): Resource name, the ID of the lease document.
+        owner (str): ID of the process that wants the lease.
+        ttl (float): Lease duration in seconds.
+        collection_name (str): Name of the lease collection.
+
+    """
+
+    def __init__(
+        self, name: str, owner: str, ttl: float, collection_name: str = "lease"
+    ):
+        self.name = name
+        self.owner = owner
+        self.ttl = ttl
+        self.collection_name = collection_name
+
+    @property
+    def collection(self):
+        """Collection: The lease collection of the current connection."""
+        return get_db()[self.collection_name]
+
+    def acquire(self) -> bool:
+        """Acquires or renews the lease.
+
+        Returns:
+            bool: Whether this owner holds the lease now.
+
+        """
+        expired = {"$expr": {"$lte": ["$expires_at", "$$NOW"]}}
+        try:
+            doc = self.collection.find_one_and_update(
+                {"_id": self.name, "$or": [{"owner": self.owner}, expired]},
+                [
+                    {
+                        "$set": {
+                            "owner": self.owner,
+                            "expires_at": {"$add": ["$$NOW", int(self.ttl * 1000)]},
+                        }
+                    }
+                ],
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            return False
+        return doc is not None and doc["owner"] == self.owner
+
+    def wait(self, timeout: float, interval: float = 0.05) -> bool:
+        """Waits until the lease is acquired.
+
+        Args:
+            timeout (float): Timeout in seconds.
+            interval (:obj:`float`, optional): Delay between attempts in
+                seconds.
+
+        Returns:
+            bool: Whether the lease was acquired.
+
+        """
+        deadline = time.monotonic() + timeout
+        while not self.acquire():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
+        return True
+
+    def release(self):
+        """Releases the lease, if this owner holds it."""
+        self.collection.delete_one({"_id": self.name, "owner": self.owner})
+
+
+class LeaseLock:
+    """Lock shared by the threads of this process and by all processes.
+
+    Used as a context manager, it takes a local lock first, so threads of one
+    process do not compete for the lease, and then the lease. With `lease`
+    set to None it is a plain thread lock.
+
+    Attributes:
+        lease (Optional[Lease]): Lease guarding the resource in all processes.
+        timeout (float): How long to wait for the lease in seconds.
+
+    """
+
+    def __init__(self, lease: Optional[Lease] = None, timeout: float = 5):
+        self.lease = lease
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self.lease is not None and not self.lease.wait(self.timeout):
+            self._lock.release()
+            raise LeaseTimeout(self.lease.name)
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if self.lease is not None:
+                self.lease.release()
+        finally:
+            self._lock.release()
+
+
+class LeaderElector:
+    """Elects one process to run the singleton jobs.
+
+    Every process tries to acquire the leader lease on every tick. The
+    process that holds it renews it; the others take it over once it
+    expires, e.g. when the leader has crashed. Ticks must be run at least
+    three times per `Lease.ttl`, so a slow tick does not lose the lease.
+
+    Attributes:
+        bot (Red): Bot object.
+        lease (Lease): Leader lease.
+        on_elected (Callable[[], None]): Called when this process becomes the
+            leader.
+        on_demoted (Callable[[], None]): Called when this process loses the
+            leadership.
+        is_leader (bool): This process is the leader.
+
+    """
+
+    def __init__(
+        self,
+        bot: Red,
+        lease: Lease,
+        on_elected: Callable[[], None],
+        on_demoted: Callable[[], None],
+    ):
+        self.bot = bot
+        self.lease = lease
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.is_leader = False
+
+    async def tick(self):
+        """Acquires or renews the leader lease.
+
+        A process that cannot reach the database is demoted at once, as its
+        lease may expire before the next tick.
+        """
+        try:
+            leader = await self.bot.loop.run_in_executor(None, self.lease.acquire)
+        except Exception:
+            self._set_leader(False)
+            raise
+        self._set_leader(leader)
+
+    def _set_leader(self, leader: bool):
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        log.info(f"Process {self.lease.owner} leader: {leader}")
+        if leader:
+            self.on_elected()
+        else:
+            self.on_demoted()
+
+    async def resign(self):
+        """Releases the leadership."""
+        if self.is_leader:
+            await self.bot.loop.run_in_executor(None, self.lease.release)
+            self._set_leader(False)
+
+
+class EventBus:
+    """Publish-subscribe between bot processes over a capped collection.
+
+    Every process appends events to the collection and tails it with a
+    tailable cursor in a worker thread. Events are dispatched on the event
+    loop to the handlers of their topic. A process does not receive its own
+    events, as it has already applied them. With `enabled` unset, publishing
+    does nothing, which is the single-process mode.
+
+    Attributes:
+        bot (Red): Bot object.
+        owner (str): ID of this process.
+        size (int): Size of the capped collection in bytes.
+        enabled (bool): Events are published.
+        collection_name (str): Name of the event collection.
+
+    """
+
+    def __init__(
+        self,
+        bot: Red,
+        owner: str,
+        size: int = 1048576,
+        enabled: bool = True,
+        collection_name: str = "event",
+    ):
+        self.bot = bot
+        self.owner = owner
+        self.size = size
+        self.enabled = enabled
+        self.collection_name = collection_name
+        self._handlers: Dict[str, List[Callable[[dict], None]]] = {}
+        self._stopped = threading.Event()
+
+    def subscribe(self, topic: str, handler: Callable[[dict], None]):
+        """Adds a handler of the topic.
+
+        Args:
+            topic (str): Topic name.
+            handler (Callable[[dict], None]): Called with the event data on the
+                event loop.
+        """
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def get_collection(self):
+        """Returns the event collection, creating it if necessary.
+
+        Returns:
+            Collection: Capped event collection.
+
+        """
+        db = get_db()
+        try:
+            return db.create_collection(
+                self.collection_name, capped=True, size=self.size
+            )
+        except CollectionInvalid:
+            return db[self.collection_name]
+
+    def publish(self, topic: str, **data):
+        """Publishes an event to the other processes.
+
+        Args:
+            topic (str): Topic name.
+            **data: Event data. Must be BSON-encodable.
+        """
+        if not self.enabled:
+            return
+        get_db()[self.collection_name].insert_one(
+            {"topic": topic, "source": self.owner, "data": data}
+        )
+
+    def post(self, topic: str, **data):
+        """Publishes an event from the event loop without blocking it.
+
+        Args:
+            topic (str): Topic name.
+            **data: Event data. Must be BSON-encodable.
+        """
+        if not self.enabled:
+            return
+        future = self.bot.loop.run_in_executor(
+            None, functools.partial(self.publish, topic, **data)
+        )
+        future.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            log.error("Failed to publish an event", exc_info=future.exception())
+
+    async def run(self):
+        """Tails the event collection until stopped."""
+        self._stopped.clear()
+        try:
+            await self.bot.loop.run_in_executor(None, self._tail)
+        finally:
+            self._stopped.set()
+
+    def stop(self):
+        """Stops tailing."""
+        self._stopped.set()
+
+    def _tail(self):
+        # ObjectIds of different processes are not ordered, so a new cursor
+        # resumes after the last seen event in $natural order: it skips the
+        # events up to that one. If the event has been evicted from the
+        # capped collection, every event read up to the end of the current
+        # data follows it, so they are delivered then.
+        collection = self.get_collection()
+        last = collection.find_one(sort=[("$natural", -1)], projection={"_id": True})
+        last_id = last["_id"] if last is not None else None
+        while not self._stopped.is_set():
+            cursor = collection.find(
+                cursor_type=CursorType.TAILABLE_AWAIT
+            ).max_await_time_ms(1000)
+            resume_id, skipped = last_id, []
+            while cursor.alive and not self._stopped.is_set():
+                event = cursor.try_next()
+                if event is None:
+                    if resume_id is not None:
+                        resume_id = None
+                        for event in skipped:
+                            last_id = event["_id"]
+                            self._receive(event)
+                        skipped = []
+                    continue
+                if resume_id is not None:
+                    if event["_id"] == resume_id:
+                        resume_id = None
+                        skipped = []
+                    else:
+                        skipped.append(event)
+                    continue
+                last_id = event["_id"]
+                self._receive(event)
+            if not self._stopped.is_set():
+                self._stopped.wait(1)
+
+    def _receive(self, event: dict):
+        if event.get("source") != self.owner:
+            self.bot.loop.call_soon_threadsafe(self._dispatch, event)
+
+    def _dispatch(self, event: dict):
+        for handler in self._handlers.get(event.get("topic"), []):
+            try:
+                handler(event.get("data", {}))
+            except Exception:
+                log.exception(f"Handler of event {event.get('topic')} failed")
+
+
+class LeaseTimeout(Exception):
+    """Lease was not acquired in time
+
+    Attributes:
+        name (str): Lease name.
+
+    """
+
+    def __init__(self, name: str):
+        self.name = name
@@ -0,0 +1,204 @@
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .transactions import Change
+
+
+class Recipe(NamedTuple):
+    """Crafting recipe.
+
+    `ingredients` contains `(item_id, count)` pairs sorted by item ID, so
+    recipes with the same ingredients have equal ingredient tuples.
+    """
+
+    output: int
+    count: int
+    ingredients: Tuple[Tuple[int, int], ...]
+    skill: float = 0
+
+    @classmethod
+    def from_config(cls, recipe: dict) -> "Recipe":
+        """Creates a recipe from the `game.crafting.recipes` section of the config.
+
+        Args:
+            recipe (dict): Recipe with `output`, `ingredients` by item ID and
+                optional `count` and `skill`.
+
+        Returns:
+            Recipe: The recipe.
+
+        """
+        return cls(
+            output=int(recipe["output"]),
+            count=int(recipe.get("count", 1)),
+            ingredients=tuple(
+                sorted(
+                    (int(item_id), int(count))
+                    for item_id, count in recipe["ingredients"].items()
+                )
+            ),
+            skill=recipe.get("skill", 0),
+        )
+
+
+class RecipeIndex:
+    """In-memory index of crafting recipes.
+
+    Recipes are indexed by their ingredient multiset, by output and by every
+    ingredient. The last one is an inverted index, so finding the recipes
+    that can be crafted from an inventory only touches the recipes that use
+    items from it.
+
+    Attributes:
+        recipes (List[Recipe]): All recipes.
+
+    """
+
+    def __init__(self):
+        self.recipes: List[Recipe] = []
+        self._by_ingredients: Dict[tuple, List[Recipe]] = {}
+        self._by_output: Dict[int, List[Recipe]] = {}
+        self._by_ingredient: Dict[int, List[Tuple[int, int]]] = {}
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def build(self, recipes: Iterable[dict]):
+        """Rebuilds the index.
+
+        Args:
+            recipes (Iterable[dict]): Same as the `game.crafting.recipes`
+                section of the config.
+        """
+        self.recipes = []
+        self._by_ingredients = {}
+        self._by_output = {}
+        self._by_ingredient = {}
+        for recipe in recipes:
+            self.add(Recipe.from_config(recipe))
+
+    def add(self, recipe: Recipe):
+        """Adds the recipe to the index.
+
+        Args:
+            recipe (Recipe): The recipe.
+        """
+        index = len(self.recipes)
+        self.recipes.append(recipe)
+        self._by_ingredients.setdefault(recipe.ingredients, []).append(recipe)
+        self._by_output.setdefault(recipe.output, []).append(recipe)
+        for item_id, count in recipe.ingredients:
+            self._by_ingredient.setdefault(item_id, []).append((index, count))
+
+    def find(self, ingredients: Dict[int, int]) -> List[Recipe]:
+        """Returns the recipes with exactly the given ingredients.
+
+        Args:
+            ingredients (Dict[int, int]): The number of items by item ID.
+
+        Returns:
+            List[Recipe]: Recipes.
+
+        """
+        return self._by_ingredients.get(tuple(sorted(ingredients.items())), [])
+
+    def get_recipes(self, output: int) -> List[Recipe]:
+        """Returns the recipes of the item.
+
+        Args:
+            output (int): Item ID of the crafted item.
+
+        Returns:
+            List[Recipe]: Recipes.
+
+        """
+        return self._by_output.get(output, [])
+
+    def get_craftable(
+        self, counts: Dict[int, int], skill: float = 100
+    ) -> List[Tuple[Recipe, int]]:
+        """Returns the recipes that can be crafted from the items.
+
+        Args:
+            counts (Dict[int, int]): The number of items by item ID.
+            skill (:obj:`float`, optional): Level of the smithing skill.
+                Defaults to 100.
+
+        Returns:
+            List[Tuple[Recipe, int]]: Recipes with the number of times they
+            can be crafted, sorted by output.
+
+        """
+        matched = Counter()
+        for item_id, count in counts.items():
+            for index, need in self._by_ingredient.get(item_id, ()):
+                if count >= need:
+                    matched[index] += 1
+        craftable = []
+        for index, matches in matched.items():
+            recipe = self.recipes[index]
+            if matches == len(recipe.ingredients) and skill >= recipe.skill:
+                times = min(
+                    counts[item_id] // need for item_id, need in recipe.ingredients
+                )
+                craftable.append((recipe, times))
+        craftable.sort(key=lambda pair: (pair[0].output, pair[0].ingredients))
+        return craftable
+
+
+def get_temper(skill: float, step: float, max_temper: int) -> Optional[int]:
+    """Returns tempering of an item crafted with the given skill.
+
+    Args:
+        skill (float): Level of the smithing skill.
+        step (float): Skill levels per tempering level.
+        max_temper (int): Maximum tempering.
+
+    Returns:
+        Optional[int]: Tempering or None, if the item is not tempered.
+
+    """
+    temper = min(max_temper, int(skill // step))
+    return temper or None
+
+
+def get_craft_change(
+    member_id: str,
+    recipe: Recipe,
+    items: dict,
+    times: int = 1,
+    maker: str = None,
+    temper: int = None,
+) -> Change:
+    """Returns the inventory change of crafting.
+
+    Only plain stacks, without a maker and tempering, are used as
+    ingredients. The change is applied with `transactions.apply_change`,
+    which removes the ingredients and adds the crafted items in one atomic
+    update of the inventory.
+
+    Args:
+        member_id (str): Member ID of the crafter.
+        recipe (Recipe): The recipe.
+        items (dict): `Item` documents by item ID of the output and all the
+            ingredients.
+        times (:obj:`int`, optional): How many times to craft. Defaults to 1.
+        maker (:obj:`str`, optional): Name of the crafter. Defaults to None.
+        temper (:obj:`int`, optional): Tempering of the crafted items.
+            Defaults to None.
+
+    Returns:
+        Change: The change.
+
+    """
+    return Change(
+        member_id,
+        0,
+        (
+            *(
+                (items[item_id], -count * times, None, None)
+                for item_id, count in recipe.ingredients
+            ),
+            (items[recipe.output], recipe.count * times, maker, temper),
+        ),
+    )
@@ -0,0 +1,367 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from mongoengine import connect, disconnect, get_connection
+from pymongo import monitoring
+from pymongo.read_preferences import (
+    Nearest,
+    Primary,
+    PrimaryPreferred,
+    Secondary,
+    SecondaryPreferred,
+)
+from redbot.core.bot import Red
+
+log = logging.getLogger("red.rpg.database")
+
+# Name of the task that closes the connection on unload. A reloaded cog waits
+# for it, as mongoengine shares one connection between both instances.
+CLOSE_TASK_NAME = "rpg-database-close"
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection pool listener that tracks pool usage.
+
+    Events are delivered from driver threads, so the counters are guarded by
+    a lock.
+
+    Attributes:
+        max_pool_size (int): Maximum number of connections per server.
+        checked_out (Dict[tuple, int]): Connections in use by server address.
+        peak_checked_out (int): Maximum number of connections in use at once
+            on one server since the last reset.
+        waiting (int): Threads waiting for a connection.
+        peak_waiting (int): Maximum number of waiting threads since the last
+            reset.
+        timeouts (int): Checkouts failed because the wait queue timed out.
+        failures (int): Checkouts failed for other reasons.
+
+    """
+
+    def __init__(self, max_pool_size: int):
+        self.max_pool_size = max_pool_size
+        self.checked_out: Dict[tuple, int] = {}
+        self.peak_checked_out = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.timeouts = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    @property
+    def saturation(self) -> float:
+        """float: Peak share of the pool in use since the last reset."""
+        return self.peak_checked_out / self.max_pool_size if self.max_pool_size else 0
+
+    def reset_peaks(self):
+        """Resets the peak values to the current ones."""
+        with self._lock:
+            self.peak_checked_out = max(self.checked_out.values(), default=0)
+            self.peak_waiting = self.waiting
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting -= 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.timeouts += 1
+            else:
+                self.failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.waiting -= 1
+            count = self.checked_out.get(event.address, 0) + 1
+            self.checked_out[event.address] = count
+            self.peak_checked_out = max(self.peak_checked_out, count)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out[event.address] = max(
+                0, self.checked_out.get(event.address, 0) - 1
+            )
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.checked_out.pop(event.address, None)
+
+    def pool_closed(self, event):
+        self.pool_cleared(event)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+
+class ReadPolicy:
+    """Per-query read preference policy.
+
+    Read-only queries go to secondaries whose replication lag is at most
+    `max_staleness` seconds. A member who has just changed data reads from
+    the primary for `own_writes_window` seconds after the change, so they
+    always see their own writes.
+
+    Attributes:
+        read_preference (str): Mode of read-only queries, e.g.
+            `secondaryPreferred`.
+        max_staleness (int): Maximum replication lag of a secondary in
+            seconds. The server requires at least 90.
+        own_writes_window (float): How long the writer reads from the primary
+            in seconds. Should not be less than `max_staleness`.
+        primary (Primary): Read preference of queries that must not read
+            stale data.
+
+    """
+
+    def __init__(
+        self,
+        read_preference: str = "secondaryPreferred",
+        max_staleness: int = 90,
+        own_writes_window: float = 90,
+    ):
+        self.read_preference = read_preference
+        self.max_staleness = max_staleness
+        self.own_writes_window = own_writes_window
+        self._writes: Dict[str, float] = {}
+        self.primary = Primary()
+        self._secondary = get_read_preference(
+            read_preference, max_staleness=max_staleness
+        )
+
+    def mark_write(self, *member_ids: str):
+        """Records that the members have just changed data.
+
+        Args:
+            *member_ids (str): Member IDs of the writers.
+        """
+        deadline = time.monotonic() + self.own_writes_window
+        for member_id in member_ids:
+            self._writes[member_id] = deadline
+        if len(self._writes) > 1000:
+            self.prune()
+
+    def prune(self):
+        """Forgets writers whose window has expired."""
+        now = time.monotonic()
+        self._writes = {
+            member_id: deadline
+            for member_id, deadline in self._writes.items()
+            if deadline > now
+        }
+
+    def has_written(self, member_id: str) -> bool:
+        """Returns whether the member has changed data recently.
+
+        Args:
+            member_id (str): Member ID.
+
+        Returns:
+            bool: The member is within their own writes window.
+
+        """
+        deadline = self._writes.get(member_id)
+        return deadline is not None and deadline > time.monotonic()
+
+    def get(self, *member_ids: str):
+        """Returns the read preference of a read-only query.
+
+        Args:
+            *member_ids (str): Member IDs of the reader and of the characters
+                the query reads, e.g. the target of `inv @user`, which may
+                have been changed by someone else's command.
+
+        Returns:
+            ServerMode: Primary if any of the members has written recently,
+            otherwise the read preference of read-only queries.
+
+        """
+        now = time.monotonic()
+        for member_id in member_ids:
+            deadline = self._writes.get(member_id)
+            if deadline is not None:
+                if deadline > now:
+                    return self.primary
+                del self._writes[member_id]
+        return self._secondary
+
+
+def get_read_preference(name: str, **kwargs):
+    """Returns a read preference by its mode name.
+
+    Args:
+        name (str): Mode name, e.g. `secondaryPreferred`.
+        **kwargs: Options of the read preference, e.g. `max_staleness`.
+
+    Returns:
+        ServerMode: Read preference.
+
+    """
+    mode = READ_PREFERENCES[name]
+    return mode() if mode is Primary else mode(**kwargs)
+
+
+class Database:
+    """MongoDB connection manager.
+
+    The connection is opened in a worker thread, so the event loop is not
+    blocked while the server is selected, and `ready` is set once the server
+    has answered a ping. The pool is monitored with `PoolMonitor`.
+
+    Attributes:
+        bot (Red): Bot object.
+        settings (dict): Same as the `database` section of the config.
+        ready (asyncio.Event): Set while the connection is open.
+        monitor (PoolMonitor): Pool usage.
+        reads (ReadPolicy): Read preference policy of read-only queries.
+
+    """
+
+    def __init__(self, bot: Red, settings: dict):
+        self.bot = bot
+        self.settings = settings
+        self.ready = asyncio.Event()
+        self.monitor = PoolMonitor(settings.max_pool_size)
+        self.reads = ReadPolicy(
+            settings.reads.read_preference,
+            settings.reads.max_staleness,
+            settings.reads.own_writes_window,
+        )
+
+    def connect(self):
+        """Opens the connection and waits for the server."""
+        settings = self.settings
+        connect(
+            db=settings.db,
+            host=settings.host,
+            port=settings.port,
+            username=settings.user,
+            password=settings.password,
+            maxPoolSize=settings.max_pool_size,
+            minPoolSize=settings.min_pool_size,
+            serverSelectionTimeoutMS=settings.server_selection_timeout,
+            connectTimeoutMS=settings.connect_timeout,
+            socketTimeoutMS=settings.socket_timeout,
+            waitQueueTimeoutMS=settings.wait_queue_timeout,
+            w=settings.write_concern.w,
+            journal=settings.write_concern.journal,
+            read_preference=get_read_preference(settings.read_preference),
+            event_listeners=[self.monitor],
+        )
+        get_connection().admin.command("ping")
+
+    async def start(self):
+        """Opens the connection without blocking the event loop.
+
+        If the previous instance of the cog is still closing the connection,
+        waits for it first.
+        """
+        closing = [
+            task for task in asyncio.all_tasks() if task.get_name() == CLOSE_TASK_NAME
+        ]
+        if closing:
+            await asyncio.wait(closing)
+        await self.bot.loop.run_in_executor(None, self.connect)
+        self.ready.set()
+
+    async def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Waits until the connection is open.
+
+        Args:
+            timeout (:obj:`float`, optional): Timeout in seconds. Defaults to
+                None, which means no timeout.
+
+        Returns:
+            bool: Whether the connection is open.
+
+        """
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def close(self):
+        """Closes the connection."""
+        self.ready.clear()
+        disconnect()
+
+    def close_after(self, func: Callable[[], Awaitable]) -> asyncio.Task:
+        """Closes the connection in the background after the last writes.
+
+        Args:
+            func (Callable[[], Awaitable]): Coroutine function that does the
+                last writes. The connection is closed even if it fails.
+
+        Returns:
+            asyncio.Task: The task closing the connection.
+
+        """
+
+        async def close():
+            try:
+                await func()
+            finally:
+                self.ready.clear()
+                await self.bot.loop.run_in_executor(None, disconnect)
+
+        return self.bot.loop.create_task(close(), name=CLOSE_TASK_NAME)
+
+    async def check_pool(self):
+        """Reports pool saturation since the previous check."""
+        monitor = self.monitor
+        if monitor.saturation >= self.settings.saturation_threshold:
+            log.warning(
+                f"Connection pool is saturated: {monitor.peak_checked_out} of "
+                f"{monitor.max_pool_size} connections in use, "
+                f"{monitor.peak_waiting} waiting, {monitor.timeouts} timeouts"
+            )
+        monitor.reset_peaks()
+
+    def format_stats(self) -> str:
+        """Returns pool usage as text.
+
+        Returns:
+            str: Pool usage.
+
+        """
+        monitor = self.monitor
+        in_use = ", ".join(
+            f"{host}:{port} {count}"
+            for (host, port), count in sorted(monitor.checked_out.items())
+        )
+        return (
+            f"ready: {self.ready.is_set()}\n"
+            f"max pool size: {monitor.max_pool_size}\n"
+            f"in use: {in_use or 0}\n"
+            f"peak in use: {monitor.peak_checked_out} "
+            f"({monitor.saturation:.0%})\n"
+            f"waiting: {monitor.waiting} (peak {monitor.peak_waiting})\n"
+            f"checkout timeouts: {monitor.timeouts}\n"
+            f"checkout failures: {monitor.failures}"
+        )
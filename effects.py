@@ -0,0 +1,259 @@
+import asyncio
+import heapq
+import random
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from redbot.core.bot import Red
+
+# Kinds of effects. Equipment effects never expire and are replaced when the
+# equipment changes. Diseases can be resisted with `disease_resist`.
+POTION = "potion"
+BUFF = "buff"
+DEBUFF = "debuff"
+DISEASE = "disease"
+EQUIPMENT = "equipment"
+
+
+def make_effect(
+    effect_id: str,
+    name: str,
+    modifiers: dict,
+    kind: str = BUFF,
+    duration: float = None,
+    now: float = None,
+) -> dict:
+    """Returns an effect as it is stored in `Attributes.effects`.
+
+    Args:
+        effect_id (str): Effect ID. Adding an effect with the same ID replaces
+            the old one.
+        name (str): Effect name.
+        modifiers (dict): Values added to the attributes by attribute name.
+            An attribute is looked up in `main`, then in `resists`, then in
+            `skills`.
+        kind (:obj:`str`, optional): Effect kind. Defaults to `buff`.
+        duration (:obj:`float`, optional): Duration in seconds. Defaults to
+            None, which means the effect does not expire.
+        now (:obj:`float`, optional): Current UNIX time. Defaults to the
+            current time.
+
+    Returns:
+        dict: The effect.
+
+    """
+    if duration is not None and now is None:
+        now = time.time()
+    return {
+        "id": effect_id,
+        "name": name,
+        "kind": kind,
+        "modifiers": dict(modifiers),
+        "expires_at": None if duration is None else now + duration,
+    }
+
+
+def is_active(effect: dict, now: float) -> bool:
+    """Returns whether the effect has not expired yet.
+
+    Args:
+        effect (dict): The effect.
+        now (float): Current UNIX time.
+
+    Returns:
+        bool: The effect is active or not.
+
+    """
+    expires_at = effect.get("expires_at")
+    return expires_at is None or expires_at > now
+
+
+def get_effective_stats(
+    main: dict, resists: dict, skills: dict, effects: Iterable[dict], now: float
+) -> Tuple[dict, dict, dict, float]:
+    """Applies the active effects to the attributes.
+
+    Args:
+        main (dict): Same as `Attributes.main`.
+        resists (dict): Same as `Attributes.resists`.
+        skills (dict): Same as `Attributes.skills`.
+        effects (Iterable[dict]): Effects.
+        now (float): Current UNIX time.
+
+    Returns:
+        Tuple[dict, dict, dict, float]: Effective main attributes, resists
+        and skills, and the time the first active effect expires, which is
+        infinity if none of them expires. The given dicts are returned as
+        they are if there are no active effects.
+
+    """
+    active = [effect for effect in effects if is_active(effect, now)]
+    if not active:
+        return main, resists, skills, float("inf")
+    main, resists, skills = dict(main), dict(resists), dict(skills)
+    for effect in active:
+        for attribute, value in effect.get("modifiers", {}).items():
+            for stats in (main, resists, skills):
+                if attribute in stats:
+                    stats[attribute] += value
+                    break
+    valid_until = min(
+        (effect["expires_at"] for effect in active if effect.get("expires_at")),
+        default=float("inf"),
+    )
+    return main, resists, skills, valid_until
+
+
+def find_effect(effects: Iterable[dict], effect_id: str) -> Optional[dict]:
+    """Returns the effect with the given ID.
+
+    Args:
+        effects (Iterable[dict]): Effects.
+        effect_id (str): Effect ID.
+
+    Returns:
+        Optional[dict]: The effect or None, if it is not found.
+
+    """
+    return next((effect for effect in effects if effect["id"] == effect_id), None)
+
+
+def resists_disease(resists: dict, rng: random.Random = random) -> bool:
+    """Rolls a disease resistance check.
+
+    Args:
+        resists (dict): Effective resists. Like the other resists,
+            `disease_resist` is a multiplier: the chance to catch a disease,
+            from 1 for no resistance to 0 for immunity.
+        rng (:obj:`random.Random`, optional): Random number generator.
+
+    Returns:
+        bool: The disease is resisted or not.
+
+    """
+    return rng.random() >= resists.get("disease_resist", 1)
+
+
+class EffectScheduler:
+    """Class to remove timed effects when they expire.
+
+    Expiry times of all timed effects are kept in one min-heap. The scheduler
+    sleeps until the first of them, or until an effect that expires earlier
+    is pushed, and then removes all expired effects with one bulk write.
+    Characters that lose an effect are flagged for regeneration, which clamps
+    their pools to the new maximums.
+
+    Attributes:
+        bot (Red): Bot object.
+        character_class (type): Character document class.
+
+    """
+
+    def __init__(self, bot: Red, character_class: type):
+        self.bot = bot
+        self.character_class = character_class
+        self._heap: List[Tuple[float, str, str]] = []
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, member_id: str, effect: dict):
+        """Schedules the removal of the effect.
+
+        Args:
+            member_id (str): Member ID of the character.
+            effect (dict): The effect. Effects that never expire are ignored.
+        """
+        expires_at = effect.get("expires_at")
+        if expires_at is None:
+            return
+        heapq.heappush(self._heap, (expires_at, member_id, effect["id"]))
+        if self._heap[0][0] == expires_at:
+            self._wakeup.set()
+
+    def load(self):
+        """Schedules all timed effects stored in the database."""
+        pipeline = [
+            {"$match": {"attributes.effects.expires_at": {"$gt": 0}}},
+            {"$unwind": "$attributes.effects"},
+            {"$match": {"attributes.effects.expires_at": {"$gt": 0}}},
+            {
+                "$project": {
+                    "id": "$attributes.effects.id",
+                    "expires_at": "$attributes.effects.expires_at",
+                }
+            },
+        ]
+        heap = [
+            (doc["expires_at"], doc["_id"], doc["id"])
+            for doc in self.character_class._get_collection().aggregate(pipeline)
+        ]
+        heap.extend(self._heap)
+        heapq.heapify(heap)
+        self._heap = heap
+
+    async def run(self):
+        """Removes expired effects until the bot is closed.
+
+        The task supervisor runs this and cancels it on unload.
+        """
+        await self.bot.wait_until_ready()
+        await self.bot.loop.run_in_executor(None, self.load)
+        while not self.bot.is_closed():
+            self._wakeup.clear()
+            now = time.time()
+            if not self._heap or self._heap[0][0] > now:
+                timeout = self._heap[0][0] - now if self._heap else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            due = self._pop_due(now)
+            await self.bot.loop.run_in_executor(None, self.expire, due, now)
+
+    def _pop_due(self, now: float) -> Dict[str, List[str]]:
+        """Pops expired effects from the heap and groups them by member ID."""
+        due = {}
+        while self._heap and self._heap[0][0] <= now:
+            _, member_id, effect_id = heapq.heappop(self._heap)
+            due.setdefault(member_id, []).append(effect_id)
+        return due
+
+    def expire(self, due: Dict[str, List[str]], now: float) -> int:
+        """Removes the expired effects from the database.
+
+        Effects that were renewed after being scheduled are left as they are.
+
+        Args:
+            due (Dict[str, List[str]]): Effect IDs by member ID.
+            now (float): Current UNIX time.
+
+        Returns:
+            int: The number of changed characters.
+
+        """
+        updates = [
+            UpdateOne(
+                {"_id": member_id},
+                {
+                    "$pull": {
+                        "attributes.effects": {
+                            "id": {"$in": effect_ids},
+                            "expires_at": {"$lte": now},
+                        }
+                    },
+                    "$set": {"attributes.needs_regen": True},
+                    "$currentDate": {"updated_at": True},
+                },
+            )
+            for member_id, effect_ids in due.items()
+        ]
+        if not updates:
+            return 0
+        result = self.character_class._get_collection().bulk_write(
+            updates, ordered=False
+        )
+        return result.modified_count
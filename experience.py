@@ -0,0 +1,154 @@
+from bisect import bisect_right
+from typing import Dict, List, NamedTuple, Optional
+
+from pymongo import UpdateOne
+
+
+class Progress(NamedTuple):
+    """Result of an experience grant for one character."""
+
+    member_id: str
+    xp: int
+    lvl: int
+    old_lvl: int
+
+
+class ExperienceEngine:
+    """Class to grant experience and level up characters.
+
+    `Character.xp` is the total experience of the character. The experience
+    needed to reach every level is precomputed into a table, so the level of
+    any amount of experience is a binary search in it, and the levels of a
+    whole batch are computed in one vectorized call.
+
+    Attributes:
+        character_class (type): Character document class.
+        thresholds (List[int]): Total experience needed to reach each level.
+            The first element corresponds to level 1.
+        batch_size (int): The number of characters in one bulk write.
+
+    """
+
+    def __init__(
+        self,
+        character_class: type,
+        base_xp: int = 100,
+        exponent: float = 1.5,
+        max_lvl: int = 100,
+        batch_size: int = 1000,
+    ):
+        self.character_class = character_class
+        self.thresholds = [
+            round(base_xp * (lvl - 1) ** exponent) for lvl in range(1, max_lvl + 1)
+        ]
+        self.batch_size = batch_size
+
+    @property
+    def max_lvl(self) -> int:
+        """int: Maximum level."""
+        return len(self.thresholds)
+
+    def get_level(self, xp: int) -> int:
+        """Returns the level for the total experience.
+
+        Args:
+            xp (int): Total experience.
+
+        Returns:
+            int: Level.
+
+        """
+        return bisect_right(self.thresholds, xp)
+
+    def get_next_threshold(self, lvl: int) -> Optional[int]:
+        """Returns the total experience needed for the next level.
+
+        Args:
+            lvl (int): Current level.
+
+        Returns:
+            Optional[int]: Experience or None, if the level is maximum.
+
+        """
+        if lvl >= self.max_lvl:
+            return None
+        return self.thresholds[lvl]
+
+    def grant(self, grants: Dict[str, float]) -> List[Progress]:
+        """Grants experience to characters.
+
+        The amounts are multiplied by `Character.xp_factor` of each character.
+        Every batch is read with one projected query and incremented with one
+        bulk write. The levels are then computed from the experience read back
+        after the increment and raised with `$max`, so a concurrent grant is
+        never lost and the grant that writes last sets the level from the
+        total of both. Unregistered members are skipped.
+
+        Args:
+            grants (Dict[str, float]): Experience amounts by member ID.
+                Amounts below zero are ignored.
+
+        Returns:
+            List[Progress]: New experience and levels of the characters that
+            received experience, including grants made concurrently.
+
+        """
+        # numpy is imported on first use, so loading the cog does not pay for
+        # it.
+        import numpy as np
+
+        collection = self.character_class._get_collection()
+        thresholds = np.array(self.thresholds, dtype=np.int64)
+        member_ids = list(grants)
+        progress = []
+        for start in range(0, len(member_ids), self.batch_size):
+            docs = list(
+                collection.find(
+                    {"_id": {"$in": member_ids[start : start + self.batch_size]}},
+                    {"lvl": True, "xp_factor": True},
+                )
+            )
+            if not docs:
+                continue
+            ids = [doc["_id"] for doc in docs]
+            old_lvl = {doc["_id"]: doc.get("lvl", 1) for doc in docs}
+            factor = np.array([doc.get("xp_factor", 1.0) for doc in docs])
+            amounts = np.array([grants[member_id] for member_id in ids], dtype=float)
+            gained = np.maximum(np.rint(amounts * factor), 0).astype(np.int64)
+            rows = np.flatnonzero(gained)
+            if not len(rows):
+                continue
+            collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": ids[row]},
+                        {
+                            "$inc": {"xp": int(gained[row])},
+                            "$currentDate": {"updated_at": True},
+                        },
+                    )
+                    for row in rows
+                ],
+                ordered=False,
+            )
+            docs = list(
+                collection.find(
+                    {"_id": {"$in": [ids[row] for row in rows]}},
+                    {"xp": True, "lvl": True},
+                )
+            )
+            ids = [doc["_id"] for doc in docs]
+            xp = np.array([doc.get("xp", 0) for doc in docs], dtype=np.int64)
+            lvl = np.array([doc.get("lvl", 1) for doc in docs], dtype=np.int64)
+            new_lvl = np.maximum(lvl, np.searchsorted(thresholds, xp, "right"))
+            updates = [
+                UpdateOne({"_id": ids[row]}, {"$max": {"lvl": int(new_lvl[row])}})
+                for row in np.flatnonzero(new_lvl > lvl)
+            ]
+            if updates:
+                collection.bulk_write(updates, ordered=False)
+            progress += [
+                Progress(member_id, int(xp[row]), int(new_lvl[row]), old_lvl[member_id])
+                for row, member_id in enumerate(ids)
+            ]
+        return progress
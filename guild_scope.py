@@ -0,0 +1,62 @@
+from typing import List, Optional
+
+ARCHIVE_COLLECTION = "character_archive"
+
+
+def get_char_key(member_id: int, guild_id: Optional[int] = None) -> str:
+    """Returns the primary key of a character.
+
+    A global character is keyed by the member ID. A guild character is keyed
+    by the guild ID and the member ID, so a member can have one character in
+    every guild. All other code treats the key as an opaque member ID.
+
+    Args:
+        member_id (int): Member ID.
+        guild_id (:obj:`int`, optional): Guild ID of a guild character.
+            Defaults to None, which means a global character.
+
+    Returns:
+        str: Character key.
+
+    """
+    if guild_id is None:
+        return str(member_id)
+    return f"{guild_id}:{member_id}"
+
+
+def remove_guild_characters(
+    collection, guild_id: int, archive: bool = True
+) -> List[str]:
+    """Removes all characters of a guild.
+
+    The characters are found by the `guild_id` index, so the cost depends on
+    the size of the guild only. Archived characters are merged into the
+    archive collection before they are deleted and can be restored from it.
+
+    Args:
+        collection (Collection): Character collection.
+        guild_id (int): Guild ID.
+        archive (:obj:`bool`, optional): Move the characters to the archive
+            instead of dropping them. Defaults to True.
+
+    Returns:
+        List[str]: Keys of the removed characters.
+
+    """
+    keys = [
+        doc["_id"] for doc in collection.find({"guild_id": str(guild_id)}, {"_id": 1})
+    ]
+    if not keys:
+        return []
+    # Characters created meanwhile are left alone, as their orders and cached
+    # documents are not cleaned up by the caller.
+    query = {"_id": {"$in": keys}}
+    if archive:
+        collection.aggregate(
+            [
+                {"$match": query},
+                {"$merge": {"into": ARCHIVE_COLLECTION, "whenMatched": "replace"}},
+            ]
+        )
+    collection.delete_many(query)
+    return keys
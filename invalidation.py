@@ -0,0 +1,337 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from mongoengine.connection import get_db
+from pymongo.errors import OperationFailure
+from redbot.core.bot import Red
+
+log = logging.getLogger("red.rpg.invalidation")
+
+# Server error codes: change streams are not supported on a standalone server,
+# and the resume token is no longer in the oplog.
+CHANGE_STREAMS_NOT_SUPPORTED = (40573,)
+RESUME_TOKEN_LOST = (260, 280, 286)
+INVALIDATING_OPERATIONS = ("drop", "rename", "dropDatabase", "invalidate")
+
+
+class ServerTimestamps:
+    """Document mixin that stamps `updated_at` with the server clock on save.
+
+    Atomic updates set the field with `$currentDate`, so saved documents must
+    use the same clock, or `ChangeWatcher` polling misses changes stamped by a
+    client whose clock is behind.
+    """
+
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        self._get_collection().update_one(
+            {"_id": self.pk}, {"$currentDate": {"updated_at": True}}
+        )
+        return result
+
+
+class DocumentCache:
+    """LRU cache of documents by ID.
+
+    The cache is used from the event loop and from worker threads, so it is
+    guarded by a lock. A document read while it was being evicted is older
+    than the change that evicted it, so `put` takes the generation returned
+    by `get_generation` before the read and rejects such documents.
+
+    Attributes:
+        max_size (int): Maximum number of documents.
+        hits (int): The number of lookups that found a document.
+        misses (int): The number of lookups that did not.
+
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._docs: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._generation = 0
+        # Generations of the last evictions by key, and the newest generation
+        # that has been forgotten to bound the memory.
+        self._evicted: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._forgotten = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns the cached document.
+
+        Args:
+            key (Hashable): Document ID.
+
+        Returns:
+            Optional[Any]: The document or None, if it is not cached.
+
+        """
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is None:
+                self.misses += 1
+                return None
+            self._docs.move_to_end(key)
+            self.hits += 1
+            return doc
+
+    def get_generation(self) -> int:
+        """Returns the current generation, to be taken before a read.
+
+        Returns:
+            int: Generation.
+
+        """
+        with self._lock:
+            return self._generation
+
+    def put(self, key: Hashable, doc: Any, generation: Optional[int] = None) -> bool:
+        """Caches the document, evicting the least recently used one.
+
+        Args:
+            key (Hashable): Document ID.
+            doc (Any): The document.
+            generation (:obj:`int`, optional): Result of
+                `DocumentCache.get_generation` before the document was read.
+                The document is not cached if it has been evicted since.
+
+        Returns:
+            bool: The document is cached or not.
+
+        """
+        with self._lock:
+            if generation is not None and generation < max(
+                self._evicted.get(key, 0), self._forgotten
+            ):
+                return False
+            self._docs[key] = doc
+            self._docs.move_to_end(key)
+            if len(self._docs) > self.max_size:
+                self._docs.popitem(last=False)
+            return True
+
+    def evict(self, *keys: Hashable):
+        """Removes the documents from the cache.
+
+        Args:
+            *keys (Hashable): Document IDs.
+        """
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._docs.pop(key, None)
+                self._evicted[key] = self._generation
+                self._evicted.move_to_end(key)
+            while len(self._evicted) > self.max_size:
+                self._forgotten = self._evicted.popitem(last=False)[1]
+
+    def clear(self):
+        """Removes all documents from the cache."""
+        with self._lock:
+            self._generation += 1
+            self._docs.clear()
+            self._evicted.clear()
+            self._forgotten = self._generation
+
+
+class ChangeWatcher:
+    """Reports changes of a collection made by anyone, including other
+    processes and admins editing the database directly.
+
+    The collection is tailed with a change stream. On a standalone server,
+    which has no change streams, it is polled for documents with a newer
+    `updated_at`, so writers must keep that field up to date there with the
+    server clock, and deletions are not seen. A change stamped before an
+    earlier one may commit after it, so every poll also reads the last
+    `poll_overlap` seconds again and skips the changes already reported.
+
+    The position in the stream is persisted, so after a restart the watcher
+    resumes where it stopped instead of asking for a full reload. Change
+    streams are tried on every start, so a polling position is dropped once
+    the server supports them. A full reload is requested only when the
+    position is unknown, lost or a polling one given up that way.
+
+    Changes are reported in batches on the event loop at most `max_delay`
+    seconds after they are seen.
+
+    Attributes:
+        bot (Red): Bot object.
+        name (str): Watcher name, the ID of its position document.
+        collection_name (str): Name of the watched collection.
+        on_change (Callable[[List[Any]], None]): Called with IDs of changed
+            or deleted documents.
+        on_reset (Callable[[], None]): Called when changes may have been
+            missed and all cached documents must be dropped.
+        max_delay (float): Maximum delay of reports and position saves in
+            seconds.
+        poll_interval (float): Polling interval of a standalone server in
+            seconds.
+        poll_overlap (float): How far back every poll reads in seconds.
+            Must exceed the time between stamping and committing a change.
+        position_collection_name (str): Name of the position collection.
+
+    """
+
+    def __init__(
+        self,
+        bot: Red,
+        name: str,
+        collection_name: str,
+        on_change: Callable[[List[Any]], None],
+        on_reset: Callable[[], None],
+        max_delay: float = 1,
+        poll_interval: float = 5,
+        poll_overlap: float = 30,
+        position_collection_name: str = "watch_position",
+    ):
+        self.bot = bot
+        self.name = name
+        self.collection_name = collection_name
+        self.on_change = on_change
+        self.on_reset = on_reset
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.poll_overlap = poll_overlap
+        self.position_collection_name = position_collection_name
+        self._stopped = threading.Event()
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix=f"watch-{name}")
+
+    async def run(self):
+        """Watches the collection until stopped."""
+        self._stopped.clear()
+        try:
+            await self.bot.loop.run_in_executor(self._executor, self._watch)
+        finally:
+            self._stopped.set()
+
+    def stop(self):
+        """Stops watching."""
+        self._stopped.set()
+        self._executor.shutdown(wait=False)
+
+    def load_position(self) -> Optional[dict]:
+        """Returns the saved position.
+
+        Returns:
+            Optional[dict]: `token` with the resume token of the change stream
+            or `updated_at` with the time of the last polled change. None if
+            no position is saved.
+
+        """
+        return get_db()[self.position_collection_name].find_one({"_id": self.name})
+
+    def save_position(self, **position):
+        """Saves the position.
+
+        Args:
+            **position: Same as the result of `ChangeWatcher.load_position`.
+        """
+        get_db()[self.position_collection_name].replace_one(
+            {"_id": self.name}, {"_id": self.name, **position}, upsert=True
+        )
+
+    def get_server_time(self) -> datetime:
+        """Returns the current time of the server.
+
+        Returns:
+            datetime: Time in UTC.
+
+        """
+        return get_db().command("hello")["localTime"]
+
+    def _report(self, ids: List[Any]):
+        if ids:
+            self.bot.loop.call_soon_threadsafe(self.on_change, list(set(ids)))
+
+    def _reset(self):
+        self.bot.loop.call_soon_threadsafe(self.on_reset)
+
+    def _watch(self):
+        position = self.load_position() or {}
+        token = position.get("token")
+        since = position.get("updated_at")
+        # Without a resume token the changes made while stopped are unknown.
+        reset = token is None
+        while not self._stopped.is_set():
+            try:
+                token = self._stream(token, reset)
+                reset = False
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_NOT_SUPPORTED:
+                    log.info(f"Change streams are not supported, polling {self.name}")
+                    if since is None:
+                        self._reset()
+                        since = self.get_server_time()
+                    self._poll(since)
+                    return
+                if e.code not in RESUME_TOKEN_LOST:
+                    raise
+                log.warning(f"Position of {self.name} is lost, dropping the cache")
+                token = None
+                reset = True
+
+    def _stream(self, token: Optional[dict], reset: bool = False) -> Optional[dict]:
+        collection = get_db()[self.collection_name]
+        with collection.watch(
+            resume_after=token, max_await_time_ms=int(self.max_delay * 1000)
+        ) as stream:
+            # Dropped only once the stream is open, so no change falls between.
+            if reset:
+                self._reset()
+            ids = []
+            reported = time.monotonic()
+            while not self._stopped.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is not None:
+                    if change["operationType"] in INVALIDATING_OPERATIONS:
+                        self._reset()
+                        return None
+                    ids.append(change["documentKey"]["_id"])
+                if change is None or time.monotonic() - reported >= self.max_delay:
+                    self._report(ids)
+                    ids = []
+                    reported = time.monotonic()
+                    if stream.resume_token not in (None, token):
+                        token = stream.resume_token
+                        self.save_position(token=token)
+            self._report(ids)
+            return stream.resume_token or token
+
+    def _poll(self, since: datetime):
+        collection = get_db()[self.collection_name]
+        overlap = timedelta(seconds=self.poll_overlap)
+        # Stamps of the changes reported within the overlap by document ID.
+        reported: Dict[Any, datetime] = {}
+        self.save_position(updated_at=since)
+        while not self._stopped.is_set():
+            docs = list(
+                collection.find(
+                    {"updated_at": {"$gt": since - overlap}}, {"updated_at": True}
+                )
+            )
+            ids = [
+                doc["_id"]
+                for doc in docs
+                if reported.get(doc["_id"]) != doc["updated_at"]
+            ]
+            if ids:
+                self._report(ids)
+                for doc in docs:
+                    reported[doc["_id"]] = doc["updated_at"]
+                since = max(since, max(doc["updated_at"] for doc in docs))
+                reported = {
+                    _id: updated_at
+                    for _id, updated_at in reported.items()
+                    if updated_at > since - overlap
+                }
+                self.save_position(updated_at=since)
+            self._stopped.wait(self.poll_interval)
@@ -0,0 +1,218 @@
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+
+class _Tables:
+    """Lookup tables of the index, replaced as a whole on rebuild."""
+
+    __slots__ = ("ids", "names", "sorted", "sizes", "trigrams")
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.names: Dict[str, str] = {}
+        self.sorted: List[str] = []
+        self.sizes: Dict[str, int] = {}
+        self.trigrams: Dict[str, Set[str]] = defaultdict(set)
+
+
+class ItemNameIndex:
+    """In-memory index of item names.
+
+    The index is built once from the item catalog and updated when items are
+    created. It supports case-insensitive exact match, prefix match and fuzzy
+    match by trigrams with an edit distance check, so lookups and "did you
+    mean" suggestions do not need any database queries.
+
+    The index may be rebuilt in a worker thread while it is read on the event
+    loop, so a rebuild fills new tables and swaps them in at once.
+
+    Attributes:
+        min_similarity (float): Minimum trigram similarity of a suggestion.
+
+    """
+
+    def __init__(self, min_similarity: float = 0.3):
+        self.min_similarity = min_similarity
+        self._tables = _Tables()
+
+    def __len__(self):
+        return len(self._tables.ids)
+
+    @staticmethod
+    def normalize(name: str) -> str:
+        """Returns the name in the form it is stored in the index.
+
+        Args:
+            name (str): Item name.
+
+        Returns:
+            str: Normalized name.
+
+        """
+        return " ".join(name.casefold().replace("ё", "е").split())
+
+    @staticmethod
+    def get_trigrams(name: str) -> Set[str]:
+        """Returns the trigrams of the normalized name.
+
+        Args:
+            name (str): Normalized name.
+
+        Returns:
+            Set[str]: Trigrams.
+
+        """
+        padded = f"  {name} "
+        return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+    @staticmethod
+    def get_distance(first: str, second: str) -> int:
+        """Returns the Levenshtein distance between two strings.
+
+        Args:
+            first (str): First string.
+            second (str): Second string.
+
+        Returns:
+            int: Edit distance.
+
+        """
+        if len(first) < len(second):
+            first, second = second, first
+        previous = list(range(len(second) + 1))
+        for i, char in enumerate(first, 1):
+            current = [i]
+            for j, other in enumerate(second, 1):
+                current.append(
+                    min(
+                        previous[j] + 1,
+                        current[j - 1] + 1,
+                        previous[j - 1] + (char != other),
+                    )
+                )
+            previous = current
+        return previous[-1]
+
+    def build(self, items: Iterable):
+        """Rebuilds the index.
+
+        Args:
+            items (Iterable): Items with `item_id` and `name`.
+        """
+        tables = _Tables()
+        for item in items:
+            self._add(tables, item.item_id, item.name)
+        tables.sorted = sorted(tables.ids)
+        self._tables = tables
+
+    def add(self, item_id: int, name: str):
+        """Adds the item to the index.
+
+        Args:
+            item_id (int): Item ID.
+            name (str): Item name.
+        """
+        if not name:
+            return
+        tables = self._tables
+        key = self.normalize(name)
+        if key not in tables.ids:
+            tables.sorted.insert(bisect_left(tables.sorted, key), key)
+        self._add(tables, item_id, name)
+
+    def _add(self, tables: _Tables, item_id: int, name: str):
+        if not name:
+            return
+        key = self.normalize(name)
+        trigrams = self.get_trigrams(key)
+        tables.ids[key] = item_id
+        tables.names[key] = name
+        tables.sizes[key] = len(trigrams)
+        for trigram in trigrams:
+            tables.trigrams[trigram].add(key)
+
+    def find(self, name: str) -> Optional[int]:
+        """Returns the ID of the item with the name.
+
+        The name is first matched exactly, ignoring case. If there is no such
+        item, the name is treated as a prefix, which must be unique.
+
+        Args:
+            name (str): Item name or its prefix.
+
+        Returns:
+            Optional[int]: Item ID or None, if the name is not found or the
+            prefix is ambiguous.
+
+        """
+        tables = self._tables
+        key = self.normalize(name)
+        if key in tables.ids:
+            return tables.ids[key]
+        matches = self._get_prefix_matches(tables, key, 2)
+        if len(matches) == 1:
+            return tables.ids[matches[0]]
+        return None
+
+    def get_prefix_matches(self, prefix: str, limit: int = 5) -> List[str]:
+        """Returns normalized names starting with the prefix.
+
+        Args:
+            prefix (str): Normalized prefix.
+            limit (int): Maximum number of names.
+
+        Returns:
+            List[str]: Normalized names in alphabetical order.
+
+        """
+        return self._get_prefix_matches(self._tables, prefix, limit)
+
+    @staticmethod
+    def _get_prefix_matches(tables: _Tables, prefix: str, limit: int) -> List[str]:
+        matches = []
+        position = bisect_left(tables.sorted, prefix)
+        while (
+            position < len(tables.sorted)
+            and len(matches) < limit
+            and tables.sorted[position].startswith(prefix)
+        ):
+            matches.append(tables.sorted[position])
+            position += 1
+        return matches
+
+    def suggest(self, name: str, limit: int = 3) -> List[str]:
+        """Returns names of the items similar to the given one.
+
+        Candidates are names sharing trigrams with the given one, ranked by
+        trigram similarity and edit distance. Names starting with the given
+        one go first.
+
+        Args:
+            name (str): Item name.
+            limit (int): Maximum number of suggestions.
+
+        Returns:
+            List[str]: Original item names.
+
+        """
+        tables = self._tables
+        key = self.normalize(name)
+        suggestions = self._get_prefix_matches(tables, key, limit)
+        trigrams = self.get_trigrams(key)
+        shared = defaultdict(int)
+        for trigram in trigrams:
+            for candidate in tables.trigrams.get(trigram, ()):
+                shared[candidate] += 1
+        scored = []
+        for candidate, count in shared.items():
+            if candidate in suggestions:
+                continue
+            similarity = count / (len(trigrams) + tables.sizes[candidate] - count)
+            if similarity >= self.min_similarity:
+                scored.append(
+                    (-similarity, self.get_distance(key, candidate), candidate)
+                )
+        scored.sort()
+        suggestions += [candidate for *_, candidate in scored]
+        return [tables.names[key] for key in suggestions[:limit]]
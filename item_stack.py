@@ -0,0 +1,161 @@
+from mongoengine.base import BaseField
+
+
+class ItemStack:
+    """Inventory item stack
+
+    A compact value object used instead of a dictionary for every stack of
+    the inventory and every equipment slot. It is stored in the database in
+    the same format as before, a dictionary with the keys `item_id`, `count`,
+    `maker` and `temper`; equipment slots are stored without `count`. A blank
+    stack, which fills an empty inventory category, is falsy.
+
+    Attributes:
+        item_id (int): Item ID. An empty string for a blank stack.
+        count (int): The number of items in the stack.
+        maker (str): Name of the maker of the item.
+        temper (int): Item tempering.
+
+    """
+
+    __slots__ = ("item_id", "count", "maker", "temper")
+
+    def __init__(
+        self, item_id: int, count: int = 1, maker: str = None, temper: int = None
+    ):
+        self.item_id = item_id
+        self.count = count
+        self.maker = maker
+        self.temper = temper
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ItemStack":
+        """Creates a stack from its stored format.
+
+        Equipment slots are stored without `count`, so it defaults to 1.
+
+        Args:
+            data (dict): Stored stack.
+
+        Returns:
+            ItemStack: The stack.
+
+        """
+        return cls(
+            data.get("item_id"),
+            data.get("count", 1),
+            data.get("maker"),
+            data.get("temper"),
+        )
+
+    def to_dict(self, count: bool = True) -> dict:
+        """Returns the stack in its stored format.
+
+        Args:
+            count (:obj:`bool`, optional): Include `count`. Defaults to True.
+
+        Returns:
+            dict: Stored stack.
+
+        """
+        if not count:
+            return {"item_id": self.item_id, "maker": self.maker, "temper": self.temper}
+        return {
+            "item_id": self.item_id,
+            "count": self.count,
+            "maker": self.maker,
+            "temper": self.temper,
+        }
+
+    def is_blank(self) -> bool:
+        """Returns whether the stack holds no item.
+
+        Returns:
+            bool: The stack is a blank filler or is empty.
+
+        """
+        return self.item_id in (None, "") or self.count < 1
+
+    def copy(self, **changes) -> "ItemStack":
+        """Returns a copy of the stack.
+
+        Args:
+            **changes: Attributes to replace in the copy.
+
+        Returns:
+            ItemStack: The copy.
+
+        """
+        return ItemStack(
+            changes.get("item_id", self.item_id),
+            changes.get("count", self.count),
+            changes.get("maker", self.maker),
+            changes.get("temper", self.temper),
+        )
+
+    def matches(self, item_id: int, maker: str = None, temper: int = None) -> bool:
+        """Returns whether the stack holds the given item.
+
+        Args:
+            item_id (int): Item ID.
+            maker (:obj:`str`, optional): Name of the maker of the item.
+                Defaults to None.
+            temper (:obj:`int`, optional): Item tempering. Defaults to None.
+
+        Returns:
+            bool: The stack holds the item or not.
+
+        """
+        return self.item_id == item_id and self.maker == maker and self.temper == temper
+
+    def __eq__(self, other):
+        if not isinstance(other, ItemStack):
+            return NotImplemented
+        return self.matches(other.item_id, other.maker, other.temper) and (
+            self.count == other.count
+        )
+
+    def __bool__(self):
+        return not self.is_blank()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return (
+            f"ItemStack(item_id={self.item_id!r}, count={self.count!r}, "
+            f"maker={self.maker!r}, temper={self.temper!r})"
+        )
+
+
+class ItemStackField(BaseField):
+    """A field that stores `ItemStack` as a dictionary.
+
+    Attributes:
+        store_count (bool): Store the number of items. Equipment slots hold
+            one item, so they are stored without it, and an empty or blank
+            slot is loaded as None.
+
+    """
+
+    def __init__(self, store_count: bool = True, **kwargs):
+        self.store_count = store_count
+        super().__init__(**kwargs)
+
+    def to_python(self, value):
+        if isinstance(value, dict):
+            if not self.store_count and value.get("item_id") in (None, ""):
+                return None
+            return ItemStack.from_dict(value)
+        return value
+
+    def to_mongo(self, value):
+        if isinstance(value, ItemStack):
+            return value.to_dict(self.store_count)
+        return value
+
+    def prepare_query_value(self, op, value):
+        return self.to_mongo(value)
+
+    def validate(self, value):
+        if not isinstance(value, (ItemStack, dict)):
+            self.error("ItemStackField only accepts ItemStack or dict values")
@@ -0,0 +1,214 @@
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+from .guild_scope import get_char_key
+
+
+class Leaderboard:
+    """Ranking of characters by one metric.
+
+    Entries are kept in a sorted list of `(key, member_id)` tuples, where the
+    key is the negated score, so the best character goes first. Rank queries
+    are binary searches and updates move a single entry.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[tuple, str]] = ()):
+        self._entries: List[Tuple[tuple, str]] = sorted(entries)
+        self._keys: Dict[str, tuple] = {
+            member_id: key for key, member_id in self._entries
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, member_id: str):
+        return member_id in self._keys
+
+    @staticmethod
+    def get_key(score: tuple) -> tuple:
+        """Returns the sort key of the score.
+
+        Args:
+            score (tuple): Score values, the most significant first.
+
+        Returns:
+            tuple: Sort key.
+
+        """
+        return tuple(-value for value in score)
+
+    def update(self, member_id: str, score: tuple):
+        """Adds the character to the ranking or changes its score.
+
+        Args:
+            member_id (str): Member ID.
+            score (tuple): New score.
+        """
+        key = self.get_key(score)
+        old_key = self._keys.get(member_id)
+        if old_key == key:
+            return
+        if old_key is not None:
+            del self._entries[bisect_left(self._entries, (old_key, member_id))]
+        insort(self._entries, (key, member_id))
+        self._keys[member_id] = key
+
+    def remove(self, member_id: str):
+        """Removes the character from the ranking.
+
+        Args:
+            member_id (str): Member ID.
+        """
+        key = self._keys.pop(member_id, None)
+        if key is not None:
+            del self._entries[bisect_left(self._entries, (key, member_id))]
+
+    def get_rank(self, member_id: str) -> Optional[int]:
+        """Returns the place of the character in the ranking.
+
+        Args:
+            member_id (str): Member ID.
+
+        Returns:
+            Optional[int]: Place starting from 1 or None, if the character is
+            not ranked. Characters with equal scores share the place.
+
+        """
+        key = self._keys.get(member_id)
+        if key is None:
+            return None
+        return bisect_left(self._entries, (key,)) + 1
+
+    def get_top(self, count: int) -> List[Tuple[str, tuple]]:
+        """Returns the best characters.
+
+        Args:
+            count (int): The number of characters.
+
+        Returns:
+            List[Tuple[str, tuple]]: Member IDs with their scores.
+
+        """
+        return [
+            (member_id, self.get_key(key)) for key, member_id in self._entries[:count]
+        ]
+
+
+class Leaderboards:
+    """Global and per-guild leaderboards of all metrics.
+
+    Global leaderboards are built once from the database and then updated
+    incrementally. Guild leaderboards are built from the global ones on first
+    use and dropped when the member list of the guild changes.
+
+    Attributes:
+        metrics (dict): Character fields of the score of each metric, the
+            most significant first.
+        character_class (type): Character document class.
+        scoped (bool): Characters are guild characters, keyed by the guild ID
+            and the member ID.
+
+    """
+
+    metrics = {"lvl": ("lvl", "xp"), "xp": ("xp",), "gold": ("gold",)}
+
+    def __init__(self, character_class: type, scoped: bool = False):
+        self.character_class = character_class
+        self.scoped = scoped
+        self._values: Dict[str, dict] = {}
+        self._boards: Dict[str, Leaderboard] = {
+            metric: Leaderboard() for metric in self.metrics
+        }
+        self._guild_boards: Dict[Tuple[int, str], Leaderboard] = {}
+
+    def get_score(self, metric: str, values: dict) -> tuple:
+        """Returns the score of the character.
+
+        Args:
+            metric (str): Metric name.
+            values (dict): Character field values.
+
+        Returns:
+            tuple: Score.
+
+        """
+        return tuple(values.get(field) or 0 for field in self.metrics[metric])
+
+    def build(self):
+        """Loads all characters from the database."""
+        fields = {field for score in self.metrics.values() for field in score}
+        docs = self.character_class._get_collection().find(
+            {}, {field: True for field in fields}
+        )
+        self._values = {doc.pop("_id"): doc for doc in docs}
+        self._boards = {
+            metric: Leaderboard(
+                (Leaderboard.get_key(self.get_score(metric, values)), member_id)
+                for member_id, values in self._values.items()
+            )
+            for metric in self.metrics
+        }
+        self._guild_boards.clear()
+
+    def update(self, member_id: str, **values):
+        """Changes the score of the character in all leaderboards.
+
+        Args:
+            member_id (str): Member ID.
+            **values: New values of the character fields.
+        """
+        self._values.setdefault(member_id, {}).update(values)
+        for metric, board in self._boards.items():
+            score = self.get_score(metric, self._values[member_id])
+            board.update(member_id, score)
+        for (_, metric), board in self._guild_boards.items():
+            if member_id in board:
+                board.update(member_id, self.get_score(metric, self._values[member_id]))
+
+    def remove(self, member_id: str):
+        """Removes the character from all leaderboards.
+
+        Args:
+            member_id (str): Member ID.
+        """
+        self._values.pop(member_id, None)
+        for board in [*self._boards.values(), *self._guild_boards.values()]:
+            board.remove(member_id)
+
+    def get(self, metric: str, guild: discord.Guild = None) -> Leaderboard:
+        """Returns the leaderboard.
+
+        Args:
+            metric (str): Metric name.
+            guild (:obj:`discord.Guild`, optional): Guild of the leaderboard.
+                Defaults to None, which means the global leaderboard.
+
+        Returns:
+            Leaderboard: The leaderboard.
+
+        """
+        if guild is None:
+            return self._boards[metric]
+        board = self._guild_boards.get((guild.id, metric))
+        if board is None:
+            entries = []
+            for member in guild.members:
+                member_id = get_char_key(member.id, guild.id if self.scoped else None)
+                values = self._values.get(member_id)
+                if values is not None:
+                    score = self.get_score(metric, values)
+                    entries.append((Leaderboard.get_key(score), member_id))
+            board = Leaderboard(entries)
+            self._guild_boards[(guild.id, metric)] = board
+        return board
+
+    def invalidate_guild(self, guild: discord.Guild):
+        """Drops the leaderboards of the guild.
+
+        Args:
+            guild (discord.Guild): Guild object.
+        """
+        for metric in self.metrics:
+            self._guild_boards.pop((guild.id, metric), None)
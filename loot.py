@@ -0,0 +1,201 @@
+import random
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence
+
+from .transactions import Change
+
+
+class AliasTable:
+    """Walker's alias table for sampling from a discrete distribution.
+
+    The table is built in O(n) with Vose's method, and every draw is O(1):
+    one uniform column and one biased coin flip.
+
+    Attributes:
+        prob (List[float]): Probability to keep the column.
+        alias (List[int]): Index to use instead of the column.
+
+    """
+
+    __slots__ = ("prob", "alias")
+
+    def __init__(self, weights: Sequence[float]):
+        """Builds the table.
+
+        Args:
+            weights (Sequence[float]): Non-negative weights with a positive sum.
+
+        Raises:
+            ValueError: If there are no positive weights.
+
+        """
+        size = len(weights)
+        total = sum(weights)
+        if size == 0 or total <= 0:
+            raise ValueError("weights must have a positive sum")
+        scaled = [weight * size / total for weight in weights]
+        self.prob = [0.0] * size
+        self.alias = list(range(size))
+        small = [index for index, value in enumerate(scaled) if value < 1]
+        large = [index for index, value in enumerate(scaled) if value >= 1]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+        for index in small + large:
+            self.prob[index] = 1.0
+
+    def __len__(self):
+        return len(self.prob)
+
+    def sample(self, rng: random.Random) -> int:
+        """Draws an index.
+
+        Args:
+            rng (random.Random): Random number generator.
+
+        Returns:
+            int: Index of the drawn weight.
+
+        """
+        column = rng.randrange(len(self.prob))
+        return column if rng.random() < self.prob[column] else self.alias[column]
+
+
+class LootTables:
+    """Loot tables compiled from the item catalog.
+
+    Every table gives each catalog item the weight of its rarity, and is
+    compiled into an alias table, so a drop does not depend on the size of
+    the catalog.
+
+    Attributes:
+        settings (dict): Same as the `game.loot` section of the config.
+        tables (Dict[str, Tuple[List[int], AliasTable]]): Item IDs and the
+            alias table by table name.
+
+    """
+
+    def __init__(self, settings: dict):
+        self.settings = settings
+        self.tables = {}
+        self._items: Dict[int, str] = {}
+
+    def build(self, items: Iterable):
+        """Compiles all tables.
+
+        Args:
+            items (Iterable): Items with `item_id` and `rarity`.
+        """
+        self._items = {item.item_id: item.rarity for item in items}
+        self._compile()
+
+    def add(self, item):
+        """Adds the item to the catalog and recompiles all tables.
+
+        Args:
+            item: Item with `item_id` and `rarity`.
+        """
+        self._items[item.item_id] = item.rarity
+        self._compile()
+
+    def _compile(self):
+        tables = {}
+        for name, table in self.settings.tables.items():
+            weights = {**self.settings.rarity_weights, **table.get("rarities", {})}
+            item_ids = [
+                item_id
+                for item_id, rarity in sorted(self._items.items())
+                if weights.get(rarity, 0) > 0
+            ]
+            if item_ids:
+                tables[name] = (
+                    item_ids,
+                    AliasTable([weights[self._items[item_id]] for item_id in item_ids]),
+                )
+        self.tables = tables
+
+    def roll(self, name: str, rng: random.Random, rolls: int = None) -> Counter:
+        """Draws items from the table.
+
+        Args:
+            name (str): Table name.
+            rng (random.Random): Random number generator.
+            rolls (:obj:`int`, optional): The number of draws. Defaults to the
+                `rolls` of the table.
+
+        Returns:
+            Counter: The number of dropped items by item ID.
+
+        Raises:
+            LootTableNotFound: If the table is not found or has no items.
+
+        """
+        if name not in self.tables:
+            raise LootTableNotFound
+        item_ids, table = self.tables[name]
+        if rolls is None:
+            rolls = self.settings.tables[name].get("rolls", 1)
+        return Counter(item_ids[table.sample(rng)] for _ in range(rolls))
+
+    def roll_many(
+        self, name: str, member_ids: List[str], seed: int = None
+    ) -> Dict[str, Counter]:
+        """Draws items from the table for every member.
+
+        One random number generator is used for all members in the given
+        order, so the same seed and members give the same drops.
+
+        Args:
+            name (str): Table name.
+            member_ids (List[str]): Member IDs.
+            seed (:obj:`int`, optional): Seed of the random number generator.
+
+        Returns:
+            Dict[str, Counter]: Drops by member ID.
+
+        Raises:
+            LootTableNotFound: If the table is not found or has no items.
+
+        """
+        rng = random.Random(seed)
+        return {member_id: self.roll(name, rng) for member_id in member_ids}
+
+
+def get_loot_changes(drops: Dict[str, Counter], items: dict) -> List[Change]:
+    """Returns inventory changes that give the drops.
+
+    The changes are applied together with `transactions.execute`.
+
+    Args:
+        drops (Dict[str, Counter]): Drops by member ID.
+        items (dict): `Item` documents by item ID.
+
+    Returns:
+        List[Change]: Changes.
+
+    """
+    return [
+        Change(
+            member_id,
+            0,
+            tuple(
+                (items[item_id], count, None, None)
+                for item_id, count in sorted(drop.items())
+            ),
+        )
+        for member_id, drop in drops.items()
+        if drop
+    ]
+
+
+class LootTableNotFound(Exception):
+    """Raises if the loot table is not found or has no items."""
+
+    pass
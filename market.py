@@ -0,0 +1,549 @@
+import heapq
+import logging
+import threading
+from typing import Callable, ContextManager, Dict, List, NamedTuple, Optional, Tuple
+
+from .transactions import Change, execute
+
+log = logging.getLogger("red.rpg.market")
+
+BUY = "buy"
+SELL = "sell"
+
+
+class Order:
+    """Order of the marketplace.
+
+    Attributes:
+        order_id (int): Order ID. Equals the sequence number of the event that
+            placed the order, so it also defines time priority.
+        member_id (str): Member ID of the owner.
+        item_id (int): Item ID.
+        side (str): `buy` or `sell`.
+        price (int): Price of one item.
+        count (int): The number of items left to fill.
+
+    """
+
+    __slots__ = ("order_id", "member_id", "item_id", "side", "price", "count")
+
+    def __init__(
+        self,
+        order_id: int,
+        member_id: str,
+        item_id: int,
+        side: str,
+        price: int,
+        count: int,
+    ):
+        self.order_id = order_id
+        self.member_id = member_id
+        self.item_id = item_id
+        self.side = side
+        self.price = price
+        self.count = count
+
+
+class Fill(NamedTuple):
+    """Match of a buy order and a sell order."""
+
+    buy: Order
+    sell: Order
+    price: int
+    count: int
+
+
+class OrderBook:
+    """Order book of one item with price-time priority.
+
+    Both sides are binary heaps: bids by highest price, asks by lowest price,
+    and then by order ID. Cancelled and filled orders are removed from the
+    heaps lazily, when they reach the top.
+
+    Attributes:
+        item_id (int): Item ID.
+        orders (Dict[int, Order]): Open orders by ID.
+
+    """
+
+    def __init__(self, item_id: int):
+        self.item_id = item_id
+        self.orders: Dict[int, Order] = {}
+        self._bids: List[Tuple[int, int, Order]] = []
+        self._asks: List[Tuple[int, int, Order]] = []
+
+    def _get_top(self, heap: list) -> Optional[Order]:
+        while heap:
+            order = heap[0][2]
+            if order.count > 0 and order.order_id in self.orders:
+                return order
+            heapq.heappop(heap)
+        return None
+
+    @property
+    def best_bid(self) -> Optional[Order]:
+        """Optional[Order]: The buy order with the highest price."""
+        return self._get_top(self._bids)
+
+    @property
+    def best_ask(self) -> Optional[Order]:
+        """Optional[Order]: The sell order with the lowest price."""
+        return self._get_top(self._asks)
+
+    def insert(self, order: Order):
+        """Adds the order to the book without matching.
+
+        Args:
+            order (Order): The order.
+        """
+        self.orders[order.order_id] = order
+        if order.side == BUY:
+            heapq.heappush(self._bids, (-order.price, order.order_id, order))
+        else:
+            heapq.heappush(self._asks, (order.price, order.order_id, order))
+
+    def add(self, order: Order) -> List[Fill]:
+        """Matches the order with the opposite side and adds the rest to the book.
+
+        Args:
+            order (Order): The order.
+
+        Returns:
+            List[Fill]: Fills in the order they were made.
+
+        """
+        fills = []
+        fill = self.match(order)
+        while fill is not None:
+            self.apply(fill)
+            fills.append(fill)
+            fill = self.match(order)
+        if order.count > 0:
+            self.insert(order)
+        return fills
+
+    def match(self, order: Order) -> Optional[Fill]:
+        """Returns the next fill of the order without changing the book.
+
+        Fills are made at the price of the resting order.
+
+        Args:
+            order (Order): The order, which is not in the book yet.
+
+        Returns:
+            Optional[Fill]: The fill or None, if the order does not cross the
+            opposite side.
+
+        """
+        if order.count <= 0:
+            return None
+        if order.side == BUY:
+            other = self.best_ask
+            if other is None or other.price > order.price:
+                return None
+            return Fill(order, other, other.price, min(order.count, other.count))
+        other = self.best_bid
+        if other is None or other.price < order.price:
+            return None
+        return Fill(other, order, other.price, min(order.count, other.count))
+
+    def apply(self, fill: Fill):
+        """Reduces both orders of the fill.
+
+        Args:
+            fill (Fill): The fill returned by `OrderBook.match`.
+        """
+        for order in (fill.buy, fill.sell):
+            order.count -= fill.count
+            if order.count <= 0:
+                self.orders.pop(order.order_id, None)
+
+    def reduce(self, order_id: int, count: int):
+        """Reduces the number of items left in the order.
+
+        Args:
+            order_id (int): Order ID.
+            count (int): The number of filled items.
+        """
+        order = self.orders.get(order_id)
+        if order is None:
+            return
+        order.count -= count
+        if order.count <= 0:
+            del self.orders[order_id]
+
+    def remove(self, order_id: int) -> Optional[Order]:
+        """Removes the order from the book.
+
+        Args:
+            order_id (int): Order ID.
+
+        Returns:
+            Optional[Order]: The removed order or None, if it is not open.
+
+        """
+        return self.orders.pop(order_id, None)
+
+    def get_depth(self, side: str, levels: int = 5) -> List[Tuple[int, int]]:
+        """Returns the best price levels of the side.
+
+        Args:
+            side (str): `buy` or `sell`.
+            levels (int): The number of price levels.
+
+        Returns:
+            List[Tuple[int, int]]: Prices with the total number of items.
+
+        """
+        # The copy is made atomically, so the depth may be read from another
+        # thread while the book is changed.
+        orders = sorted(
+            (order for order in self.orders.copy().values() if order.side == side),
+            key=lambda order: -order.price if side == BUY else order.price,
+        )
+        depth = []
+        for order in orders:
+            if depth and depth[-1][0] == order.price:
+                depth[-1] = (order.price, depth[-1][1] + order.count)
+            elif len(depth) < levels:
+                depth.append((order.price, order.count))
+            else:
+                break
+        return depth
+
+
+class Market:
+    """Player marketplace.
+
+    Matching is done in memory. Every placed and cancelled order and every
+    fill is appended to the event log in the database, which is the only
+    persistent state of the books, so they are rebuilt by replaying the log.
+    Items of sell orders and gold of buy orders are held in escrow from the
+    moment the order is placed, and fills are settled with atomic transfers.
+    Every event is logged only after its transfer has succeeded, and the
+    transfer is undone if logging fails, and only then is the book changed,
+    so the books, the log and the escrow always agree.
+
+    Several bot processes can share the market: every change is made under
+    `lock`, which then must exclude the other processes too, after the
+    events logged by them have been applied with `Market.sync`.
+
+    Attributes:
+        event_class (type): Market event document class.
+        character_class (type): Character document class.
+        inventory_class (type): Inventory document class.
+        get_item (Callable[[int], object]): Returns an item by ID.
+        on_gold_changed (Callable[[Dict[str, int]], None]): Called with new
+            gold by member ID after every transfer.
+        lock (ContextManager): Lock of all changes. Defaults to a thread
+            lock.
+        books (Dict[int, OrderBook]): Order books by item ID.
+
+    """
+
+    def __init__(
+        self,
+        event_class: type,
+        character_class: type,
+        inventory_class: type,
+        get_item: Callable[[int], object],
+        on_gold_changed: Callable[[Dict[str, int]], None],
+        lock: ContextManager = None,
+    ):
+        self.event_class = event_class
+        self.character_class = character_class
+        self.inventory_class = inventory_class
+        self.get_item = get_item
+        self.on_gold_changed = on_gold_changed
+        self.books: Dict[int, OrderBook] = {}
+        self._seq = 0
+        self._lock = lock if lock is not None else threading.Lock()
+
+    def get_book(self, item_id: int) -> OrderBook:
+        """Returns the order book of the item, creating it if necessary.
+
+        Args:
+            item_id (int): Item ID.
+
+        Returns:
+            OrderBook: Order book.
+
+        """
+        book = self.books.get(item_id)
+        if book is None:
+            book = self.books[item_id] = OrderBook(item_id)
+        return book
+
+    def find_order(self, order_id: int) -> Optional[Order]:
+        """Returns the open order by ID.
+
+        Args:
+            order_id (int): Order ID.
+
+        Returns:
+            Optional[Order]: The order or None, if it is not open.
+
+        """
+        for book in self.books.values():
+            if order_id in book.orders:
+                return book.orders[order_id]
+        return None
+
+    def get_orders(self, member_id: str) -> List[Order]:
+        """Returns the open orders of the member.
+
+        May be called without the lock, e.g. from the event loop.
+
+        Args:
+            member_id (str): Member ID.
+
+        Returns:
+            List[Order]: The orders sorted by ID.
+
+        """
+        return sorted(
+            (
+                order
+                for book in self.books.copy().values()
+                for order in book.orders.copy().values()
+                if order.member_id == member_id
+            ),
+            key=lambda order: order.order_id,
+        )
+
+    def get_depth(self, item_id: int, side: str, levels: int = 5):
+        """Returns the best price levels of the item.
+
+        May be called without the lock, e.g. from the event loop.
+
+        Args:
+            item_id (int): Item ID.
+            side (str): `buy` or `sell`.
+            levels (int): The number of price levels.
+
+        Returns:
+            List[Tuple[int, int]]: Prices with the total number of items.
+
+        """
+        book = self.books.get(item_id)
+        return book.get_depth(side, levels) if book is not None else []
+
+    def rebuild(self):
+        """Rebuilds all order books from the event log."""
+        with self._lock:
+            self.books = {}
+            self._seq = 0
+            self._replay()
+
+    def sync(self):
+        """Applies the events logged since the last applied one.
+
+        Used to catch up with the events of other processes.
+        """
+        with self._lock:
+            self._replay()
+
+    def _replay(self):
+        events = self.event_class._get_collection().find(
+            {"_id": {"$gt": self._seq}}, sort=[("_id", 1)]
+        )
+        for event in events:
+            self._seq = event["_id"]
+            kind = event["kind"]
+            book = self.get_book(event["item_id"])
+            if kind == "place":
+                book.insert(
+                    Order(
+                        event["_id"],
+                        event["member_id"],
+                        event["item_id"],
+                        event["side"],
+                        event["price"],
+                        event["count"],
+                    )
+                )
+            elif kind == "fill":
+                for order_id in (event["order_id"], event["other_order_id"]):
+                    book.reduce(order_id, event["count"])
+            elif kind == "cancel":
+                book.remove(event["order_id"])
+
+    def _log(self, kind: str, order: Order, **fields) -> int:
+        seq = self._seq + 1
+        self.event_class(
+            seq=seq,
+            kind=kind,
+            order_id=order.order_id if kind != "place" else seq,
+            member_id=order.member_id,
+            item_id=order.item_id,
+            side=order.side,
+            price=fields.get("price", order.price),
+            count=fields.get("count", order.count),
+            other_order_id=fields.get("other_order_id"),
+        ).save(force_insert=True)
+        self._seq = seq
+        return seq
+
+    def _transfer(self, changes: List[Change]):
+        gold = execute(self.character_class, self.inventory_class, changes)
+        self.on_gold_changed(gold)
+
+    def _commit(self, changes: List[Change], kind: str, order: Order, **fields):
+        """Transfers the changes and logs the event.
+
+        Returns:
+            int: Sequence number of the event.
+
+        Raises:
+            Exception: If the transfer or logging failed. The transfer is
+                undone in the latter case.
+
+        """
+        if changes:
+            self._transfer(changes)
+        try:
+            return self._log(kind, order, **fields)
+        except Exception:
+            if changes:
+                try:
+                    self._transfer([change.inverse() for change in changes[::-1]])
+                except Exception:
+                    log.exception(f"Failed to undo the transfer of {kind} {changes}")
+            raise
+
+    def _get_refund(self, order: Order) -> Change:
+        if order.side == BUY:
+            return Change(order.member_id, order.price * order.count)
+        item = self.get_item(order.item_id)
+        return Change(order.member_id, 0, ((item, order.count, None, None),))
+
+    def place(
+        self, member_id: str, item, side: str, count: int, price: int
+    ) -> Tuple[Order, List[Fill]]:
+        """Places an order and matches it.
+
+        Args:
+            member_id (str): Member ID of the owner.
+            item (Item): The item.
+            side (str): `buy` or `sell`.
+            count (int): The number of items.
+            price (int): Price of one item.
+
+        Returns:
+            Tuple[Order, List[Fill]]: The order and its fills. If a fill failed
+            to settle, the rest of the order is cancelled instead of resting
+            in the book.
+
+        Raises:
+            NotEnoughGold: If the buyer does not have enough gold.
+            NotEnoughItems: If the seller does not have enough items.
+            ItemNotFoundInInventory: If the seller does not have the item.
+
+        """
+        with self._lock:
+            self._replay()
+            if side == BUY:
+                escrow = Change(member_id, -price * count)
+            else:
+                escrow = Change(member_id, 0, ((item, -count, None, None),))
+            order = Order(0, member_id, item.item_id, side, price, count)
+            order.order_id = self._commit([escrow], "place", order)
+            book = self.get_book(item.item_id)
+            fills = []
+            fill = book.match(order)
+            while fill is not None:
+                maker = fill.sell if side == BUY else fill.buy
+                try:
+                    self._commit(
+                        [
+                            Change(
+                                fill.buy.member_id,
+                                (fill.buy.price - fill.price) * fill.count,
+                                ((item, fill.count, None, None),),
+                            ),
+                            Change(fill.sell.member_id, fill.price * fill.count),
+                        ],
+                        "fill",
+                        order,
+                        price=fill.price,
+                        count=fill.count,
+                        other_order_id=maker.order_id,
+                    )
+                except Exception:
+                    log.exception(f"Failed to settle order {order.order_id}")
+                    if self._exists(maker.member_id):
+                        # Resting the remainder would leave a crossed book,
+                        # so it is cancelled and the escrow is returned.
+                        self._cancel_unsettled(order)
+                        return order, fills
+                    # The maker's character is gone and the order can never
+                    # be settled, so it is cancelled and matching goes on.
+                    self._commit([], "cancel", maker)
+                    book.remove(maker.order_id)
+                else:
+                    book.apply(fill)
+                    fills.append(fill)
+                fill = book.match(order)
+            if order.count > 0:
+                book.insert(order)
+            return order, fills
+
+    def _exists(self, member_id: str) -> bool:
+        collection = self.character_class._get_collection()
+        return collection.find_one({"_id": member_id}, {"_id": True}) is not None
+
+    def _cancel_unsettled(self, order: Order):
+        """Cancels the rest of an order that failed to settle.
+
+        The escrow is returned unless the owner's character is gone.
+
+        """
+        changes = [self._get_refund(order)] if self._exists(order.member_id) else []
+        try:
+            self._commit(changes, "cancel", order)
+        except Exception:
+            # The order stays open in the log, so the book has to keep it.
+            self.get_book(order.item_id).insert(order)
+            raise
+
+    def cancel(self, member_id: str, order_id: int) -> Optional[Order]:
+        """Cancels the order and returns the escrow to its owner.
+
+        Args:
+            member_id (str): Member ID of the owner.
+            order_id (int): Order ID.
+
+        Returns:
+            Optional[Order]: The cancelled order or None, if the member does
+            not have such an open order.
+
+        """
+        with self._lock:
+            self._replay()
+            order = self.find_order(order_id)
+            if order is None or order.member_id != member_id:
+                return None
+            self._commit([self._get_refund(order)], "cancel", order)
+            self.get_book(order.item_id).remove(order_id)
+            return order
+
+    def cancel_all(self, member_id: str, refund: bool = True) -> List[Order]:
+        """Cancels all orders of the member.
+
+        Args:
+            member_id (str): Member ID of the owner.
+            refund (:obj:`bool`, optional): Return the escrow to the owner.
+                Must be False if the character is deleted.
+
+        Returns:
+            List[Order]: The cancelled orders.
+
+        """
+        with self._lock:
+            self._replay()
+            orders = self.get_orders(member_id)
+            for order in orders:
+                changes = [self._get_refund(order)] if refund else []
+                self._commit(changes, "cancel", order)
+                self.get_book(order.item_id).remove(order.order_id)
+            return orders
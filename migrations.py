@@ -0,0 +1,269 @@
+import asyncio
+import logging
+from copy import deepcopy
+from typing import Callable, Dict, NamedTuple, Set, Tuple
+
+from pymongo import UpdateOne
+from redbot.core.bot import Red
+
+from .config import config
+
+log = logging.getLogger("red.rpg.migrations")
+
+
+class Migration(NamedTuple):
+    """Schema migration of character documents.
+
+    Attributes:
+        version (int): Schema version after the migration.
+        fields (Tuple[str, ...]): Dotted paths the migration may rewrite. Only
+            these paths are written back, so concurrent changes of other
+            fields are preserved.
+        func (Callable[[dict], None]): Changes a raw document in place.
+        description (str): What the migration does.
+
+    """
+
+    version: int
+    fields: Tuple[str, ...]
+    func: Callable[[dict], None]
+    description: str
+
+
+def get_path(doc: dict, path: str):
+    """Returns the value at a dotted path, or None if it is missing."""
+    for key in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(key)
+    return doc
+
+
+def has_path(doc: dict, path: str) -> bool:
+    """Returns whether the document has a value at a dotted path."""
+    *parents, key = path.split(".")
+    for parent in parents:
+        doc = doc.get(parent)
+        if not isinstance(doc, dict):
+            return False
+    return key in doc
+
+
+class Migrator:
+    """Class that brings character documents to the latest schema version.
+
+    Every character stores its `schema_version`; documents without it have
+    version 0. Migrations are applied lazily when a character is loaded, see
+    `Character._from_son`, and eagerly by a background job that rewrites
+    outdated documents in small batches with a pause between them, so the
+    collection is never locked and the bot keeps serving requests.
+
+    Attributes:
+        migrations (Dict[int, Migration]): Migrations by target version.
+        batch_size (int): The number of documents per batch of the background
+            job.
+        delay (float): Pause between batches in seconds.
+
+    """
+
+    def __init__(self, batch_size: int = 500, delay: float = 1):
+        self.migrations: Dict[int, Migration] = {}
+        self.batch_size = batch_size
+        self.delay = delay
+
+    @property
+    def latest(self) -> int:
+        """int: The latest schema version."""
+        return max(self.migrations, default=0)
+
+    def register(self, version: int, fields: Tuple[str, ...], description: str):
+        """Returns a decorator that registers a migration function.
+
+        Args:
+            version (int): Schema version after the migration. Versions must
+                be consecutive.
+            fields (Tuple[str, ...]): Dotted paths the migration may rewrite.
+            description (str): What the migration does.
+
+        Raises:
+            ValueError: If the version is already registered or is not the
+                next one.
+
+        """
+        if version in self.migrations or version != self.latest + 1:
+            raise ValueError(f"Migration {version} is not the next version")
+
+        def decorator(func: Callable[[dict], None]):
+            self.migrations[version] = Migration(version, fields, func, description)
+            return func
+
+        return decorator
+
+    def migrate(self, doc: dict) -> Set[str]:
+        """Applies the pending migrations to a raw document in place.
+
+        Args:
+            doc (dict): Character document.
+
+        Returns:
+            Set[str]: Rewritten paths, including `schema_version`. Empty if
+            the document is up to date.
+
+        """
+        version = doc.get("schema_version", 0)
+        if version >= self.latest:
+            return set()
+        for target in range(version + 1, self.latest + 1):
+            self.migrations[target].func(doc)
+        doc["schema_version"] = self.latest
+        return self.get_fields(version)
+
+    def get_fields(self, version: int) -> Set[str]:
+        """Returns the paths rewritten by the migrations after a version.
+
+        Args:
+            version (int): Current schema version.
+
+        Returns:
+            Set[str]: Dotted paths, including `schema_version`.
+
+        """
+        fields = {"schema_version"}
+        for target in range(version + 1, self.latest + 1):
+            fields.update(self.migrations[target].fields)
+        return fields
+
+    def get_outdated_query(self) -> dict:
+        """Returns the query of documents older than the latest version.
+
+        Returns:
+            dict: Query.
+
+        """
+        return {"schema_version": {"$not": {"$gte": self.latest}}}
+
+    def run_batch(self, collection) -> int:
+        """Migrates one batch of outdated documents.
+
+        Every document is updated only if the rewritten paths still hold the
+        values it was read with, like transactions do, so a concurrent change
+        is never overwritten. Such documents are picked up by the next batch.
+
+        Args:
+            collection (Collection): Character collection.
+
+        Returns:
+            int: The number of documents read, 0 if there are none left.
+
+        """
+        requests = []
+        docs = list(collection.find(self.get_outdated_query()).limit(self.batch_size))
+        for doc in docs:
+            old = {
+                path: (
+                    deepcopy(get_path(doc, path))
+                    if has_path(doc, path)
+                    else {"$exists": False}
+                )
+                for path in self.get_fields(doc.get("schema_version", 0))
+            }
+            fields = self.migrate(doc)
+            requests.append(
+                UpdateOne(
+                    {"_id": doc["_id"], **old},
+                    {
+                        "$set": {path: get_path(doc, path) for path in fields},
+                        "$currentDate": {"updated_at": True},
+                    },
+                )
+            )
+        if requests:
+            collection.bulk_write(requests, ordered=False)
+        return len(docs)
+
+    async def run(self, bot: Red, collection):
+        """Migrates all outdated documents in the background.
+
+        The job finishes when no outdated documents are left.
+
+        Args:
+            bot (Red): Bot object.
+            collection (Collection): Character collection.
+        """
+        total = 0
+        while True:
+            count = await bot.loop.run_in_executor(None, self.run_batch, collection)
+            if not count:
+                break
+            total += count
+            await asyncio.sleep(self.delay)
+        if total:
+            log.info(f"Migrated {total} characters to schema {self.latest}")
+
+
+migrator = Migrator(
+    config.database.migrations.batch_size, config.database.migrations.delay
+)
+
+# Migrations describe the layout at the time they were written, so they do
+# not depend on the document classes and keep working after later changes.
+INVENTORY_CATEGORIES = ("Weapon", "Armor", "Item")
+EQUIPMENT_SLOTS = ("right_hand", "left_hand", "helmet", "cuirass", "gauntlets", "boots")
+
+
+def get_blank_stack() -> dict:
+    return {"item_id": "", "count": 0, "maker": None, "temper": None}
+
+
+def normalize_stack(stack: dict, count: bool = True) -> dict:
+    normalized = {
+        "item_id": stack.get("item_id"),
+        "maker": stack.get("maker"),
+        "temper": stack.get("temper"),
+    }
+    if count:
+        normalized["count"] = stack.get("count", 1)
+    return normalized
+
+
+@migrator.register(
+    1,
+    ("inventory.items", "equipment", "attributes.main"),
+    "Normalize inventory fillers, equipment slots and main attributes",
+)
+def normalize_layout(doc: dict):
+    """Brings the embedded documents to one layout.
+
+    Every inventory category holds only stacks with items, or exactly one
+    blank filler if it is empty. Every equipment slot is present and holds a
+    stack without `count` or None. `attributes.main` has every key of the race defaults.
+    """
+    items = doc.setdefault("inventory", {}).get("items") or {}
+    normalized = {}
+    for category in (*INVENTORY_CATEGORIES, *items):
+        if category in normalized:
+            continue
+        stacks = [
+            normalize_stack(stack)
+            for stack in items.get(category, [])
+            if stack.get("item_id") != "" and stack.get("count", 1) > 0
+        ]
+        normalized[category] = stacks or [get_blank_stack()]
+    doc["inventory"]["items"] = normalized
+
+    equipment = doc.get("equipment") or {}
+    doc["equipment"] = {
+        slot: (
+            normalize_stack(equipment[slot], count=False)
+            if equipment.get(slot) and equipment[slot].get("item_id") not in (None, "")
+            else None
+        )
+        for slot in EQUIPMENT_SLOTS
+    }
+
+    attributes = doc.setdefault("attributes", {})
+    race = config.game.races.get(doc.get("race"))
+    main = attributes.get("main") or {}
+    if race is not None:
+        main = {**race.main, **main}
+    attributes["main"] = main
@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+import discord
+from discord import Embed
+
+log = logging.getLogger("red.rpg.outbound")
+
+# Logger of the discord.py HTTP client, which waits out rate limits itself
+# and logs every wait with the delay as the last argument, e.g.
+# "We are being rate limited. %s %s responded with 429. Retrying in %.2f
+# seconds." or "Global rate limit has been hit. Retrying in %.2f seconds."
+DISCORD_HTTP_LOGGER = "discord.http"
+
+
+class OutboundStats:
+    """Metrics of requests to the Discord API.
+
+    Attributes:
+        requests (int): The number of sent requests.
+        failures (int): The number of requests that raised an exception.
+        coalesced (int): The number of message edits that were replaced by a
+            newer edit before they were sent.
+        rate_limits (int): The number of rate limit waits, both inside
+            discord.py and after a 429 response it gave up on.
+        rate_limit_wait (float): Total rate limit wait in seconds.
+        max_rate_limit_wait (float): Longest rate limit wait in seconds.
+        total_latency (float): Total duration of requests in seconds,
+            including rate limit waits.
+        max_latency (float): Longest request in seconds.
+
+    """
+
+    __slots__ = (
+        "requests",
+        "failures",
+        "coalesced",
+        "rate_limits",
+        "rate_limit_wait",
+        "max_rate_limit_wait",
+        "total_latency",
+        "max_latency",
+    )
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.coalesced = 0
+        self.rate_limits = 0
+        self.rate_limit_wait = 0.0
+        self.max_rate_limit_wait = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def avg_latency(self) -> float:
+        """float: Average duration of requests in seconds."""
+        return self.total_latency / self.requests if self.requests else 0.0
+
+    def add_request(self, latency: float, failed: bool = False):
+        """Records a sent request.
+
+        Args:
+            latency (float): Request duration in seconds.
+            failed (:obj:`bool`, optional): The request raised an exception.
+        """
+        self.requests += 1
+        self.failures += failed
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def add_rate_limit(self, delay: float):
+        """Records a rate limit wait.
+
+        Args:
+            delay (float): Wait duration in seconds.
+        """
+        self.rate_limits += 1
+        self.rate_limit_wait += delay
+        self.max_rate_limit_wait = max(self.max_rate_limit_wait, delay)
+
+    def format(self) -> str:
+        """Returns the metrics as text.
+
+        Returns:
+            str: Metrics.
+
+        """
+        return (
+            f"requests: {self.requests} (failed {self.failures})\n"
+            f"latency: avg {self.avg_latency * 1000:.1f} ms, "
+            f"max {self.max_latency * 1000:.1f} ms\n"
+            f"coalesced edits: {self.coalesced}\n"
+            f"rate limits: {self.rate_limits}, "
+            f"waited {self.rate_limit_wait:.1f} s "
+            f"(max {self.max_rate_limit_wait:.1f} s)"
+        )
+
+
+class RateLimitHandler(logging.Handler):
+    """Logging handler that records the rate limit waits of discord.py.
+
+    discord.py sleeps on 429 responses and exhausted buckets inside its HTTP
+    client, so the waits are not visible to the callers otherwise. The
+    handler must be added to the `discord.http` logger.
+
+    Attributes:
+        stats (OutboundStats): Metrics to record the waits in.
+
+    """
+
+    def __init__(self, stats: OutboundStats):
+        super().__init__(logging.WARNING)
+        self.stats = stats
+
+    def emit(self, record: logging.LogRecord):
+        # A 429 that discord.py gives up on is logged as well, but it does not
+        # wait for it. It raises RateLimited, which `request` records.
+        msg = str(record.msg)
+        if "rate limit" not in msg or "Retrying in" not in msg or not record.args:
+            return
+        try:
+            self.stats.add_rate_limit(float(record.args[-1]))
+        except (TypeError, ValueError):
+            pass
+
+
+def get_retry_after(error: discord.HTTPException) -> float:
+    """Returns the delay of a 429 response.
+
+    Args:
+        error (discord.HTTPException): The raised exception.
+
+    Returns:
+        float: Delay in seconds, 1 if the response does not have one.
+
+    """
+    headers = getattr(error.response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After", 1))
+    except ValueError:
+        return 1.0
+
+
+async def request(
+    stats: OutboundStats,
+    func: Callable[..., Awaitable],
+    *args,
+    retries: int = 3,
+    **kwargs,
+):
+    """Sends a request to the Discord API and records its metrics.
+
+    discord.py retries rate limited requests by itself and raises a 429
+    error or RateLimited only when it gives up, in which case the request is
+    retried after the delay from the response.
+
+    Args:
+        stats (OutboundStats): Metrics.
+        func (Callable[..., Awaitable]): Coroutine function that sends the
+            request, e.g. `message.edit`.
+        *args: Positional arguments of the function.
+        retries (:obj:`int`, optional): How many times to retry a 429 error.
+        **kwargs: Keyword arguments of the function.
+
+    Returns:
+        The result of the function.
+
+    Raises:
+        discord.HTTPException: If the request failed.
+        discord.RateLimited: If the request is still rate limited after all
+            retries.
+
+    """
+    for attempt in range(retries + 1):
+        start = time.monotonic()
+        try:
+            result = await func(*args, **kwargs)
+        except (discord.HTTPException, discord.RateLimited) as e:
+            stats.add_request(time.monotonic() - start, failed=True)
+            if isinstance(e, discord.RateLimited):
+                delay = e.retry_after
+            elif e.status == 429:
+                delay = get_retry_after(e)
+            else:
+                raise
+            if attempt == retries:
+                raise
+            stats.add_rate_limit(delay)
+            await asyncio.sleep(delay)
+        else:
+            stats.add_request(time.monotonic() - start)
+            return result
+
+
+class MessageEditor:
+    """Coalesces edits of one message.
+
+    Edits do not wait for the request. Only one request per message is in
+    flight at a time, and while it is, newer edits replace each other, so
+    when it completes only the newest embed is sent. A burst of edits costs
+    at most two requests however long the API is rate limited.
+
+    Attributes:
+        loop (asyncio.AbstractEventLoop): Event loop to send the edits in.
+        message (discord.Message): The edited message.
+        stats (OutboundStats): Metrics.
+
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        message: discord.Message,
+        stats: OutboundStats,
+    ):
+        self.loop = loop
+        self.message = message
+        self.stats = stats
+        self._pending: Optional[Embed] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def edit(self, embed: Embed):
+        """Schedules the edit of the message.
+
+        The embed is copied, so the caller may keep changing it.
+
+        Args:
+            embed (Embed): The new embed.
+        """
+        if self._pending is not None:
+            self.stats.coalesced += 1
+        self._pending = embed.copy()
+        if self._task is None or self._task.done():
+            self._task = self.loop.create_task(self._send())
+
+    async def flush(self):
+        """Waits until all scheduled edits are sent."""
+        if self._task is not None and not self._task.done():
+            await asyncio.wait([self._task])
+
+    def close(self):
+        """Drops the scheduled edits."""
+        self._pending = None
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _send(self):
+        while self._pending is not None:
+            embed, self._pending = self._pending, None
+            try:
+                await request(self.stats, self.message.edit, embed=embed)
+            except discord.NotFound:
+                self._pending = None
+            except discord.HTTPException:
+                log.exception(f"Failed to edit message {self.message.id}")
@@ -0,0 +1,168 @@
+import time
+import zlib
+from typing import List
+
+from redbot.core.bot import Red
+
+
+class RegenScheduler:
+    """Class to run attribute regeneration of characters.
+
+    Only characters flagged with `Attributes.needs_regen` are processed, so
+    the cost of a tick depends on the number of injured characters rather
+    than on the number of registered ones. Characters are hashed by member ID
+    into buckets. Every tick interval is split into as many sub-intervals as
+    there are buckets, and only one bucket is processed per sub-interval, so
+    the load on the database and the event loop is spread evenly over the
+    whole interval. Ticks are run by the task supervisor every `slot`
+    seconds. All database work runs in worker threads, so a slow batch delays
+    the regeneration but never blocks the event loop.
+
+    Attributes:
+        bot (Red): Bot object.
+        character_class (type): Character document class.
+        interval (float): The number of seconds between two regenerations of
+            the same character.
+        buckets (int): The number of buckets characters are split into.
+        batch_size (int): The number of characters loaded and saved at once.
+            Adapts to the measured batch duration.
+        min_batch_size (int): Minimum batch size.
+        max_batch_size (int): Maximum batch size.
+        max_batch_time (float): Batch duration in seconds above which the
+            batch size is reduced.
+
+    """
+
+    def __init__(
+        self,
+        bot: Red,
+        character_class: type,
+        interval: float = 5,
+        buckets: int = 10,
+        batch_size: int = 50,
+        min_batch_size: int = 10,
+        max_batch_size: int = 500,
+        max_batch_time: float = 0.1,
+    ):
+        self.bot = bot
+        self.character_class = character_class
+        self.interval = interval
+        self.buckets = max(1, buckets)
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_batch_time = max_batch_time
+        self._pending: List[List[str]] = []
+
+    @staticmethod
+    def get_bucket(member_id: str, buckets: int) -> int:
+        """Returns the bucket of the character.
+
+        The built-in `hash` is salted per process, so CRC32 is used to keep
+        the buckets stable between restarts.
+
+        Args:
+            member_id (str): Member ID.
+            buckets (int): The number of buckets.
+
+        Returns:
+            int: Bucket number.
+
+        """
+        return zlib.crc32(member_id.encode()) % buckets
+
+    @property
+    def slot(self) -> float:
+        """float: The number of seconds between two ticks."""
+        return self.interval / self.buckets
+
+    async def tick(self):
+        """Regenerates attributes of the characters of the next bucket.
+
+        The buckets are reloaded once all of them are processed.
+        """
+        if not self._pending:
+            buckets = await self.bot.loop.run_in_executor(None, self.load_buckets)
+            self._pending = buckets[::-1]
+        await self.process_bucket(self._pending.pop())
+
+    def flag_injured(self):
+        """Sets the regeneration flag for injured characters that do not have it.
+
+        Characters saved before the flag existed are found by comparing their
+        pools with the maximum values on the server side.
+        """
+        pools = [
+            {
+                "$expr": {
+                    "$lt": [
+                        f"$attributes.{pool}",
+                        {
+                            "$add": [
+                                f"$attributes.main.{pool}_max",
+                                f"$attributes.main.{pool}_buff",
+                            ]
+                        },
+                    ]
+                }
+            }
+            for pool in ("health", "stamina", "magicka")
+        ]
+        self.character_class._get_collection().update_many(
+            {"attributes.needs_regen": {"$exists": False}, "$or": pools},
+            {"$set": {"attributes.needs_regen": True}},
+        )
+
+    def load_buckets(self) -> List[List[str]]:
+        """Splits IDs of the characters that need regeneration into buckets.
+
+        Returns:
+            List[List[str]]: Member IDs by bucket.
+
+        """
+        buckets = [[] for _ in range(self.buckets)]
+        chars = self.character_class.objects(attributes__needs_regen=True)
+        for member_id in chars.scalar("member_id"):
+            buckets[self.get_bucket(member_id, self.buckets)].append(member_id)
+        return buckets
+
+    async def process_bucket(self, member_ids: List[str]):
+        """Regenerates attributes of the characters of one bucket.
+
+        Args:
+            member_ids (List[str]): Member IDs of the bucket.
+        """
+        start = 0
+        while start < len(member_ids):
+            batch = member_ids[start : start + self.batch_size]
+            start += len(batch)
+            started = time.monotonic()
+            await self.bot.loop.run_in_executor(None, self.regen_batch, batch)
+            self.adapt_batch_size(time.monotonic() - started)
+
+    def regen_batch(self, member_ids: List[str]):
+        """Regenerates attributes of a batch of characters.
+
+        Args:
+            member_ids (List[str]): Member IDs.
+        """
+        # Imported on first use, as it pulls in numpy.
+        from .bulk_attributes import BulkAttributes
+
+        chars = BulkAttributes.load(self.character_class, member_ids)
+        chars.regen(self.interval)
+        chars.save(self.character_class)
+
+    def adapt_batch_size(self, duration: float):
+        """Adapts the batch size to the duration of the last batch.
+
+        The batch size is halved when a batch takes too long and grows by one
+        otherwise.
+
+        Args:
+            duration (float): Duration of the last batch in seconds.
+        """
+        if duration > self.max_batch_time:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+        else:
+            self.batch_size = min(self.max_batch_size, self.batch_size + 1)
@@ -8,6 +8,7 @@ from redbot.core.utils.chat_formatting import italics
 from redbot.core.utils.predicates import MessagePredicate, ReactionPredicate
 
 from .config import config
+from .outbound import MessageEditor, OutboundStats, request
 
 
 class RegisterSession:
@@ -23,10 +24,13 @@ class RegisterSession:
         embed (Embed): Embedded message, which is a registration form.
         message (discord.Message): The message object that contains the registration
             form.
+        stats (OutboundStats): Metrics of requests to the Discord API.
+        editor (MessageEditor): Coalesces edits of the registration form, so
+            only the latest state of the form is sent.
 
     """
 
-    def __init__(self, ctx: commands.Context):
+    def __init__(self, ctx: commands.Context, stats: OutboundStats = None):
         self.ctx = ctx
         self.char = {}
         self.complete = False
@@ -37,9 +41,12 @@ class RegisterSession:
         self.embed.set_author(name=config.bot.name, icon_url=config.bot.icon_url)
         self.embed.set_footer(text="Создание персонажа")
         self.message = None
+        self.stats = stats if stats is not None else OutboundStats()
+        self.editor = None
+        self._warning = None
 
     @classmethod
-    def start(cls, ctx: commands.Context):
+    def start(cls, ctx: commands.Context, stats: OutboundStats = None):
         """Creates and starts registration session.
 
         This allows the session to manage the running and cancellation of its
@@ -47,12 +54,14 @@ class RegisterSession:
 
         Args:
             ctx (commands.Context): Same as `RegisterSession.ctx`
+            stats (:obj:`OutboundStats`, optional): Same as
+                `RegisterSession.stats`
 
         Returns:
             RegisterSession: The new registration session being run.
 
         """
-        session = cls(ctx)
+        session = cls(ctx, stats)
         loop = ctx.bot.loop
         session._task = loop.create_task(session.run(ctx))
         return session
@@ -66,7 +75,8 @@ class RegisterSession:
         Args:
             ctx (commands.Context): Same as `RegisterSession.ctx`
         """
-        self.message = await ctx.send(embed=self.embed)
+        self.message = await request(self.stats, ctx.send, embed=self.embed)
+        self.editor = MessageEditor(ctx.bot.loop, self.message, self.stats)
         self.char["member_id"] = str(ctx.author.id)
         for stage in [
             self.name_select,
@@ -80,7 +90,8 @@ class RegisterSession:
         else:
             self.complete = True
             self.embed.title = "Персонаж создан!"
-            await self.message.edit(embed=self.embed)
+            self.editor.edit(self.embed)
+            await self.editor.flush()
             self.stop()
 
     def stop(self):
@@ -90,6 +101,8 @@ class RegisterSession:
     def force_stop(self):
         """Cancels whichever tasks this session is running."""
         self._task.cancel()
+        if self.editor is not None:
+            self.editor.close()
 
     async def cancel(self, embed: Embed = None, message: discord.Message = None):
         """Cancels registration and displays information about it.
@@ -104,9 +117,32 @@ class RegisterSession:
             message = self.message
         embed.clear_fields()
         embed.description = "Создание персонажа отменено."
-        await message.edit(embed=embed)
+        self.editor.edit(embed)
+        await self.editor.flush()
         self.stop()
 
+    async def warn(self, ctx: commands.Context):
+        """Tells the member that the input is invalid.
+
+        The warning is sent once per stage however many times the member
+        retries, see `RegisterSession.clear_warning`.
+
+        Args:
+            ctx (commands.Context): Same as `RegisterSession.ctx`
+        """
+        if self._warning is None:
+            self._warning = await request(self.stats, ctx.send, "Недопустимый ввод!")
+
+    async def clear_warning(self):
+        """Deletes the warning about invalid input, if it was sent."""
+        if self._warning is None:
+            return
+        warning, self._warning = self._warning, None
+        try:
+            await request(self.stats, warning.delete)
+        except discord.HTTPException:
+            pass
+
     async def name_select(
         self,
         ctx: commands.Context,
@@ -134,18 +170,18 @@ class RegisterSession:
                 "В имени персонажа должно быть **не менее 3** и **не более 25 символов**.\n"
                 "Имя персонажа должно состоять из символов **латинского алфавита** или **кириллицы.**"
             )
-            await message.edit(embed=embed)
+            self.editor.edit(embed)
             do_once = False
         try:
             name = await self.ctx.bot.wait_for(
                 "message", timeout=60.0, check=MessagePredicate.same_context(ctx)
             )
             name_content = name.content
-            await name.delete()
+            await request(self.stats, name.delete)
             if not re.match("""^[a-zа-яA-ZА-ЯёЁ\s]{3,25}$""", name_content):
-                incorrect = await ctx.send("Недопустимый ввод!")
+                await self.warn(ctx)
                 name_select = await self.name_select(ctx, embed, message, do_once)
-                await incorrect.delete()
+                await self.clear_warning()
                 if name_select:
                     return True
                 else:
@@ -153,7 +189,7 @@ class RegisterSession:
                     return False
             self.char["name"] = name_content
             embed.add_field(name="Имя", value=name_content, inline=True)
-            await message.edit(embed=embed)
+            self.editor.edit(embed)
             return True
         except asyncio.TimeoutError:
             await self.cancel(embed, message)
@@ -187,18 +223,18 @@ class RegisterSession:
                 "**Выберите расу персонажа**\n\n"
                 f"**Возможные варианты:** {', '.join(races)}."
             )
-            await message.edit(embed=embed)
+            self.editor.edit(embed)
             do_once = False
         try:
             race = await self.ctx.bot.wait_for(
                 "message", timeout=60.0, check=MessagePredicate.same_context(ctx)
             )
             race_content = race.content.lower()
-            await race.delete()
+            await request(self.stats, race.delete)
             if race_content not in races:
-                incorrect = await ctx.send("Недопустимый ввод!")
+                await self.warn(ctx)
                 race_select = await self.race_select(ctx, embed, message, do_once)
-                await incorrect.delete()
+                await self.clear_warning()
                 if race_select:
                     return True
                 else:
@@ -208,7 +244,7 @@ class RegisterSession:
                 list(_config.races.values()).index(race_content)
             ]
             embed.add_field(name="Раса", value=race_content.title(), inline=True)
-            await message.edit(embed=embed)
+            self.editor.edit(embed)
             return True
         except asyncio.TimeoutError:
             await self.cancel(embed, message)
@@ -230,12 +266,15 @@ class RegisterSession:
 
         """
         embed.description = "**Выберите пол персонажа**\n\n"
-        await message.edit(embed=embed)
+        self.editor.edit(embed)
         genders = {"👨": "male", "👩": "female"}
         try:
-
-            for gender in genders.keys():
-                await message.add_reaction(gender)
+            await asyncio.gather(
+                *(
+                    request(self.stats, message.add_reaction, gender)
+                    for gender in genders.keys()
+                )
+            )
             react, member = await self.ctx.bot.wait_for(
                 "reaction_add",
                 timeout=60.0,
@@ -243,21 +282,27 @@ class RegisterSession:
                     tuple(genders.keys()), message, ctx.author
                 ),
             )
-            await message.clear_reactions()
+            await request(self.stats, message.clear_reactions)
             self.char["sex"] = genders[react.emoji]
             embed.add_field(
                 name="Пол",
                 value=config.humanize.genders[genders[react.emoji]].title(),
                 inline=True,
             )
-            await message.edit(embed=embed)
+            self.editor.edit(embed)
             return True
         except asyncio.TimeoutError:
             try:
-                await message.clear_reactions()
+                await request(self.stats, message.clear_reactions)
             except discord.Forbidden:  # cannot remove all reactions
-                for gender in genders.keys():
-                    await message.remove_reaction(gender, ctx.bot.user)
+                await asyncio.gather(
+                    *(
+                        request(
+                            self.stats, message.remove_reaction, gender, ctx.bot.user
+                        )
+                        for gender in genders.keys()
+                    )
+                )
             except discord.NotFound:
                 return False
             await self.cancel(embed, message)
@@ -290,20 +335,20 @@ class RegisterSession:
                 "В описании персонажа должно быть **не менее 50** и **не более 2000 символов**.\n"
                 "Описание персонажа должно состоять из символов **латинского алфавита** или **кириллицы.**"
             )
-            await message.edit(embed=embed)
+            self.editor.edit(embed)
             do_once = False
         try:
             desc = await self.ctx.bot.wait_for(
                 "message", timeout=600.0, check=MessagePredicate.same_context(ctx)
             )
             desc_content = desc.content
-            await desc.delete()
+            await request(self.stats, desc.delete)
             if not re.match(
                 """[a-zа-яA-ZА-ЯёЁ\d\s!.,%*'";:()\[\]<>\-«»—]{50,2000}""", desc_content
             ):
-                incorrect = await ctx.send("Недопустимый ввод!")
+                await self.warn(ctx)
                 desc_select = await self.desc_select(ctx, embed, message, do_once)
-                await incorrect.delete()
+                await self.clear_warning()
                 if desc_select:
                     return True
                 else:
@@ -311,7 +356,7 @@ class RegisterSession:
                     return False
             self.char["desc"] = desc_content
             embed.description = italics(desc_content)
-            await message.edit(embed=embed)
+            self.editor.edit(embed)
             return True
         except asyncio.TimeoutError:
             await self.cancel(embed, message)
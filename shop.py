@@ -0,0 +1,96 @@
+from bisect import bisect_right, insort
+from typing import Iterable, List, NamedTuple, Optional
+
+
+class Listing(NamedTuple):
+    """Shop listing of an item."""
+
+    price: int
+    rarity_rank: int
+    name: str
+    item_id: int
+
+
+class ShopCatalog:
+    """In-memory index of the items sold in the shop.
+
+    Listings are kept sorted by price, then by rarity and name, both for the
+    whole catalog and for every rarity, so a page of listings up to a maximum
+    price is a binary search and a slice.
+
+    Attributes:
+        rarities (tuple): Rarities from the most common to the rarest.
+
+    """
+
+    rarities = ("common", "rare", "epic", "legendary")
+
+    def __init__(self):
+        self._listings: List[Listing] = []
+        self._by_rarity = {rarity: [] for rarity in self.rarities}
+
+    def __len__(self):
+        return len(self._listings)
+
+    def build(self, items: Iterable):
+        """Rebuilds the catalog.
+
+        Args:
+            items (Iterable): Items with `item_id`, `name`, `price` and
+                `rarity`.
+        """
+        all_listings = []
+        by_rarity = {rarity: [] for rarity in self.rarities}
+        for item in items:
+            listing = self._get_listing(item)
+            if listing is not None:
+                all_listings.append(listing)
+                by_rarity[item.rarity].append(listing)
+        all_listings.sort()
+        for listings in by_rarity.values():
+            listings.sort()
+        self._listings, self._by_rarity = all_listings, by_rarity
+
+    def add(self, item):
+        """Adds the item to the catalog.
+
+        Args:
+            item: Item with `item_id`, `name`, `price` and `rarity`.
+        """
+        listing = self._get_listing(item)
+        if listing is not None:
+            insort(self._listings, listing)
+            insort(self._by_rarity[item.rarity], listing)
+
+    def _get_listing(self, item) -> Optional[Listing]:
+        if item.price is None or item.rarity not in self._by_rarity:
+            return None
+        return Listing(
+            int(item.price), self.rarities.index(item.rarity), item.name, item.item_id
+        )
+
+    def get_listings(
+        self,
+        rarity: str = None,
+        max_price: int = None,
+        offset: int = 0,
+        count: int = 10,
+    ) -> List[Listing]:
+        """Returns a page of listings sorted by price.
+
+        Args:
+            rarity (:obj:`str`, optional): Rarity of the items. Defaults to
+                None, which means any rarity.
+            max_price (:obj:`int`, optional): Maximum price. Defaults to None.
+            offset (int): The number of listings to skip.
+            count (int): The number of listings.
+
+        Returns:
+            List[Listing]: Listings.
+
+        """
+        listings = self._listings if rarity is None else self._by_rarity[rarity]
+        end = len(listings)
+        if max_price is not None:
+            end = bisect_right(listings, (max_price, len(self.rarities)))
+        return listings[offset : min(end, offset + count)]
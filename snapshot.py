@@ -0,0 +1,247 @@
+import argparse
+import gzip
+import sys
+from typing import Iterator, List, NamedTuple, Optional
+
+import bson
+from bson import json_util
+from mongoengine import ValidationError
+from pymongo import MongoClient, ReplaceOne
+from pymongo.errors import BulkWriteError
+
+
+class ImportResult(NamedTuple):
+    """Result of an import.
+
+    `errors` contains messages of the first invalid documents.
+    """
+
+    imported: int
+    invalid: int
+    errors: List[str]
+
+
+def is_bson(path: str) -> bool:
+    """Returns whether the snapshot is BSON rather than JSON Lines.
+
+    Args:
+        path (str): Snapshot path. `.bson` and `.bson.gz` files are BSON.
+
+    Returns:
+        bool: The snapshot is BSON or not.
+
+    """
+    return path.endswith(".bson") or path.endswith(".bson.gz")
+
+
+def open_snapshot(path: str, mode: str):
+    """Opens a snapshot file, compressed with gzip if it ends with `.gz`.
+
+    Args:
+        path (str): Snapshot path.
+        mode (str): `r` or `w`.
+
+    Returns:
+        A binary file object.
+
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, f"{mode}b", compresslevel=6)
+    return open(path, f"{mode}b")
+
+
+def export_characters(
+    collection,
+    path: str,
+    batch_size: int = 1000,
+    projection: Optional[dict] = None,
+) -> int:
+    """Streams all characters to a snapshot.
+
+    Documents are read with a cursor in batches of `batch_size` and written
+    one by one, so memory use does not depend on the number of characters.
+
+    Args:
+        collection (Collection): Character collection.
+        path (str): Snapshot path.
+        batch_size (:obj:`int`, optional): Cursor batch size.
+        projection (:obj:`dict`, optional): Fields to export. Defaults to
+            None, which means all fields.
+
+    Returns:
+        int: The number of exported characters.
+
+    """
+    count = 0
+    as_bson = is_bson(path)
+    cursor = collection.find({}, projection, batch_size=batch_size).sort("_id", 1)
+    with open_snapshot(path, "w") as file:
+        for doc in cursor:
+            if as_bson:
+                file.write(bson.BSON.encode(doc))
+            else:
+                file.write(json_util.dumps(doc).encode("utf-8"))
+                file.write(b"\n")
+            count += 1
+    return count
+
+
+def read_snapshot(path: str) -> Iterator[dict]:
+    """Reads documents from a snapshot one by one.
+
+    Args:
+        path (str): Snapshot path.
+
+    Yields:
+        dict: Character documents.
+
+    """
+    with open_snapshot(path, "r") as file:
+        if is_bson(path):
+            yield from bson.decode_file_iter(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json_util.loads(line)
+
+
+def import_characters(
+    collection,
+    path: str,
+    character_class: type = None,
+    batch_size: int = 1000,
+    upsert: bool = True,
+    max_errors: int = 10,
+) -> ImportResult:
+    """Streams characters from a snapshot into the collection.
+
+    Documents are written in batches of `batch_size`: replaced by ID when
+    `upsert` is set, otherwise inserted, skipping existing IDs. Every batch
+    gets `updated_at` from the server clock afterwards, so change watchers
+    that poll by it pick up the imported characters.
+
+    Args:
+        collection (Collection): Character collection.
+        path (str): Snapshot path.
+        character_class (:obj:`type`, optional): Character document class.
+            If given, every document is validated against its field rules and
+            invalid documents are skipped.
+        batch_size (:obj:`int`, optional): The number of documents per write.
+        upsert (:obj:`bool`, optional): Replace existing characters. Defaults
+            to True.
+        max_errors (:obj:`int`, optional): The number of error messages to
+            keep.
+
+    Returns:
+        ImportResult: Result of the import.
+
+    """
+    imported = 0
+    invalid = 0
+    errors = []
+    batch = []
+
+    def flush():
+        if not batch:
+            return 0
+        if upsert:
+            result = collection.bulk_write(
+                [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in batch],
+                ordered=False,
+            )
+            written = result.upserted_count + result.matched_count
+        else:
+            try:
+                written = len(collection.insert_many(batch, ordered=False).inserted_ids)
+            except BulkWriteError as e:
+                written = e.details["nInserted"]
+        # Skipped existing characters are stamped too, which only makes the
+        # watchers reload them.
+        collection.update_many(
+            {"_id": {"$in": [doc["_id"] for doc in batch]}},
+            {"$currentDate": {"updated_at": True}},
+        )
+        batch.clear()
+        return written
+
+    for doc in read_snapshot(path):
+        if character_class is not None:
+            try:
+                character_class._from_son(doc).validate()
+            except (ValidationError, KeyError, TypeError, ValueError) as e:
+                invalid += 1
+                if len(errors) < max_errors:
+                    errors.append(f"{doc.get('_id')}: {e}")
+                continue
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            imported += flush()
+    imported += flush()
+    return ImportResult(imported, invalid, errors)
+
+
+def main(argv: List[str] = None):
+    """Exports or imports character snapshots.
+
+    Run it as a module of the cog package, so that the config and the
+    document classes can be imported.
+
+    Example:
+        python -m rpg.snapshot export characters.jsonl.gz
+        python -m rpg.snapshot import characters.jsonl.gz --no-upsert
+    """
+    from .config import config
+
+    parser = argparse.ArgumentParser(description="Export or import characters.")
+    parser.add_argument("action", choices=("export", "import"))
+    parser.add_argument(
+        "path", help="snapshot path (.jsonl, .bson, optionally with .gz)"
+    )
+    parser.add_argument("--host", default=config.database.host)
+    parser.add_argument("--port", type=int, default=config.database.port)
+    parser.add_argument("--user", default=config.database.user)
+    parser.add_argument("--password", default=config.database.password)
+    parser.add_argument("--db", default=config.database.db)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--no-upsert", action="store_true", help="skip existing characters"
+    )
+    parser.add_argument(
+        "--no-validate", action="store_true", help="do not validate documents"
+    )
+    args = parser.parse_args(argv)
+
+    client = MongoClient(
+        args.host,
+        args.port,
+        username=args.user or None,
+        password=args.password or None,
+    )
+    collection = client[args.db]["character"]
+    if args.action == "export":
+        count = export_characters(collection, args.path, args.batch_size)
+        print(f"{count} characters exported to {args.path}.", file=sys.stderr)
+        return
+
+    character_class = None
+    if not args.no_validate:
+        from .RPG import Character
+
+        character_class = Character
+    result = import_characters(
+        collection,
+        args.path,
+        character_class,
+        args.batch_size,
+        upsert=not args.no_upsert,
+    )
+    for error in result.errors:
+        print(error, file=sys.stderr)
+    print(
+        f"{result.imported} characters imported, {result.invalid} invalid.",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
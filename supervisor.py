@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+from redbot.core.bot import Red
+
+log = logging.getLogger("red.rpg.supervisor")
+
+
+class TaskStats:
+    """Metrics of a supervised task.
+
+    Attributes:
+        name (str): Task name.
+        interval (Optional[float]): Tick interval of a periodic task in
+            seconds. None for a long-running task.
+        starts (int): The number of times the task was started.
+        failures (int): The number of times the task raised an exception.
+        last_error (Optional[str]): The last exception.
+        ticks (int): The number of completed ticks of a periodic task.
+        skipped (int): The number of ticks skipped because the previous tick
+            or the event loop was late.
+        last_runtime (float): Duration of the last tick in seconds.
+        total_runtime (float): Total duration of all ticks in seconds.
+        max_runtime (float): Longest tick in seconds.
+        last_lag (float): How late the last tick started, in seconds.
+        max_lag (float): Maximum tick lag in seconds.
+        running_since (Optional[float]): Monotonic time the current run
+            started. None if the task is not running.
+
+    """
+
+    __slots__ = (
+        "name",
+        "interval",
+        "starts",
+        "failures",
+        "last_error",
+        "ticks",
+        "skipped",
+        "last_runtime",
+        "total_runtime",
+        "max_runtime",
+        "last_lag",
+        "max_lag",
+        "running_since",
+    )
+
+    def __init__(self, name: str, interval: float = None):
+        self.name = name
+        self.interval = interval
+        self.starts = 0
+        self.failures = 0
+        self.last_error = None
+        self.ticks = 0
+        self.skipped = 0
+        self.last_runtime = 0.0
+        self.total_runtime = 0.0
+        self.max_runtime = 0.0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.running_since = None
+
+    @property
+    def avg_runtime(self) -> float:
+        """float: Average duration of a tick in seconds."""
+        return self.total_runtime / self.ticks if self.ticks else 0.0
+
+    def record_tick(self, lag: float, runtime: float):
+        """Records a completed tick.
+
+        Args:
+            lag (float): How late the tick started, in seconds.
+            runtime (float): Duration of the tick in seconds.
+        """
+        self.ticks += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.last_runtime = runtime
+        self.total_runtime += runtime
+        self.max_runtime = max(self.max_runtime, runtime)
+
+
+class TaskSupervisor:
+    """Class that owns all background tasks of the cog.
+
+    A task that raises an exception is restarted after an exponential
+    backoff with random jitter, so tasks failing for the same reason do not
+    retry in lockstep. The backoff is reset if the task ran for longer than
+    `max_delay` before failing. A task that returns normally is finished. Periodic
+    tasks are run on a fixed schedule: when a tick takes longer than the
+    interval, the missed ticks are skipped instead of being run back to back.
+    All tasks are cancelled at once with `TaskSupervisor.cancel_all`, so
+    reloading the cog does not leave duplicate loops behind.
+
+    Attributes:
+        bot (Red): Bot object.
+        base_delay (float): Restart delay after the first failure in seconds.
+        max_delay (float): Maximum restart delay in seconds.
+        jitter (float): Relative random deviation of the restart delay.
+        stats (Dict[str, TaskStats]): Metrics by task name.
+
+    """
+
+    def __init__(
+        self,
+        bot: Red,
+        base_delay: float = 1,
+        max_delay: float = 300,
+        jitter: float = 0.5,
+    ):
+        self.bot = bot
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.stats: Dict[str, TaskStats] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def __contains__(self, name: str) -> bool:
+        task = self._tasks.get(name)
+        return task is not None and not task.done()
+
+    def add(self, name: str, factory: Callable[[], Awaitable]):
+        """Starts a supervised task, if a task with this name is not running.
+
+        Args:
+            name (str): Task name.
+            factory (Callable[[], Awaitable]): Returns the coroutine to run.
+                It is called again on every restart.
+        """
+        if name in self:
+            return
+        self.stats[name] = TaskStats(name)
+        self._tasks[name] = self.bot.loop.create_task(self._supervise(name, factory))
+
+    def add_periodic(
+        self,
+        name: str,
+        func: Callable[[], Awaitable],
+        interval: Union[float, Callable[[], float]],
+    ):
+        """Starts a supervised task that runs `func` every `interval` seconds.
+
+        Args:
+            name (str): Task name.
+            func (Callable[[], Awaitable]): Returns the coroutine of one tick.
+            interval (Union[float, Callable[[], float]]): Tick interval in
+                seconds, or a function returning the delay before every tick.
+        """
+        if name in self:
+            return
+        self.stats[name] = TaskStats(
+            name, None if callable(interval) else float(interval)
+        )
+        self._tasks[name] = self.bot.loop.create_task(
+            self._supervise(name, lambda: self._run_periodic(name, func, interval))
+        )
+
+    def cancel(self, name: str):
+        """Cancels the task.
+
+        Args:
+            name (str): Task name.
+        """
+        task = self._tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+
+    def cancel_all(self):
+        """Cancels all tasks."""
+        for name in list(self._tasks):
+            self.cancel(name)
+
+    def get_stats(self) -> List[TaskStats]:
+        """Returns metrics of all tasks sorted by name.
+
+        Returns:
+            List[TaskStats]: Metrics.
+
+        """
+        return [self.stats[name] for name in sorted(self.stats)]
+
+    def get_delay(self, failures: int) -> float:
+        """Returns the restart delay after consecutive failures.
+
+        Args:
+            failures (int): The number of consecutive failures.
+
+        Returns:
+            float: Delay in seconds.
+
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (failures - 1))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def _supervise(self, name: str, factory: Callable[[], Awaitable]):
+        stats = self.stats[name]
+        failures = 0
+        while True:
+            stats.starts += 1
+            stats.running_since = time.monotonic()
+            try:
+                await factory()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if time.monotonic() - stats.running_since > self.max_delay:
+                    failures = 0
+                failures += 1
+                stats.failures += 1
+                stats.last_error = f"{type(e).__name__}: {e}"
+                delay = self.get_delay(failures)
+                log.exception(f"Task {name} failed, restarting in {delay:.1f} s")
+            finally:
+                stats.running_since = None
+            await asyncio.sleep(delay)
+
+    async def _run_periodic(
+        self,
+        name: str,
+        func: Callable[[], Awaitable],
+        interval: Union[float, Callable[[], float]],
+    ):
+        stats = self.stats[name]
+        loop = self.bot.loop
+        due = loop.time()
+        while True:
+            delay = interval() if callable(interval) else interval
+            started = loop.time()
+            lag = max(0.0, started - due)
+            await func()
+            finished = loop.time()
+            stats.record_tick(lag, finished - started)
+            due += delay
+            if finished > due:
+                missed = int((finished - due) // delay) + 1 if delay > 0 else 0
+                stats.skipped += missed
+                due += missed * delay
+            await asyncio.sleep(max(0.0, due - loop.time()))
+
+
+def format_stats(stats: List[TaskStats], now: Optional[float] = None) -> str:
+    """Returns metrics of the tasks as a table.
+
+    Args:
+        stats (List[TaskStats]): Metrics.
+        now (:obj:`float`, optional): Current monotonic time.
+
+    Returns:
+        str: Table text.
+
+    """
+    if now is None:
+        now = time.monotonic()
+    lines = [
+        f"{'task':<12} {'state':<8} {'starts':>6} {'fails':>5} {'ticks':>7} "
+        f"{'skip':>5} {'avg ms':>8} {'max ms':>8} {'lag ms':>8} {'max lag':>8}"
+    ]
+    for task in stats:
+        state = "running" if task.running_since is not None else "stopped"
+        lines.append(
+            f"{task.name:<12} {state:<8} {task.starts:>6} {task.failures:>5} "
+            f"{task.ticks:>7} {task.skipped:>5} {task.avg_runtime * 1000:>8.1f} "
+            f"{task.max_runtime * 1000:>8.1f} {task.last_lag * 1000:>8.1f} "
+            f"{task.max_lag * 1000:>8.1f}"
+        )
+        if task.last_error:
+            lines.append(f"  last error: {task.last_error}")
+    return "\n".join(lines)
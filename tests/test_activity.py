@@ -0,0 +1,115 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from rpg.activity import ActivityAccumulator
+
+
+class FailingExperience:
+    """Grants experience in batches and fails on the given batch."""
+
+    def __init__(self, batch_size: int, fail_on: int = None):
+        self.batch_size = batch_size
+        self.fail_on = fail_on
+        self.granted = {}
+        self.calls = 0
+
+    def grant(self, grants):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise ConnectionError("database is down")
+        self.granted.update(grants)
+        return [SimpleNamespace(member_id=member_id) for member_id in grants]
+
+
+def flush(accumulator: ActivityAccumulator):
+    async def run():
+        accumulator.bot = SimpleNamespace(loop=asyncio.get_running_loop())
+        await accumulator.flush()
+
+    asyncio.run(run())
+
+
+def make_accumulator(experience, flushed):
+    return ActivityAccumulator(
+        None, experience, flushed.extend, xp_per_message=5, cooldown=0
+    )
+
+
+def test_record_respects_the_window():
+    accumulator = ActivityAccumulator(
+        None, None, None, cooldown=10, window=100, max_per_window=2
+    )
+    assert accumulator.record("1", now=0)
+    assert not accumulator.record("1", now=5)
+    assert accumulator.record("1", now=10)
+    assert not accumulator.record("1", now=20)
+    assert accumulator.record("1", now=100)
+
+
+def test_flush_grants_all_batches():
+    experience = FailingExperience(batch_size=2)
+    flushed = []
+    accumulator = make_accumulator(experience, flushed)
+    for member_id in "abcde":
+        accumulator.record(member_id)
+    flush(accumulator)
+    assert experience.granted == dict.fromkeys("abcde", 5)
+    assert len(flushed) == 5
+    assert accumulator._pending == {}
+
+
+def test_failed_batch_is_kept_for_the_next_flush():
+    experience = FailingExperience(batch_size=2, fail_on=2)
+    flushed = []
+    accumulator = make_accumulator(experience, flushed)
+    for member_id in "abcde":
+        accumulator.record(member_id)
+    with pytest.raises(ConnectionError):
+        flush(accumulator)
+    assert experience.granted == dict.fromkeys("ab", 5)
+    assert len(flushed) == 2
+    assert accumulator._pending == dict.fromkeys("cde", 5)
+
+    flush(accumulator)
+    assert experience.granted == dict.fromkeys("abcde", 5)
+
+
+class BlockingExperience(FailingExperience):
+    """Grants experience once the test releases it."""
+
+    def __init__(self, batch_size: int):
+        super().__init__(batch_size)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def grant(self, grants):
+        self.started.set()
+        self.release.wait(5)
+        return super().grant(grants)
+
+
+def test_cancelled_flush_does_not_restore_the_batch_in_flight():
+    experience = BlockingExperience(batch_size=2)
+    accumulator = make_accumulator(experience, [])
+    for member_id in "abcde":
+        accumulator.record(member_id)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        accumulator.bot = SimpleNamespace(loop=loop)
+        task = loop.create_task(accumulator.flush())
+        await loop.run_in_executor(None, experience.started.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        experience.release.set()
+        # The executor thread finishes the batch in flight.
+        while not experience.granted:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert experience.granted == dict.fromkeys("ab", 5)
+    assert accumulator._pending == dict.fromkeys("cde", 5)
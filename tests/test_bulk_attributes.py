@@ -0,0 +1,87 @@
+import itertools
+from types import SimpleNamespace
+
+import numpy as np
+
+from rpg.RPG import Attributes
+from rpg.bulk_attributes import BulkAttributes
+
+MAIN = {
+    "health_max": 100,
+    "health_buff": 10,
+    "health_regen": 2,
+    "stamina_max": 50,
+    "stamina_buff": 0,
+    "stamina_regen": 5,
+}
+
+
+def make_doc(member_id, health, stamina, magicka=None, needs_regen=None):
+    attributes = {"health": health, "stamina": stamina, "main": dict(MAIN)}
+    if magicka is not None:
+        attributes["magicka"] = magicka
+    if needs_regen:
+        attributes["needs_regen"] = True
+    return {"_id": member_id, "attributes": attributes}
+
+
+def test_mod_values_matches_mod_value():
+    cases = list(itertools.product((0, 0.5, 30, 109.5, 110), (-200, -29.5, 0, 5, 90)))
+    docs = [make_doc(str(i), value, value, value) for i, (value, _) in enumerate(cases)]
+    batch = BulkAttributes.from_documents(docs, now=0)
+    damage = np.array([[damage] * 3 for _, damage in cases], dtype=float)
+    batch.mod_values(damage)
+    for row, (value, damage) in enumerate(cases):
+        attributes = Attributes(
+            dict(MAIN), {}, {}, 0, health=value, stamina=value, magicka=value
+        )
+        for pool in BulkAttributes.pools:
+            attributes.mod_value(pool, damage)
+        expected = [getattr(attributes, pool) for pool in BulkAttributes.pools]
+        assert list(batch.values[row]) == expected, (value, damage)
+        assert bool(batch.needs_regen[row]) == bool(attributes.needs_regen)
+
+
+class Collection:
+    def __init__(self):
+        self.requests = []
+
+    def bulk_write(self, requests, ordered=True):
+        self.requests.extend(requests)
+        return SimpleNamespace(matched_count=len(requests))
+
+
+def test_updates_are_guarded_by_the_loaded_values():
+    docs = [
+        make_doc("full", 110, 50, needs_regen=True),
+        make_doc("hurt", 20, 50, magicka=3),
+    ]
+    batch = BulkAttributes.from_documents(docs, now=0)
+    batch.regen(1)
+    updates = batch.get_updates()
+    assert [update._filter for update in updates] == [
+        {
+            "_id": "full",
+            "attributes.health": 110.0,
+            "attributes.stamina": 50.0,
+            "attributes.magicka": {"$exists": False},
+        },
+        {
+            "_id": "hurt",
+            "attributes.health": 20.0,
+            "attributes.stamina": 50.0,
+            "attributes.magicka": 3.0,
+        },
+    ]
+    full, hurt = (update._doc for update in updates)
+    assert full["$unset"] == {"attributes.needs_regen": ""}
+    assert hurt["$set"] == {
+        "attributes.health": 22.0,
+        "attributes.stamina": 50.0,
+        "attributes.magicka": 3.0,
+        "attributes.needs_regen": True,
+    }
+    collection = Collection()
+    character_class = SimpleNamespace(_get_collection=lambda: collection)
+    assert batch.save(character_class) == 2
+    assert batch.get_updates() == []
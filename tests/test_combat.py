@@ -0,0 +1,53 @@
+import random
+
+from rpg.balance import get_fighters, main, run
+from rpg.combat import Combatant, CombatRules, resolve_duel
+
+MAIN = {"health_max": 100, "stamina_max": 100}
+SKILLS = {"one_handed": 20, "block": 10}
+SWORD = {"name": "sword", "damage": 12, "hands": 1, "attack_type": "melee"}
+
+
+def make_fighter(name: str, weapon: dict = None) -> Combatant:
+    return Combatant.from_stats(name, MAIN, SKILLS, 5, weapon=weapon)
+
+
+def test_from_stats_uses_the_weapon_skill():
+    fighter = make_fighter("a", SWORD)
+    assert fighter.damage == 12
+    assert fighter.skill == 20
+    assert make_fighter("b").damage == 5
+
+
+def test_duel_is_deterministic():
+    first, second = make_fighter("a", SWORD), make_fighter("b")
+    results = [resolve_duel(first, second, random.Random(7)) for _ in range(2)]
+    assert results[0] == results[1]
+    assert first.health == 100
+
+
+def test_duel_ends_at_yield_health():
+    rules = CombatRules()
+    result = resolve_duel(
+        make_fighter("a", SWORD), make_fighter("b"), random.Random(1), rules
+    )
+    assert result.winner is not None
+    loser = 1 - result.winner
+    assert result.health[loser] <= 100 * rules.yield_health
+    assert all(health >= 0 for health in result.health)
+
+
+def test_win_rates_do_not_depend_on_workers():
+    races = {"nord": {"main": MAIN, "skills": SKILLS, "unarmed_damage": 5}}
+    fighters = get_fighters(races, [SWORD], {})
+    rules = CombatRules()
+    assert run(fighters, 50, 3, rules, workers=1) == run(
+        fighters, 50, 3, rules, workers=2
+    )
+
+
+def test_main_runs_with_the_shipped_config(tmp_path):
+    out = tmp_path / "matrix.csv"
+    main(["--fights", "2", "--seed", "1", "--workers", "1", "--out", str(out)])
+    rows = out.read_text(encoding="utf-8").splitlines()
+    assert len(rows) == len(rows[0].split(","))
@@ -0,0 +1,115 @@
+from types import SimpleNamespace
+
+from rpg.coordination import EventBus
+
+
+class CappedCollection:
+    """Stand-in of a capped collection read with tailable cursors.
+
+    `script` is called with the collection every time a cursor reaches the
+    end of the data, and may insert or evict events, kill the cursor or stop
+    the bus.
+    """
+
+    def __init__(self, events, script):
+        self.events = list(events)
+        self.script = script
+        self.cursors = 0
+
+    def find_one(self, sort=None, projection=None):
+        return self.events[-1] if self.events else None
+
+    def find(self, cursor_type=None):
+        self.cursors += 1
+        return Cursor(self)
+
+
+class Cursor:
+    def __init__(self, collection: CappedCollection):
+        self.collection = collection
+        self.alive = True
+        self.position = None
+
+    def max_await_time_ms(self, ms):
+        return self
+
+    def try_next(self):
+        events = self.collection.events
+        if self.position is None:
+            index = 0
+        else:
+            index = next(
+                (
+                    i + 1
+                    for i, event in enumerate(events)
+                    if event["_id"] == self.position
+                ),
+                0,
+            )
+        if index < len(events):
+            self.position = events[index]["_id"]
+            return events[index]
+        self.collection.script(self.collection, self)
+        return None
+
+
+def event(event_id, source="other"):
+    return {"_id": event_id, "topic": "test", "source": source, "data": {}}
+
+
+def tail(collection: CappedCollection):
+    received = []
+    loop = SimpleNamespace(
+        call_soon_threadsafe=lambda func, event: received.append(event)
+    )
+    bus = EventBus(SimpleNamespace(loop=loop), "me")
+    bus.get_collection = lambda: collection
+    collection.bus = bus
+    bus._tail()
+    return [event["_id"] for event in received]
+
+
+def test_resumes_after_the_last_event_in_natural_order():
+    steps = iter(
+        [
+            # The ObjectIds of other processes may go backwards.
+            lambda events, cursor: events.extend([event(9), event(3)]),
+            lambda events, cursor: (
+                setattr(cursor, "alive", False),
+                events.extend([event(1), event(2, source="me")]),
+            ),
+        ]
+    )
+
+    def script(collection, cursor):
+        step = next(steps, None)
+        if step is None:
+            collection.bus.stop()
+        else:
+            step(collection.events, cursor)
+
+    collection = CappedCollection([event(5), event(7)], script)
+    assert tail(collection) == [9, 3, 1]
+    assert collection.cursors == 2
+
+
+def test_delivers_everything_when_the_last_event_is_evicted():
+    steps = iter(
+        [
+            lambda events, cursor: (
+                setattr(cursor, "alive", False),
+                events.clear(),
+                events.extend([event(4), event(1)]),
+            ),
+        ]
+    )
+
+    def script(collection, cursor):
+        step = next(steps, None)
+        if step is None:
+            collection.bus.stop()
+        else:
+            step(collection.events, cursor)
+
+    collection = CappedCollection([event(5)], script)
+    assert tail(collection) == [4, 1]
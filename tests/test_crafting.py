@@ -0,0 +1,49 @@
+from rpg.crafting import Recipe, RecipeIndex, get_craft_change, get_temper
+
+RECIPES = [
+    {"output": 10, "ingredients": {"1": 2, "2": 1}, "skill": 20},
+    {"output": 10, "count": 2, "ingredients": {"3": 4}},
+    {"output": 11, "ingredients": {"2": 1, "1": 2}},
+    {"output": 12, "ingredients": {"1": 1, "4": 1}},
+]
+
+
+def make_index():
+    index = RecipeIndex()
+    index.build(RECIPES)
+    return index
+
+
+def test_ingredients_are_normalized():
+    recipe = Recipe.from_config(RECIPES[0])
+    assert recipe == Recipe(10, 1, ((1, 2), (2, 1)), 20)
+
+
+def test_find_and_get_recipes():
+    index = make_index()
+    assert [recipe.output for recipe in index.find({2: 1, 1: 2})] == [10, 11]
+    assert index.find({1: 2}) == []
+    assert [recipe.count for recipe in index.get_recipes(10)] == [1, 2]
+
+
+def test_get_craftable():
+    index = make_index()
+    craftable = index.get_craftable({1: 5, 2: 3, 3: 3, 5: 1}, skill=10)
+    assert [(recipe.output, times) for recipe, times in craftable] == [(11, 2)]
+    craftable = index.get_craftable({1: 5, 2: 3, 3: 8, 4: 1})
+    assert [(recipe.output, times) for recipe, times in craftable] == [
+        (10, 2),
+        (10, 2),
+        (11, 2),
+        (12, 1),
+    ]
+
+
+def test_craft_change():
+    recipe = Recipe.from_config(RECIPES[1])
+    items = {3: "ore", 10: "ingot"}
+    change = get_craft_change("a", recipe, items, 3, "Maker", 2)
+    assert change.items == (("ore", -12, None, None), ("ingot", 6, "Maker", 2))
+    assert get_temper(45, 20, 5) == 2
+    assert get_temper(10, 20, 5) is None
+    assert get_temper(500, 20, 5) == 5
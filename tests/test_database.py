@@ -0,0 +1,69 @@
+import time
+
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+from rpg.database import ReadPolicy, get_read_preference
+
+
+class ReplicaSet:
+    """Stand-in of a replica set whose secondary lags behind the primary.
+
+    Reads are routed by the mode of the read preference, like the driver
+    does when a secondary is available.
+    """
+
+    def __init__(self):
+        self.primary = {}
+        self.secondary = {}
+        self.reads = []
+
+    def write(self, key, value):
+        self.primary[key] = value
+
+    def replicate(self):
+        self.secondary = dict(self.primary)
+
+    def read(self, key, read_preference):
+        self.reads.append(read_preference.mongos_mode)
+        if read_preference.mode == Primary().mode:
+            return self.primary.get(key)
+        return self.secondary.get(key)
+
+
+def test_writer_reads_own_writes_from_the_primary():
+    replica_set = ReplicaSet()
+    reads = ReadPolicy(own_writes_window=60)
+    replica_set.write("item", "new")
+    reads.mark_write("guild-1")
+
+    assert replica_set.read("item", reads.get("guild-1")) == "new"
+    assert replica_set.read("item", reads.get("guild-2")) is None
+    assert replica_set.read("item", reads.get()) is None
+    assert replica_set.reads == ["primary", "secondaryPreferred", "secondaryPreferred"]
+
+    replica_set.replicate()
+    assert replica_set.read("item", reads.get("guild-2")) == "new"
+
+
+def test_target_written_by_another_member_is_read_from_the_primary():
+    reads = ReadPolicy(own_writes_window=60)
+    # An admin has changed the inventory of "target".
+    reads.mark_write("target")
+    assert isinstance(reads.get("admin"), SecondaryPreferred)
+    assert isinstance(reads.get("admin", "target"), Primary)
+
+
+def test_window_expires():
+    reads = ReadPolicy(own_writes_window=0.01)
+    reads.mark_write("guild-1")
+    assert reads.has_written("guild-1")
+    time.sleep(0.02)
+    assert not reads.has_written("guild-1")
+    assert isinstance(reads.get("guild-1"), SecondaryPreferred)
+    assert "guild-1" not in reads._writes
+
+
+def test_read_preference_options():
+    assert isinstance(get_read_preference("primary"), Primary)
+    mode = get_read_preference("secondaryPreferred", max_staleness=120)
+    assert mode.max_staleness == 120
@@ -0,0 +1,50 @@
+import random
+
+from rpg.effects import (
+    BUFF,
+    get_effective_stats,
+    is_active,
+    make_effect,
+    resists_disease,
+)
+
+
+class FixedRandom(random.Random):
+    def __init__(self, value: float):
+        super().__init__()
+        self.value = value
+
+    def random(self):
+        return self.value
+
+
+def test_disease_resist_is_a_multiplier():
+    assert not resists_disease({"disease_resist": 1}, FixedRandom(0.99))
+    assert resists_disease({"disease_resist": 0}, FixedRandom(0.0))
+    assert resists_disease({"disease_resist": 0.25}, FixedRandom(0.25))
+    assert not resists_disease({"disease_resist": 0.25}, FixedRandom(0.24))
+    assert not resists_disease({}, FixedRandom(0.99))
+
+
+def test_disease_resist_rate():
+    rng = random.Random(0)
+    resisted = sum(resists_disease({"disease_resist": 0.25}, rng) for _ in range(10000))
+    assert 7200 < resisted < 7800
+
+
+def test_effective_stats():
+    effects = [
+        make_effect("a", "A", {"str": 2, "disease_resist": -0.25}, BUFF, 10, now=0),
+        make_effect("b", "B", {"one_handed": 5}, BUFF, 20, now=0),
+        make_effect("c", "C", {"str": 100}, BUFF, 1, now=-10),
+    ]
+    main, resists, skills, valid_until = get_effective_stats(
+        {"str": 1}, {"disease_resist": 0.25}, {"one_handed": 5}, effects, 5
+    )
+    assert (main, resists, skills) == (
+        {"str": 3},
+        {"disease_resist": 0.0},
+        {"one_handed": 10},
+    )
+    assert valid_until == 10
+    assert not is_active(effects[2], 5)
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+from rpg.experience import ExperienceEngine, Progress
+
+
+def test_levels():
+    engine = ExperienceEngine(None, base_xp=100, exponent=1.5, max_lvl=5)
+    assert engine.thresholds == [0, 100, 283, 520, 800]
+    assert [engine.get_level(xp) for xp in (0, 99, 100, 282, 800, 10**9)] == [
+        1,
+        1,
+        2,
+        2,
+        5,
+        5,
+    ]
+    assert engine.get_next_threshold(1) == 100
+    assert engine.get_next_threshold(5) is None
+
+
+class Collection:
+    """In-memory character collection that applies bulk writes."""
+
+    def __init__(self, docs):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        self.before_write = None
+
+    def find(self, query, projection):
+        return [
+            {"_id": member_id, **{key: doc[key] for key in projection if key in doc}}
+            for member_id, doc in self.docs.items()
+            if member_id in query["_id"]["$in"]
+        ]
+
+    def bulk_write(self, requests, ordered=True):
+        if self.before_write is not None:
+            self.before_write(self)
+            self.before_write = None
+        for request in requests:
+            doc = self.docs[request._filter["_id"]]
+            for key, value in request._doc.get("$inc", {}).items():
+                doc[key] = doc.get(key, 0) + value
+            for key, value in request._doc.get("$max", {}).items():
+                doc[key] = max(doc.get(key, value), value)
+
+
+def make_engine(collection):
+    return ExperienceEngine(
+        SimpleNamespace(_get_collection=lambda: collection),
+        base_xp=100,
+        exponent=1.5,
+        max_lvl=5,
+    )
+
+
+def test_grant_levels_up():
+    collection = Collection(
+        [{"_id": "a", "xp": 90, "lvl": 1, "xp_factor": 2.0}, {"_id": "b", "xp": 0}]
+    )
+    progress = make_engine(collection).grant({"a": 10, "b": 0, "missing": 5})
+    assert progress == [Progress("a", 110, 2, 1)]
+    assert collection.docs["a"]["lvl"] == 2
+    assert "lvl" not in collection.docs["b"]
+
+
+def test_concurrent_grants_are_counted_in_the_level():
+    collection = Collection([{"_id": "a", "xp": 90, "lvl": 1}])
+
+    def concurrent_grant(collection):
+        collection.docs["a"]["xp"] += 200
+
+    collection.before_write = concurrent_grant
+    progress = make_engine(collection).grant({"a": 5})
+    assert progress == [Progress("a", 295, 3, 1)]
+    assert collection.docs["a"] == {"_id": "a", "xp": 295, "lvl": 3}
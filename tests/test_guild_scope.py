@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+from rpg.guild_scope import ARCHIVE_COLLECTION, get_char_key, remove_guild_characters
+
+
+def test_get_char_key():
+    assert get_char_key(5) == "5"
+    assert get_char_key(5, 9) == "9:5"
+    assert get_char_key(5, 9) != get_char_key(9, 5)
+
+
+class Collection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.archive = []
+
+    def find(self, query, projection=None):
+        return [
+            {"_id": doc["_id"]}
+            for doc in self.docs
+            if doc.get("guild_id") == query["guild_id"]
+        ]
+
+    def _matches(self, query):
+        return [doc for doc in self.docs if doc["_id"] in query["_id"]["$in"]]
+
+    def aggregate(self, pipeline):
+        match, merge = pipeline
+        assert merge["$merge"]["into"] == ARCHIVE_COLLECTION
+        self.archive.extend(self._matches(match["$match"]))
+
+    def delete_many(self, query):
+        removed = self._matches(query)
+        self.docs = [doc for doc in self.docs if doc not in removed]
+        return SimpleNamespace(deleted_count=len(removed))
+
+
+def make_collection():
+    return Collection(
+        [
+            {"_id": "1", "guild_id": None},
+            {"_id": "9:1", "guild_id": "9"},
+            {"_id": "9:2", "guild_id": "9"},
+            {"_id": "8:1", "guild_id": "8"},
+        ]
+    )
+
+
+def test_remove_guild_characters_archives_them():
+    collection = make_collection()
+    assert remove_guild_characters(collection, 9) == ["9:1", "9:2"]
+    assert [doc["_id"] for doc in collection.archive] == ["9:1", "9:2"]
+    assert [doc["_id"] for doc in collection.docs] == ["1", "8:1"]
+
+
+def test_remove_guild_characters_without_archive():
+    collection = make_collection()
+    assert remove_guild_characters(collection, 9, archive=False) == ["9:1", "9:2"]
+    assert collection.archive == []
+    assert remove_guild_characters(collection, 9) == []
@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from pymongo.errors import OperationFailure
+
+from rpg import invalidation
+from rpg.invalidation import ChangeWatcher, DocumentCache
+
+T0 = datetime(2026, 1, 1)
+
+
+def test_cache_rejects_documents_read_before_an_eviction():
+    cache = DocumentCache(10)
+    generation = cache.get_generation()
+    cache.evict("a")
+    assert not cache.put("a", "stale", generation)
+    assert cache.put("b", "fresh", generation)
+    assert cache.put("a", "fresh", cache.get_generation())
+    assert cache.get("a") == "fresh"
+
+
+def test_cache_rejects_documents_read_before_a_clear():
+    cache = DocumentCache(10)
+    generation = cache.get_generation()
+    cache.clear()
+    assert not cache.put("a", "stale", generation)
+
+
+def test_cache_forgets_old_evictions_safely():
+    cache = DocumentCache(2)
+    generation = cache.get_generation()
+    cache.evict("a")
+    cache.evict("b", "c")
+    assert not cache.put("a", "stale", generation)
+    assert cache.put("a", "fresh", cache.get_generation())
+
+
+class Collection:
+    """Stand-in of a collection that supports the queries of polling."""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        since = query["updated_at"]["$gt"]
+        return [dict(doc) for doc in self.docs if doc["updated_at"] > since]
+
+    def find_one(self, query):
+        return None
+
+    def replace_one(self, query, doc, upsert=False):
+        pass
+
+
+def test_poll_reports_late_commits_once(monkeypatch):
+    docs = []
+    collection = Collection(docs)
+    monkeypatch.setattr(
+        invalidation, "get_db", lambda: {"item": collection, "position": collection}
+    )
+    # Every poll commits the changes of the next step, then the watcher stops.
+    steps = iter(
+        [
+            [{"_id": 1, "updated_at": T0 + timedelta(seconds=10)}],
+            # Stamped before the change of the previous step, committed after.
+            [{"_id": 2, "updated_at": T0 + timedelta(seconds=9)}],
+            [{"_id": 1, "updated_at": T0 + timedelta(seconds=11)}],
+            [],
+        ]
+    )
+    reported = []
+    loop = SimpleNamespace(call_soon_threadsafe=lambda func, ids: reported.append(ids))
+    watcher = ChangeWatcher(
+        SimpleNamespace(loop=loop),
+        "item",
+        "item",
+        None,
+        None,
+        poll_interval=0,
+        poll_overlap=5,
+        position_collection_name="position",
+    )
+
+    def wait(timeout):
+        step = next(steps, None)
+        if step is None:
+            watcher.stop()
+        else:
+            docs[:] = [
+                doc for doc in docs if doc["_id"] not in {d["_id"] for d in step}
+            ]
+            docs.extend(step)
+        return watcher._stopped.is_set()
+
+    watcher._stopped.wait = wait
+    docs.append({"_id": 3, "updated_at": T0 - timedelta(seconds=10)})
+    watcher._poll(T0)
+    assert reported == [[1], [2], [1]]
+
+
+class Stream:
+    """Stand-in of a change stream that ends right away."""
+
+    alive = False
+    resume_token = {"_data": "1"}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class WatchedCollection:
+    """Stand-in of a collection that may support change streams."""
+
+    def __init__(self, watcher, position, supported):
+        self.watcher = watcher
+        self.position = position
+        self.supported = supported
+
+    def find_one(self, query):
+        return self.position
+
+    def replace_one(self, query, doc, upsert=False):
+        pass
+
+    def watch(self, resume_after=None, max_await_time_ms=None):
+        if not self.supported:
+            raise OperationFailure("not supported", code=40573)
+        self.watcher._stopped.set()
+        return Stream()
+
+
+def make_watcher(monkeypatch, position, supported):
+    events = []
+    loop = SimpleNamespace(call_soon_threadsafe=lambda func, *args: func(*args))
+    watcher = ChangeWatcher(
+        SimpleNamespace(loop=loop),
+        "item",
+        "item",
+        events.append,
+        lambda: events.append("reset"),
+        position_collection_name="position",
+    )
+    collection = WatchedCollection(watcher, position, supported)
+    monkeypatch.setattr(
+        invalidation, "get_db", lambda: {"item": collection, "position": collection}
+    )
+    monkeypatch.setattr(watcher, "_poll", events.append)
+    return watcher, events
+
+
+def test_polling_position_switches_to_change_streams(monkeypatch):
+    watcher, events = make_watcher(monkeypatch, {"updated_at": T0}, supported=True)
+    watcher._watch()
+    # The changes since the polling position cannot be resumed from.
+    assert events == ["reset"]
+
+
+def test_polling_resumes_from_the_saved_position(monkeypatch):
+    watcher, events = make_watcher(monkeypatch, {"updated_at": T0}, supported=False)
+    watcher._watch()
+    assert events == [T0]
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from rpg.RPG import RPG
+from rpg.item_index import ItemNameIndex
+
+ITEMS = [
+    SimpleNamespace(item_id=1, name="Железный меч"),
+    SimpleNamespace(item_id=2, name="Железный шлем"),
+    SimpleNamespace(item_id=3, name="Стальной меч"),
+    SimpleNamespace(item_id=4, name="Зелье здоровья"),
+]
+
+
+def build_index() -> ItemNameIndex:
+    index = ItemNameIndex()
+    index.build(ITEMS)
+    return index
+
+
+def test_exact_match_ignores_case():
+    index = build_index()
+    assert index.find("железный МЕЧ") == 1
+    assert index.find("  стальной   меч ") == 3
+
+
+def test_unique_prefix_match():
+    index = build_index()
+    assert index.find("Зелье") == 4
+    assert index.find("Железный") is None
+
+
+def test_suggestions():
+    index = build_index()
+    assert index.suggest("Железный мчч")[0] == "Железный меч"
+    assert index.suggest("Жел", 2) == ["Железный меч", "Железный шлем"]
+
+
+def test_add():
+    index = build_index()
+    index.add(5, "Эльфийский лук")
+    assert index.find("эльф") == 5
+    assert len(index) == 5
+
+
+def test_rebuild_never_shows_a_partial_index():
+    items = [
+        SimpleNamespace(item_id=i, name=f"Предмет {i}") for i in range(100, 3100)
+    ] + ITEMS
+    index = ItemNameIndex()
+    index.build(items)
+    misses = []
+    stopped = threading.Event()
+
+    def read():
+        while not stopped.is_set():
+            try:
+                found = index.find("Стальной меч")
+            except KeyError:
+                found = None
+            if found != 3:
+                misses.append(found)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for _ in range(20):
+            index.build(items)
+    finally:
+        stopped.set()
+        reader.join()
+    assert not misses
+
+
+def test_rebuild_requested_during_a_rebuild_runs_after_it():
+    release = threading.Event()
+    builds = []
+
+    def build_item_indexes():
+        builds.append(len(builds))
+        release.wait(5)
+
+    async def main():
+        cog = SimpleNamespace(
+            Red=SimpleNamespace(loop=asyncio.get_running_loop()),
+            build_item_indexes=build_item_indexes,
+            _item_rebuild=None,
+            _item_rebuild_pending=False,
+        )
+        for name in (
+            "rebuild_item_indexes",
+            "is_rebuilding_item_indexes",
+            "_on_item_rebuild_done",
+        ):
+            setattr(cog, name, getattr(RPG, name).__get__(cog))
+        for _ in range(3):
+            cog.rebuild_item_indexes()
+        assert cog.is_rebuilding_item_indexes()
+        release.set()
+        while cog.is_rebuilding_item_indexes() or cog._item_rebuild_pending:
+            await asyncio.sleep(0.01)
+        return cog
+
+    cog = asyncio.run(main())
+    assert builds == [0, 1]
+    assert not cog.is_rebuilding_item_indexes()
@@ -0,0 +1,98 @@
+import gc
+import tracemalloc
+
+from mongoengine import EmbeddedDocument, ListField
+
+from rpg.item_stack import ItemStack, ItemStackField
+
+CHARACTERS = 100_000
+STACKS_PER_CHARACTER = 12
+EQUIPPED_SLOTS = 4
+
+
+class Slots(EmbeddedDocument):
+    items = ListField(ItemStackField())
+    right_hand = ItemStackField(store_count=False)
+    left_hand = ItemStackField(store_count=False)
+
+
+def test_blank_stack_is_falsy():
+    assert ItemStack(5)
+    assert not ItemStack("", 0)
+    assert not ItemStack(None)
+    assert not ItemStack(5, 0)
+
+
+def test_round_trip():
+    stack = ItemStack(5, 3, "Maker", 2)
+    assert ItemStack.from_dict(stack.to_dict()) == stack
+    assert stack.to_dict(count=False) == {"item_id": 5, "maker": "Maker", "temper": 2}
+    assert ItemStack.from_dict({"item_id": 5}).count == 1
+
+
+def test_equipment_slots_are_stored_without_count():
+    doc = Slots(items=[ItemStack(1, 2)], right_hand=ItemStack(5, 1, "Maker"))
+    son = doc.to_mongo()
+    assert son["items"] == [{"item_id": 1, "count": 2, "maker": None, "temper": None}]
+    assert son["right_hand"] == {"item_id": 5, "maker": "Maker", "temper": None}
+
+
+def test_empty_equipment_slots_load_as_none():
+    doc = Slots._from_son(
+        {
+            "items": [{"item_id": "", "count": 0}],
+            "right_hand": {},
+            "left_hand": {"item_id": "", "count": 0},
+        }
+    )
+    assert doc.right_hand is None
+    assert doc.left_hand is None
+    assert doc.items == [ItemStack("", 0)]
+
+
+def measure(factory) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        chars = factory()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del chars
+    return size
+
+
+def build_dicts():
+    return [
+        (
+            [
+                {"item_id": i, "count": 1, "maker": None, "temper": None}
+                for i in range(STACKS_PER_CHARACTER)
+            ],
+            [
+                {"item_id": i, "maker": None, "temper": None}
+                for i in range(EQUIPPED_SLOTS)
+            ],
+        )
+        for _ in range(CHARACTERS)
+    ]
+
+
+def build_stacks():
+    return [
+        (
+            [ItemStack(i) for i in range(STACKS_PER_CHARACTER)],
+            [ItemStack(i) for i in range(EQUIPPED_SLOTS)],
+        )
+        for _ in range(CHARACTERS)
+    ]
+
+
+def test_memory_of_cached_characters():
+    """Memory benchmark: stacks of 100k cached characters."""
+    dicts = measure(build_dicts)
+    stacks = measure(build_stacks)
+    assert stacks < dicts * 0.6, (
+        f"{CHARACTERS} characters: dict stacks {dicts / 2 ** 20:.1f} MiB, "
+        f"ItemStack {stacks / 2 ** 20:.1f} MiB ({stacks / dicts:.0%})"
+    )
@@ -0,0 +1,55 @@
+import random
+
+from rpg.leaderboard import Leaderboard, Leaderboards
+
+
+def test_ranks_and_ties():
+    board = Leaderboard()
+    board.update("a", (5, 100))
+    board.update("b", (7, 0))
+    board.update("c", (5, 100))
+    board.update("d", (5, 50))
+    assert [board.get_rank(member_id) for member_id in "abcd"] == [2, 1, 2, 4]
+    assert board.get_top(2) == [("b", (7, 0)), ("a", (5, 100))]
+    assert board.get_rank("e") is None
+
+
+def test_update_and_remove():
+    board = Leaderboard()
+    board.update("a", (1,))
+    board.update("b", (2,))
+    board.update("a", (3,))
+    assert board.get_top(3) == [("a", (3,)), ("b", (2,))]
+    board.remove("a")
+    board.remove("a")
+    assert len(board) == 1
+    assert "a" not in board
+    assert board.get_rank("b") == 1
+
+
+def test_matches_a_full_sort():
+    rng = random.Random(0)
+    board = Leaderboard()
+    scores = {}
+    for _ in range(2000):
+        member_id = str(rng.randrange(200))
+        if rng.random() < 0.1:
+            board.remove(member_id)
+            scores.pop(member_id, None)
+        else:
+            scores[member_id] = (rng.randrange(10), rng.randrange(10))
+            board.update(member_id, scores[member_id])
+    expected = sorted(scores.items(), key=lambda item: (-item[1][0], -item[1][1]))
+    assert [score for _, score in board.get_top(len(scores))] == [
+        score for _, score in expected
+    ]
+    for member_id, score in scores.items():
+        assert board.get_rank(member_id) == 1 + sum(
+            other > score for other in scores.values()
+        )
+
+
+def test_score_of_missing_fields():
+    boards = Leaderboards(None)
+    assert boards.get_score("lvl", {"lvl": 3}) == (3, 0)
+    assert boards.get_score("gold", {"gold": None}) == (0,)
@@ -0,0 +1,66 @@
+import random
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+from munch import Munch
+
+from rpg.loot import AliasTable, LootTableNotFound, LootTables, get_loot_changes
+
+
+def test_alias_table_distribution():
+    weights = [1, 0, 3, 6]
+    table = AliasTable(weights)
+    rng = random.Random(0)
+    counts = Counter(table.sample(rng) for _ in range(100_000))
+    assert counts[1] == 0
+    for index, weight in enumerate(weights):
+        assert abs(counts[index] / 100_000 - weight / 10) < 0.01
+
+
+def test_alias_table_needs_positive_weights():
+    with pytest.raises(ValueError):
+        AliasTable([0, 0])
+    with pytest.raises(ValueError):
+        AliasTable([])
+
+
+def make_tables():
+    settings = Munch.fromDict(
+        {
+            "rarity_weights": {"common": 10, "rare": 1, "legendary": 0},
+            "tables": {
+                "chest": {"rolls": 3},
+                "boss": {"rarities": {"common": 0, "legendary": 1}},
+            },
+        }
+    )
+    tables = LootTables(settings)
+    tables.build(
+        SimpleNamespace(item_id=item_id, rarity=rarity)
+        for item_id, rarity in ((1, "common"), (2, "rare"), (3, "legendary"))
+    )
+    return tables
+
+
+def test_table_weights_override_rarities():
+    tables = make_tables()
+    assert tables.tables["chest"][0] == [1, 2]
+    assert tables.tables["boss"][0] == [2, 3]
+    assert sum(tables.roll("chest", random.Random(0)).values()) == 3
+    with pytest.raises(LootTableNotFound):
+        tables.roll("missing", random.Random(0))
+
+
+def test_roll_many_is_reproducible():
+    tables = make_tables()
+    drops = tables.roll_many("boss", ["a", "b", "c"], seed=42)
+    assert drops == tables.roll_many("boss", ["a", "b", "c"], seed=42)
+    items = {item_id: f"item{item_id}" for item_id in (1, 2, 3)}
+    changes = get_loot_changes(drops, items)
+    assert [change.member_id for change in changes] == ["a", "b", "c"]
+    assert all(
+        count > 0 and item in ("item2", "item3")
+        for change in changes
+        for item, count, _, _ in change.items
+    )
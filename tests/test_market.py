@@ -0,0 +1,196 @@
+import random
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from rpg.market import BUY, SELL, Market, Order, OrderBook
+from rpg.transactions import TransactionFailed
+
+
+class EventLog:
+    """In-memory stand-in of the market event collection."""
+
+    def __init__(self):
+        self.events = []
+        self.fail_on = None
+
+    def make_class(self):
+        log = self
+
+        class Event:
+            def __init__(self, seq, **fields):
+                self.son = dict(fields, _id=seq)
+
+            def save(self, force_insert=False):
+                if self.son["kind"] == log.fail_on:
+                    raise ConnectionError("database is down")
+                log.events.append(self.son)
+
+            @classmethod
+            def _get_collection(cls):
+                return log
+
+        return Event
+
+    def find(self, query, sort=None):
+        return [event for event in self.events if event["_id"] > query["_id"]["$gt"]]
+
+
+class FakeMarket(Market):
+    """Market that records transfers instead of applying them."""
+
+    def __init__(self, log: EventLog):
+        super().__init__(
+            log.make_class(),
+            None,
+            None,
+            lambda item_id: SimpleNamespace(item_id=item_id),
+            lambda gold: None,
+        )
+        self.transfers = []
+        self.fail_member = None
+        self.missing = set()
+
+    def _exists(self, member_id):
+        return member_id not in self.missing
+
+    def _transfer(self, changes):
+        for change in changes:
+            if change.member_id == self.fail_member:
+                raise TransactionFailed(change.member_id)
+        self.transfers.append(changes)
+
+
+def get_state(market: Market):
+    return {
+        item_id: sorted(
+            (order.order_id, order.side, order.price, order.count)
+            for order in book.orders.values()
+        )
+        for item_id, book in market.books.items()
+    }
+
+
+def assert_log_matches(market: FakeMarket, log: EventLog):
+    replayed = FakeMarket(log)
+    replayed.rebuild()
+    assert get_state(replayed) == get_state(market)
+
+
+ITEM = SimpleNamespace(item_id=7)
+
+
+def test_price_time_priority():
+    book = OrderBook(7)
+    book.add(Order(1, "a", 7, SELL, 10, 1))
+    book.add(Order(2, "b", 7, SELL, 9, 1))
+    book.add(Order(3, "c", 7, SELL, 9, 1))
+    fills = book.add(Order(4, "d", 7, BUY, 10, 2))
+    assert [(fill.sell.order_id, fill.price) for fill in fills] == [(2, 9), (3, 9)]
+    assert list(book.orders) == [1]
+
+
+def test_match_does_not_change_the_book():
+    book = OrderBook(7)
+    book.add(Order(1, "a", 7, SELL, 10, 3))
+    order = Order(2, "b", 7, BUY, 10, 1)
+    fill = book.match(order)
+    assert (fill.count, book.orders[1].count, order.count) == (1, 3, 1)
+
+
+def test_place_settles_fills():
+    log = EventLog()
+    market = FakeMarket(log)
+    market.place("seller", ITEM, SELL, 2, 10)
+    order, fills = market.place("buyer", ITEM, BUY, 3, 12)
+    assert [fill.count for fill in fills] == [2]
+    assert order.count == 1
+    assert [change.member_id for change in market.transfers[-1]] == [
+        "buyer",
+        "seller",
+    ]
+    assert [event["kind"] for event in log.events] == ["place", "place", "fill"]
+    assert_log_matches(market, log)
+
+
+def test_failed_fill_cancels_the_rest_of_the_order():
+    log = EventLog()
+    market = FakeMarket(log)
+    market.place("seller", ITEM, SELL, 2, 10)
+    market.fail_member = "seller"
+    order, fills = market.place("buyer", ITEM, BUY, 3, 10)
+    assert fills == []
+    assert order.count == 3
+    assert market.find_order(order.order_id) is None
+    assert market.find_order(1).count == 2
+    assert market.transfers[-1][0].gold == 30
+    assert [event["kind"] for event in log.events] == ["place", "place", "cancel"]
+    assert_log_matches(market, log)
+
+
+def test_order_of_a_missing_character_is_cancelled():
+    log = EventLog()
+    market = FakeMarket(log)
+    market.place("gone", ITEM, SELL, 2, 10)
+    market.place("seller", ITEM, SELL, 2, 11)
+    market.fail_member = "gone"
+    market.missing.add("gone")
+    transfers = len(market.transfers)
+    order, fills = market.place("buyer", ITEM, BUY, 3, 11)
+    assert [(fill.sell.member_id, fill.count) for fill in fills] == [("seller", 2)]
+    assert len(market.transfers) == transfers + 2
+    assert market.get_orders("gone") == []
+    assert market.find_order(order.order_id).count == 1
+    assert_log_matches(market, log)
+
+
+def test_failed_log_undoes_the_escrow():
+    log = EventLog()
+    market = FakeMarket(log)
+    log.fail_on = "place"
+    with pytest.raises(ConnectionError):
+        market.place("buyer", ITEM, BUY, 2, 10)
+    escrow, undo = market.transfers
+    assert escrow[0].gold == -20
+    assert undo[0].gold == 20
+    assert market.books.get(7) is None or not market.books[7].orders
+    assert market._seq == 0
+
+
+def test_cancel_all_without_refund():
+    log = EventLog()
+    market = FakeMarket(log)
+    market.place("seller", ITEM, SELL, 2, 10)
+    market.place("seller", ITEM, SELL, 1, 11)
+    market.place("buyer", ITEM, BUY, 1, 5)
+    transfers = len(market.transfers)
+    cancelled = market.cancel_all("seller", refund=False)
+    assert [order.order_id for order in cancelled] == [1, 2]
+    assert len(market.transfers) == transfers
+    assert market.get_orders("seller") == []
+    assert [order.order_id for order in market.get_orders("buyer")] == [3]
+    assert_log_matches(market, log)
+
+
+def test_matching_throughput():
+    rng = random.Random(0)
+    orders = [
+        Order(
+            order_id,
+            str(order_id % 100),
+            7,
+            rng.choice((BUY, SELL)),
+            rng.randint(90, 110),
+            rng.randint(1, 10),
+        )
+        for order_id in range(1, 100_001)
+    ]
+    book = OrderBook(7)
+    start = time.perf_counter()
+    fills = sum(len(book.add(order)) for order in orders)
+    duration = time.perf_counter() - start
+    assert len(orders) / duration > 20_000, (
+        f"{len(orders)} orders, {fills} fills in {duration:.2f} s "
+        f"({len(orders) / duration:.0f} orders/s)"
+    )
@@ -0,0 +1,105 @@
+import pytest
+
+from rpg.migrations import Migrator, migrator, normalize_layout
+
+
+def make_migrator():
+    migrator = Migrator(batch_size=2)
+
+    @migrator.register(1, ("a",), "Add a")
+    def add_a(doc):
+        doc["a"] = 1
+
+    @migrator.register(2, ("b.c",), "Move a to b.c")
+    def move_a(doc):
+        doc.setdefault("b", {})["c"] = doc["a"] + 1
+
+    return migrator
+
+
+def test_versions_must_be_consecutive():
+    migrator = make_migrator()
+    with pytest.raises(ValueError):
+        migrator.register(2, (), "Duplicate")
+    with pytest.raises(ValueError):
+        migrator.register(4, (), "Gap")
+
+
+def test_migrate_applies_pending_migrations():
+    migrator = make_migrator()
+    doc = {}
+    assert migrator.migrate(doc) == {"schema_version", "a", "b.c"}
+    assert doc == {"a": 1, "b": {"c": 2}, "schema_version": 2}
+    assert migrator.migrate(doc) == set()
+    doc = {"a": 5, "schema_version": 1}
+    assert migrator.migrate(doc) == {"schema_version", "b.c"}
+    assert doc["b"] == {"c": 6}
+
+
+class Collection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.requests = []
+
+    def find(self, query):
+        return self
+
+    def limit(self, count):
+        outdated = [doc for doc in self.docs if doc.get("schema_version", 0) < 2]
+        return [dict(doc) for doc in outdated[:count]]
+
+    def bulk_write(self, requests, ordered=True):
+        self.requests.extend(requests)
+
+
+def test_run_batch_updates_only_unchanged_documents():
+    migrator = make_migrator()
+    collection = Collection([{"_id": 1}, {"_id": 2, "a": 3, "schema_version": 1}])
+    assert migrator.run_batch(collection) == 2
+    first, second = (request._doc for request in collection.requests)
+    filters = [request._filter for request in collection.requests]
+    assert filters[0] == {
+        "_id": 1,
+        "schema_version": {"$exists": False},
+        "a": {"$exists": False},
+        "b.c": {"$exists": False},
+    }
+    assert filters[1] == {"_id": 2, "schema_version": 1, "b.c": {"$exists": False}}
+    assert first["$set"] == {"schema_version": 2, "a": 1, "b.c": 2}
+    assert second["$set"] == {"schema_version": 2, "b.c": 4}
+
+
+def test_normalize_layout():
+    doc = {
+        "inventory": {
+            "items": {
+                "Weapon": [
+                    {"item_id": "", "count": 0},
+                    {"item_id": 5, "count": 2, "maker": "Maker"},
+                ],
+                "Armor": [{"item_id": 6, "count": 0}],
+            }
+        },
+        "equipment": {"right_hand": {"item_id": 5, "count": 1}, "helmet": {}},
+    }
+    normalize_layout(doc)
+    items = doc["inventory"]["items"]
+    assert items["Weapon"] == [
+        {"item_id": 5, "maker": "Maker", "temper": None, "count": 2}
+    ]
+    assert (
+        items["Armor"]
+        == items["Item"]
+        == [{"item_id": "", "count": 0, "maker": None, "temper": None}]
+    )
+    assert doc["equipment"]["right_hand"] == {
+        "item_id": 5,
+        "maker": None,
+        "temper": None,
+    }
+    assert doc["equipment"]["helmet"] is None
+    assert doc["attributes"]["main"] == {}
+
+
+def test_registered_migrations_are_consecutive():
+    assert sorted(migrator.migrations) == list(range(1, migrator.latest + 1))
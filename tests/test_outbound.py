@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import discord
+
+from rpg.outbound import (
+    DISCORD_HTTP_LOGGER,
+    MessageEditor,
+    OutboundStats,
+    RateLimitHandler,
+    request,
+)
+
+
+class Message:
+    """Stand-in of a message whose edits take a while."""
+
+    def __init__(self, delay: float = 0.01, fail_first: int = 0, limited_first=0):
+        self.id = 1
+        self.delay = delay
+        self.fail_first = fail_first
+        self.limited_first = limited_first
+        self.edits = []
+
+    async def edit(self, embed):
+        await asyncio.sleep(self.delay)
+        if self.limited_first:
+            self.limited_first -= 1
+            raise discord.RateLimited(0.0)
+        if self.fail_first:
+            self.fail_first -= 1
+            response = SimpleNamespace(
+                status=429, reason="", headers={"Retry-After": "0"}
+            )
+            raise discord.HTTPException(response, "rate limited")
+        self.edits.append(embed.title)
+
+
+def test_edits_are_coalesced():
+    async def main():
+        stats = OutboundStats()
+        message = Message()
+        editor = MessageEditor(asyncio.get_running_loop(), message, stats)
+        embed = discord.Embed(title="0")
+        editor.edit(embed)
+        # The first edit is in flight while the others replace each other.
+        await asyncio.sleep(0)
+        for index in range(1, 10):
+            embed.title = str(index)
+            editor.edit(embed)
+        await editor.flush()
+        return message.edits, stats
+
+    edits, stats = asyncio.run(main())
+    assert edits == ["0", "9"]
+    assert (stats.requests, stats.coalesced) == (2, 8)
+
+
+def test_rate_limited_request_is_retried():
+    async def main():
+        stats = OutboundStats()
+        message = Message(delay=0, fail_first=2)
+        await request(stats, message.edit, embed=discord.Embed(title="a"))
+        return message.edits, stats
+
+    edits, stats = asyncio.run(main())
+    assert edits == ["a"]
+    assert (stats.requests, stats.failures, stats.rate_limits) == (3, 2, 2)
+
+
+def test_rate_limited_exception_is_retried():
+    async def main():
+        stats = OutboundStats()
+        message = Message(delay=0, fail_first=1, limited_first=1)
+        await request(stats, message.edit, embed=discord.Embed(title="a"))
+        return message.edits, stats
+
+    edits, stats = asyncio.run(main())
+    assert edits == ["a"]
+    assert (stats.requests, stats.failures, stats.rate_limits) == (3, 2, 2)
+
+
+def test_handler_records_discord_rate_limit_waits():
+    stats = OutboundStats()
+    handler = RateLimitHandler(stats)
+    logger = logging.getLogger(DISCORD_HTTP_LOGGER)
+    logger.addHandler(handler)
+    try:
+        # The messages discord.py logs when it waits out a rate limit.
+        logger.warning(
+            "We are being rate limited. %s %s responded with 429. "
+            "Retrying in %.2f seconds.",
+            "PATCH",
+            "https://discord.com/api/v10/channels/1/messages/2",
+            1.5,
+        )
+        logger.warning("Global rate limit has been hit. Retrying in %.2f seconds.", 2)
+        # Raised as RateLimited instead of waiting, so it is not recorded.
+        logger.warning(
+            "We are being rate limited. %s %s responded with 429. "
+            "Timeout of %.2f was too long, erroring instead.",
+            "PATCH",
+            "https://discord.com/api/v10/channels/1/messages/2",
+            60,
+        )
+    finally:
+        logger.removeHandler(handler)
+    assert (stats.rate_limits, stats.rate_limit_wait) == (2, 3.5)
+    assert stats.max_rate_limit_wait == 2
+
+
+def test_close_drops_pending_edits():
+    async def main():
+        message = Message()
+        editor = MessageEditor(asyncio.get_running_loop(), message, OutboundStats())
+        editor.edit(discord.Embed(title="a"))
+        editor.edit(discord.Embed(title="b"))
+        editor.close()
+        await asyncio.sleep(0.03)
+        return message.edits
+
+    assert asyncio.run(main()) == []
@@ -0,0 +1,49 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from rpg.regen_scheduler import RegenScheduler
+
+
+class RecordingScheduler(RegenScheduler):
+    def __init__(self, bot, **kwargs):
+        super().__init__(bot, None, **kwargs)
+        self.batches = []
+
+    def regen_batch(self, member_ids):
+        self.batches.append((list(member_ids), threading.current_thread()))
+
+
+def test_get_bucket_is_stable():
+    buckets = {RegenScheduler.get_bucket(str(i), 10) for i in range(1000)}
+    assert buckets == set(range(10))
+    assert RegenScheduler.get_bucket("42", 10) == RegenScheduler.get_bucket("42", 10)
+
+
+def test_adapt_batch_size():
+    scheduler = RegenScheduler(
+        None, None, batch_size=50, min_batch_size=10, max_batch_size=52
+    )
+    scheduler.adapt_batch_size(scheduler.max_batch_time * 2)
+    assert scheduler.batch_size == 25
+    scheduler.adapt_batch_size(scheduler.max_batch_time * 2)
+    scheduler.adapt_batch_size(scheduler.max_batch_time * 2)
+    assert scheduler.batch_size == 10
+    for _ in range(100):
+        scheduler.adapt_batch_size(0)
+    assert scheduler.batch_size == 52
+
+
+def test_process_bucket_runs_batches_in_executor():
+    async def run():
+        loop = asyncio.get_running_loop()
+        scheduler = RecordingScheduler(
+            SimpleNamespace(loop=loop), batch_size=3, min_batch_size=1
+        )
+        await scheduler.process_bucket([str(i) for i in range(8)])
+        return scheduler
+
+    scheduler = asyncio.run(run())
+    member_ids = [member_id for batch, _ in scheduler.batches for member_id in batch]
+    assert member_ids == [str(i) for i in range(8)]
+    assert all(thread is not threading.main_thread() for _, thread in scheduler.batches)
@@ -0,0 +1,81 @@
+import datetime
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+from rpg.snapshot import export_characters, import_characters
+
+
+class Cursor(list):
+    def sort(self, key, direction):
+        return Cursor(sorted(self, key=lambda doc: doc[key]))
+
+
+class Collection:
+    """In-memory character collection."""
+
+    def __init__(self, docs=()):
+        self.docs = {doc["_id"]: dict(doc) for doc in docs}
+        self.stamped = []
+
+    def find(self, query, projection=None, batch_size=None):
+        return Cursor(dict(doc) for doc in self.docs.values())
+
+    def bulk_write(self, requests, ordered=True):
+        matched = sum(request._filter["_id"] in self.docs for request in requests)
+        for request in requests:
+            self.docs[request._filter["_id"]] = dict(request._doc)
+        return SimpleNamespace(
+            matched_count=matched, upserted_count=len(requests) - matched
+        )
+
+    def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            self.docs.setdefault(doc["_id"], dict(doc))
+        return SimpleNamespace(inserted_ids=[doc["_id"] for doc in docs])
+
+    def update_many(self, query, update):
+        assert update == {"$currentDate": {"updated_at": True}}
+        self.stamped += query["_id"]["$in"]
+
+
+DOCS = [
+    {
+        "_id": "1",
+        "name": "Лидия",
+        "xp": 150,
+        "inventory": {"items": {"Weapon": [{"item_id": 5, "count": 2}]}},
+        "created": datetime.datetime(2020, 1, 2, 3, 4, 5),
+        "ref": ObjectId("5f0000000000000000000001"),
+    },
+    {"_id": "9:2", "name": "Ульфрик", "xp": 0, "gold": 12.5},
+]
+
+
+@pytest.mark.parametrize(
+    "filename",
+    [
+        "characters.jsonl",
+        "characters.jsonl.gz",
+        "characters.bson",
+        "characters.bson.gz",
+    ],
+)
+def test_round_trip(tmp_path, filename):
+    path = str(tmp_path / filename)
+    assert export_characters(Collection(DOCS), path, batch_size=1) == 2
+    collection = Collection([{"_id": "1", "name": "Old"}])
+    result = import_characters(collection, path, batch_size=1)
+    assert result == (2, 0, [])
+    assert collection.docs == {doc["_id"]: doc for doc in DOCS}
+    assert collection.stamped == ["1", "9:2"]
+
+
+def test_import_without_upsert_keeps_existing_characters(tmp_path):
+    path = str(tmp_path / "characters.jsonl")
+    export_characters(Collection(DOCS), path)
+    collection = Collection([{"_id": "1", "name": "Old"}])
+    import_characters(collection, path, upsert=False)
+    assert collection.docs["1"] == {"_id": "1", "name": "Old"}
+    assert collection.docs["9:2"] == DOCS[1]
@@ -0,0 +1,36 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imports the cog in a fresh interpreter. Red and discord.py are imported
+# first, as they are already loaded when the bot loads the cog.
+IMPORT_COG = """
+import importlib.util, json, os, sys, time
+import discord
+import redbot.core.bot
+import redbot.core.commands
+
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location(
+    "rpg", os.path.join({root!r}, "__init__.py"), submodule_search_locations=[{root!r}]
+)
+package = sys.modules["rpg"] = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(package)
+duration = time.perf_counter() - start
+print(json.dumps({{"duration": duration, "numpy": "numpy" in sys.modules}}))
+"""
+
+
+def test_import_time():
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_COG.format(root=ROOT)],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    result = json.loads(output.splitlines()[-1])
+    assert not result["numpy"]
+    assert result["duration"] < 2, f"cog import: {result['duration']:.2f} s"
@@ -0,0 +1,66 @@
+import asyncio
+from types import SimpleNamespace
+
+from rpg.supervisor import TaskSupervisor, format_stats
+
+
+def run(coro_func):
+    async def main():
+        supervisor = TaskSupervisor(
+            SimpleNamespace(loop=asyncio.get_running_loop()),
+            base_delay=0.01,
+            max_delay=1,
+            jitter=0,
+        )
+        return await coro_func(supervisor)
+
+    return asyncio.run(main())
+
+
+def test_backoff_is_exponential_and_capped():
+    supervisor = TaskSupervisor(None, base_delay=1, max_delay=10, jitter=0)
+    assert [supervisor.get_delay(failures) for failures in (1, 2, 3, 5)] == [
+        1,
+        2,
+        4,
+        10,
+    ]
+
+
+def test_failed_task_is_restarted():
+    calls = []
+
+    async def flaky():
+        calls.append(len(calls))
+        if len(calls) < 3:
+            raise ConnectionError("database is down")
+
+    async def main(supervisor):
+        supervisor.add("flaky", flaky)
+        supervisor.add("flaky", flaky)
+        while "flaky" in supervisor:
+            await asyncio.sleep(0.01)
+        return supervisor.stats["flaky"]
+
+    stats = run(main)
+    assert calls == [0, 1, 2]
+    assert (stats.starts, stats.failures) == (3, 2)
+    assert stats.last_error == "ConnectionError: database is down"
+    assert "last error: ConnectionError" in format_stats([stats])
+
+
+def test_slow_ticks_are_skipped():
+    async def tick():
+        await asyncio.sleep(0.035)
+
+    async def main(supervisor):
+        supervisor.add_periodic("tick", tick, 0.01)
+        await asyncio.sleep(0.2)
+        supervisor.cancel_all()
+        await asyncio.sleep(0)
+        assert "tick" not in supervisor
+        return supervisor.stats["tick"]
+
+    stats = run(main)
+    assert 1 <= stats.ticks <= 6
+    assert stats.skipped >= 2 * (stats.ticks - 1)
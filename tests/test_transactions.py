@@ -0,0 +1,142 @@
+import logging
+from copy import deepcopy
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from rpg import transactions
+from rpg.transactions import (
+    ILLEGAL_OPERATION,
+    Change,
+    TransactionFailed,
+    execute,
+    get_path,
+    update_character,
+)
+
+
+class FakeCollection:
+    """Collection of one document that supports equality queries by path."""
+
+    def __init__(self, doc: dict):
+        self.doc = doc
+        self.before_update = None
+
+    def find_one(self, query, *args, **kwargs):
+        if query["_id"] != self.doc["_id"]:
+            return None
+        return deepcopy(self.doc)
+
+    def update_one(self, query, update):
+        if self.before_update is not None:
+            self.before_update(self)
+            self.before_update = None
+        for path, value in query.items():
+            if value == {"$exists": False}:
+                matched = get_path(self.doc, path) is transactions._MISSING
+            else:
+                matched = get_path(self.doc, path) == value
+            if not matched:
+                return SimpleNamespace(matched_count=0)
+        for path, value in update.get("$set", {}).items():
+            *parents, key = path.split(".")
+            target = self.doc
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            target[key] = value
+        return SimpleNamespace(matched_count=1)
+
+
+class FakeCharacter:
+    """Character document that is its own raw document."""
+
+    collection = None
+
+    def __init__(self, son):
+        self.son = son
+
+    @classmethod
+    def _get_collection(cls):
+        return cls.collection
+
+    @classmethod
+    def _from_son(cls, son):
+        return cls(son)
+
+    def to_mongo(self):
+        return self.son
+
+
+def make_character(doc):
+    return type("Character", (FakeCharacter,), {"collection": FakeCollection(doc)})
+
+
+def test_get_path():
+    doc = {"a": {"b": 1, "c": None}}
+    assert get_path(doc, "a.b") == 1
+    assert get_path(doc, "a.c") is None
+    assert get_path(doc, "a.d") is transactions._MISSING
+    assert get_path(doc, "a.b.c") is transactions._MISSING
+
+
+def test_update_character_writes_only_the_fields():
+    character = make_character({"_id": "1", "gold": 5, "inventory": {"items": []}})
+
+    def change(char):
+        char.son["inventory"]["items"].append("sword")
+        char.son["gold"] = 100
+        return "done"
+
+    assert update_character(character, "1", ("inventory.items",), change) == "done"
+    assert character.collection.doc == {
+        "_id": "1",
+        "gold": 5,
+        "inventory": {"items": ["sword"]},
+    }
+
+
+def test_update_character_retries_a_concurrent_change():
+    character = make_character({"_id": "1", "inventory": {"items": []}})
+    calls = []
+
+    def concurrent(collection):
+        collection.doc["inventory"]["items"] = ["shield"]
+
+    def change(char):
+        calls.append(list(char.son["inventory"]["items"]))
+        char.son["inventory"]["items"].append("sword")
+
+    character.collection.before_update = concurrent
+    update_character(character, "1", ("inventory.items",), change)
+    assert calls == [[], ["shield"]]
+    assert character.collection.doc["inventory"]["items"] == ["shield", "sword"]
+
+
+def test_update_character_not_found():
+    character = make_character({"_id": "1"})
+    with pytest.raises(TransactionFailed):
+        update_character(character, "2", ("gold",), lambda char: None)
+
+
+def make_standalone():
+    def start_session():
+        raise OperationFailure("not a replica set", ILLEGAL_OPERATION)
+
+    client = SimpleNamespace(start_session=start_session)
+    collection = SimpleNamespace(database=SimpleNamespace(client=client))
+    return SimpleNamespace(_get_collection=lambda: collection)
+
+
+def test_execute_reraises_when_compensation_fails(monkeypatch, caplog):
+    def apply_change(character_class, inventory_class, change, session=None):
+        if change.member_id == "seller" or change.gold > 0:
+            raise ConnectionError(change.member_id)
+        return 0
+
+    monkeypatch.setattr(transactions, "apply_change", apply_change)
+    changes = [Change("buyer", -10), Change("seller", 10)]
+    with caplog.at_level(logging.ERROR, "red.rpg.transactions"):
+        with pytest.raises(ConnectionError, match="seller"):
+            execute(make_standalone(), None, changes)
+    assert "Failed to undo" in caplog.text
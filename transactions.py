@@ -0,0 +1,257 @@
+import logging
+from copy import deepcopy
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+
+log = logging.getLogger("red.rpg.transactions")
+
+# Error code of commands that are not supported by a standalone mongod.
+ILLEGAL_OPERATION = 20
+
+# Marks a path that is missing in a document.
+_MISSING = object()
+
+
+class Change(NamedTuple):
+    """Change of the gold and inventory of one character.
+
+    `items` contains `(item, count, maker, temper)` tuples, where `item` is an
+    `Item` document. A positive count adds items, a negative one removes them.
+    """
+
+    member_id: str
+    gold: int = 0
+    items: Tuple[tuple, ...] = ()
+
+    def inverse(self) -> "Change":
+        """Returns the change that undoes this one."""
+        return Change(
+            self.member_id,
+            -self.gold,
+            tuple(
+                (item, -count, maker, temper)
+                for item, count, maker, temper in self.items
+            ),
+        )
+
+
+def apply_change(
+    character_class: type,
+    inventory_class: type,
+    change: Change,
+    session=None,
+    retries: int = 5,
+) -> int:
+    """Applies the change to the character atomically.
+
+    The inventory is read, changed with `Inventory.add_item` and
+    `Inventory.remove_item`, and written back with a compare-and-swap on its
+    old value, so concurrent changes are retried instead of being lost. Only
+    the `inventory.items` and `gold` fields are written.
+
+    Args:
+        character_class (type): Character document class.
+        inventory_class (type): Inventory document class.
+        change (Change): The change.
+        session (:obj:`ClientSession`, optional): Session of the transaction.
+        retries (int): The number of attempts.
+
+    Returns:
+        int: New gold of the character.
+
+    Raises:
+        NotEnoughGold: If the character does not have enough gold.
+        NotEnoughItems: If the character does not have enough items.
+        ItemNotFoundInInventory: If an item to remove is not in the inventory.
+        TransactionFailed: If the character is not found or is changed
+            concurrently too often.
+
+    """
+    collection = character_class._get_collection()
+    for _ in range(retries):
+        doc = collection.find_one(
+            {"_id": change.member_id},
+            {"inventory": True, "gold": True},
+            session=session,
+        )
+        if doc is None:
+            raise TransactionFailed(f"Character {change.member_id} not found")
+        gold = doc.get("gold", 0)
+        if gold + change.gold < 0:
+            raise NotEnoughGold
+        query = {"_id": change.member_id}
+        update = {}
+        if change.items:
+            old_items = doc.get("inventory", {}).get("items")
+            inventory = inventory_class._from_son(doc.get("inventory", {}))
+            for item, count, maker, temper in change.items:
+                if count > 0:
+                    inventory.add_item(item, count, maker, temper)
+                else:
+                    stack = inventory.get_item(item, maker, temper)
+                    if stack.count < -count:
+                        raise NotEnoughItems
+                    inventory.remove_item(item, -count, maker, temper)
+            query["inventory.items"] = old_items
+            update["$set"] = {"inventory.items": inventory.to_mongo()["items"]}
+        if change.gold:
+            if change.gold < 0:
+                query["gold"] = {"$gte": -change.gold}
+            update["$inc"] = {"gold": change.gold}
+        if not update:
+            return gold
+        update["$currentDate"] = {"updated_at": True}
+        doc = collection.find_one_and_update(
+            query,
+            update,
+            projection={"gold": True},
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        if doc is not None:
+            return doc.get("gold", 0)
+    raise TransactionFailed(f"Character {change.member_id} is changed concurrently")
+
+
+def execute(
+    character_class: type, inventory_class: type, changes: List[Change]
+) -> Dict[str, int]:
+    """Applies several changes as one transaction.
+
+    A multi-document transaction is used when the server supports it. On a
+    standalone mongod the changes are applied one by one, and the applied
+    ones are undone with compensating changes if a later one fails, so the
+    changes should be ordered from the most to the least likely to fail.
+
+    Args:
+        character_class (type): Character document class.
+        inventory_class (type): Inventory document class.
+        changes (List[Change]): The changes.
+
+    Returns:
+        Dict[str, int]: New gold by member ID.
+
+    Raises:
+        NotEnoughGold: Same as in `apply_change`.
+        NotEnoughItems: Same as in `apply_change`.
+        ItemNotFoundInInventory: Same as in `apply_change`.
+        TransactionFailed: Same as in `apply_change`.
+
+    """
+
+    def apply_all(session=None) -> Dict[str, int]:
+        return {
+            change.member_id: apply_change(
+                character_class, inventory_class, change, session
+            )
+            for change in changes
+        }
+
+    client = character_class._get_collection().database.client
+    try:
+        with client.start_session() as session:
+            return session.with_transaction(apply_all)
+    except OperationFailure as e:
+        if e.code != ILLEGAL_OPERATION:
+            raise
+
+    result = {}
+    applied = []
+    try:
+        for change in changes:
+            result[change.member_id] = apply_change(
+                character_class, inventory_class, change
+            )
+            applied.append(change)
+    except Exception:
+        for change in reversed(applied):
+            try:
+                apply_change(character_class, inventory_class, change.inverse())
+            except Exception:
+                log.exception(f"Failed to undo {change}, it stays applied")
+        raise
+    return result
+
+
+def get_path(doc: dict, path: str):
+    """Returns the value at a dotted path, or `_MISSING`."""
+    for key in path.split("."):
+        if not isinstance(doc, dict) or key not in doc:
+            return _MISSING
+        doc = doc[key]
+    return doc
+
+
+def update_character(
+    character_class: type,
+    member_id: str,
+    fields: Tuple[str, ...],
+    func: Callable[[Any], Any],
+    retries: int = 5,
+) -> Any:
+    """Changes the character with a compare-and-swap on the changed fields.
+
+    The character is read and changed in memory by `func`. Only the given
+    dotted paths are written back, and only if they still hold the values
+    that were read, like `apply_change` does for the inventory. Otherwise the
+    character is read and changed again, so concurrent changes are never
+    overwritten.
+
+    Args:
+        character_class (type): Character document class.
+        member_id (str): Member ID.
+        fields (Tuple[str, ...]): Dotted paths `func` may change.
+        func (Callable[[Any], Any]): Changes the character. Exceptions are
+            propagated and nothing is written.
+        retries (int): The number of attempts.
+
+    Returns:
+        Any: The result of `func`.
+
+    Raises:
+        TransactionFailed: If the character is not found or is changed
+            concurrently too often.
+
+    """
+    collection = character_class._get_collection()
+    for _ in range(retries):
+        doc = collection.find_one({"_id": member_id})
+        if doc is None:
+            raise TransactionFailed(f"Character {member_id} not found")
+        query = {"_id": member_id}
+        for path in fields:
+            value = get_path(doc, path)
+            query[path] = {"$exists": False} if value is _MISSING else deepcopy(value)
+        char = character_class._from_son(doc)
+        result = func(char)
+        son = char.to_mongo()
+        update = {"$currentDate": {"updated_at": True}}
+        for path in fields:
+            value = get_path(son, path)
+            if value is _MISSING:
+                update.setdefault("$unset", {})[path] = True
+            else:
+                update.setdefault("$set", {})[path] = value
+        if collection.update_one(query, update).matched_count:
+            return result
+    raise TransactionFailed(f"Character {member_id} is changed concurrently")
+
+
+class NotEnoughGold(Exception):
+    """Raises if the character does not have enough gold."""
+
+    pass
+
+
+class NotEnoughItems(Exception):
+    """Raises if the character does not have enough items."""
+
+    pass
+
+
+class TransactionFailed(Exception):
+    """Raises if the change can not be applied."""
+
+    pass